@@ -1,44 +1,224 @@
+import os
+import shutil
+
 import pandas as pd
 import geopandas as gpd
+import numpy as np
 import re
+import time
 import pickle
 from shapely.geometry import Point
 
-from gm_rendezes import jsonl_load
+from gm_rendezes import jsonl_load, jsonl_load_chunks
+from norm_cache import verzio
+
+
 
+# közterület rövidítések -> teljes név (a sorrend számít, lásd _utca_egy)
+KOZTER_MAP = {
+    r"\bu\.?\b": "utca",
+    r"\bkrt\.?\b": "körút",
+    r"\bstny\.?\b": "sétány",
+    r"\brkp\.?\b": "rakpart",
+    r"\bfs\.?\b": "fasor",
+    r"\bsgt\.?\b": "sugárút",
+    r"\bltp\.?\b": "lakótelep",
+    r"\budv\.?\b": "udvar",
+    r"\bhrsz\b": "helyrajzi szám",
+    r"\bst\.?\b": "utca",
+    r"\brd\.?\b": "út",
+    r"\bave\.?\b": "sugárút",
+    r"\bblvd\.?\b": "körút",
+}
 
+# a teljes tábla egyetlen alternációba fordítva, a találat csoportneve adja a cserét
+_KOZTER_RE = re.compile("|".join(f"(?P<k{i}>{p})" for i, p in enumerate(KOZTER_MAP)), flags=re.IGNORECASE)
+_KOZTER_CSERE = {f"k{i}": repl for i, repl in enumerate(KOZTER_MAP.values())}
+_KOZTER_LEPESEK = [(re.compile(p, flags=re.IGNORECASE), repl) for p, repl in KOZTER_MAP.items()]
 
-def utca_normalizalas(s):
+_SZOKOZ_RE = re.compile(r"\s+")
+
+
+def _egyedi_map(s, fn, cache=None, ver=None):
     '''
-    Az közterület rövidítéseket eltüneti
+    fn-t csak a Series egyedi (string) értékein futtatja le és visszamappolja
+    (az utca nevek és házszámok rengetegszer ismétlődnek). Nem string értékből NaN lesz, mint a .str műveleteknél.
+
+    cache (NormCache) megadásával a korábbi futásokban már normalizált értékeket nem számolja újra
+    (ver: a normalizáló szabály verziója, ha változik a cache érvénytelen)
     '''
 
-    kozter_map = {
-        r"\bu\.?\b": "utca",
-        r"\bkrt\.?\b": "körút",
-        r"\bstny\.?\b": "sétány",
-        r"\brkp\.?\b": "rakpart",
-        r"\bfs\.?\b": "fasor",
-        r"\bsgt\.?\b": "sugárút",
-        r"\bltp\.?\b": "lakótelep",
-        r"\budv\.?\b": "udvar",
-        r"\bhrsz\b": "helyrajzi szám",
-        r"\bst\.?\b": "utca",
-        r"\brd\.?\b": "út",
-        r"\bave\.?\b": "sugárút",
-        r"\bblvd\.?\b": "körút",
-    }
+    if cache is not None:
+        return cache.alkalmaz(s, lambda u: u.map(fn), fn.__name__, ver)
 
-    for pattern, repl in kozter_map.items():
-        s = s.str.replace(pattern, repl, regex=True, flags=re.IGNORECASE)
+    kodok, egyedi = pd.factorize(s)
+    eredmeny = [fn(x) if isinstance(x, str) else None for x in egyedi]
 
-    s = s.str.replace(r"\s+", " ", regex=True).str.strip().str.rstrip(".")
+    tabla = np.empty(len(eredmeny) + 1, dtype=object)
+    tabla[:-1] = eredmeny
+    tabla[-1] = None  # a -1 kód (NaN) ide mutat
 
-    return s
+    out = pd.Series(tabla[kodok], index=s.index, name=s.name, dtype=object)
+    return out if s.dtype == object else out.astype(s.dtype)
 
 
+def _utca_egy(x):
+    '''
+    Egy utcanév normalizálása egyetlen regex menetben.
 
-def cim_standardizalas(df):
+    A sorban egymás utáni cserékkel csak akkor térne el, ha egy ponttal végződő rövidítés után
+    közvetlenül egy másik jön (pl. "u.st"), mert a korábbi csere után ott már nincs szóhatár.
+    Ilyenkor a régi, lépésenkénti cserét futtatjuk.
+    '''
+
+    allapot = {"veg": -1, "pont": False, "utkozes": False}
+
+    def csere(m):
+        if m.start() == allapot["veg"] and allapot["pont"]:
+            allapot["utkozes"] = True
+        allapot["veg"] = m.end()
+        allapot["pont"] = m.group().endswith(".")
+        return _KOZTER_CSERE[m.lastgroup]
+
+    y = _KOZTER_RE.sub(csere, x)
+
+    if allapot["utkozes"]:
+        y = x
+        for minta, repl in _KOZTER_LEPESEK:
+            y = minta.sub(repl, y)
+
+    return _SZOKOZ_RE.sub(" ", y).strip().rstrip(".")
+
+
+def utca_normalizalas(s, cache=None):
+    '''
+    Az közterület rövidítéseket eltüneti (minden egyedi értéket csak egyszer dolgoz fel)
+    '''
+
+    return _egyedi_map(s, _utca_egy, cache, _UTCA_VERZIO)
+
+
+
+_EPULET_RE = re.compile(r"\s*(épület|epulet|l[eé]pcs[őo]h[áa]z|lph\.?|lh\.?|emelet|ajt[óo]|szint|building)\b.*$",
+                        flags=re.IGNORECASE)
+_KOTOJEL_RE = re.compile(r"(?<!\d)-|-(?!\d)")
+_SZAM_BETU_RE = re.compile(r"(\d)([A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű])")
+
+
+def _cim_egy(x):
+    '''
+    Egy házszám standardizálása (a cim_standardizalas 3. lépése)
+    '''
+
+    x = x.strip()
+
+    # 3.1 "épület" és hasonló részek levágása (a kulcsszótól a sor végéig)
+    x = _EPULET_RE.sub("", x)
+
+    # 3.2 / -> szóköz
+    x = x.replace("/", " ")
+
+    # 3.3 - csak számok között maradhat; minden más kötőjel -> szóköz (112-114 marad, 31-B -> 31 B)
+    x = _KOTOJEL_RE.sub(" ", x)
+
+    # 3.4 szám utáni betű közé szóköz (10a -> 10 a)
+    x = _SZAM_BETU_RE.sub(r"\1 \2", x)
+
+    # extra: több szóköz összehúzás, szélek vágása
+    x = _SZOKOZ_RE.sub(" ", x).strip()
+
+    # 3.5 betűk nagybetűsek
+    return x.upper()
+
+
+
+# a normalizálók szabály verziói a NormCache-hez (ha a kód vagy a tábla változik, változik a verzió is)
+_UTCA_VERZIO = verzio(_utca_egy, KOZTER_MAP, _SZOKOZ_RE)
+_CIM_VERZIO = verzio(_cim_egy, _EPULET_RE, _KOTOJEL_RE, _SZAM_BETU_RE, _SZOKOZ_RE)
+
+
+
+def _int_csere(m):
+    # felesleges nullák eltüntetése a számok elől (007 -> 7)
+    return str(int(m.group(0)))
+
+
+# az adatbázis utcacim oszlopának tisztító szabályai, sorrendben: (név, regex, csere, strip utána)
+UTCACIM_SZABALYOK = [
+    # 1. kapcsos zárójelek és egyenlőségjelek el tüntése szóközzel
+    ("zarojel_egyenloseg", re.compile(r"[{}=]"), " ", False),
+    ("kacsacsor", re.compile(r"[<>]"), " ", False),
+    # 2. building és hasonló szavak eltüntetése
+    ("epulet_szavak", re.compile(r"\b(building|bldg\.?|block|blokk|épület|epulet)\b", flags=re.IGNORECASE), " ", False),
+    # 3. feleleslegesen sokszorozott szóközök törlése
+    ("szokozok", _SZOKOZ_RE, " ", True),
+    # 4. felesleges nullák eltüntetése a számok elől
+    ("nullak", re.compile(r"\d+"), _int_csere, False),
+    # szóköz rendbetétel, ha a nullázás után bármi hiba van
+    ("szokozok_2", _SZOKOZ_RE, " ", True),
+    # 1/B A -> 1/B, 1/B B -> 1/B
+    ("per_betu_betu", re.compile(r"(\b\d+/\w)\s+[A-Z]\b"), r"\1", False),
+    # 10 A B -> 10 A
+    ("szam_betu_betu", re.compile(r"(\b\d+\s+[A-Z])\s+[A-Z]\b"), r"\1", False),
+    # 2-4D D -> 2-4D
+    ("tartomany_betu_betu", re.compile(r"(\b\d+-\d+[A-Z])\s+[A-Z]\b"), r"\1", False),
+]
+
+
+def szabalyok_alkalmazasa(s, szabalyok, cache=None, nev="szabalyok"):
+    '''
+    A szabályokat sorban, csak a Series egyedi értékein futtatja (szabályonként egy menet az egyedi értékeken).
+
+    Visszaadja a tisztított Series-t és egy statisztika DF-et: szabályonként hány egyedi érték / hány sor
+    változott (melyik szabály "tüzel" egyáltalán) és mennyi ideig futott.
+    cache (NormCache) megadásával a korábban már tisztított értékekre nem futnak le a szabályok
+    (a statisztika ilyenkor csak az újonnan számolt értékekre vonatkozik).
+    '''
+
+    stat = {sz[0]: {"szabaly": sz[0], "egyedi_talalat": 0, "sor_talalat": 0, "ido": 0.0} for sz in szabalyok}
+    darab = s.value_counts(dropna=True)
+
+    def futtat(u):
+        vals = u.tolist()
+        sulyok = darab.reindex(u.to_numpy()).fillna(0).to_numpy()
+
+        for szabaly_nev, minta, csere, strip in szabalyok:
+            t0 = time.perf_counter()
+            valtozott = np.zeros(len(vals), dtype=bool)
+            for i, x in enumerate(vals):
+                y = minta.sub(csere, x)
+                if strip:
+                    y = y.strip()
+                if y != x:
+                    valtozott[i] = True
+                    vals[i] = y
+
+            st = stat[szabaly_nev]
+            st["ido"] += time.perf_counter() - t0
+            st["egyedi_talalat"] += int(valtozott.sum())
+            st["sor_talalat"] += int(sulyok[valtozott].sum())
+
+        return pd.Series(vals, index=u.index, dtype=object)
+
+    if cache is not None:
+        out = cache.alkalmaz(s, futtat, nev, verzio(szabalyok, szabalyok_alkalmazasa))
+    else:
+        kodok, egyedi = pd.factorize(s)
+        egyedi = pd.Series(egyedi, dtype=object)
+        str_mask = egyedi.map(lambda x: isinstance(x, str)).to_numpy(dtype=bool)
+
+        tabla = np.empty(len(egyedi) + 1, dtype=object)
+        tabla[:] = None
+        tabla[:-1][str_mask] = futtat(egyedi[str_mask]).to_numpy()
+
+        out = pd.Series(tabla[kodok], index=s.index, name=s.name, dtype=object)
+        out = out if s.dtype == object else out.astype(s.dtype)
+
+    return out, pd.DataFrame(list(stat.values()))
+
+
+
+def cim_standardizalas(df, cache=None):
     '''
     1. Ahol a cim tartalmazza a 'hrsz' részt ott az utca oszlop kapja meg a cim oszlop értékét és a cim legyen None
     2. Ahol az utca oszlop None (üres) ott a kapja meg a cim oszlop értékét és a cim legyen None
@@ -63,31 +243,9 @@ def cim_standardizalas(df):
     df.loc[m_move, "utca"] = df.loc[m_move, "cim"]
     df.loc[m_move, "cim"] = pd.NA
 
-    # 3) cim standardizálás (csak ahol van cim)
+    # 3) cim standardizálás (csak ahol van cim), egyedi értékenként
     m = df["cim"].notna() & df["cim"].str.strip().ne("")
-    s = df.loc[m, "cim"].str.strip()
-
-    # 3.1 "épület" és hasonló részek levágása (a kulcsszótól a sor végéig)
-    s = s.str.replace(
-        r"\s*(épület|epulet|l[eé]pcs[őo]h[áa]z|lph\.?|lh\.?|emelet|ajt[óo]|szint|building)\b.*$", "", regex=True,
-        flags=re.IGNORECASE)
-
-    # 3.2 / -> szóköz
-    s = s.str.replace("/", " ", regex=False)
-
-    # 3.3 - csak számok között maradhat; minden más kötőjel -> szóköz (112-114 marad, 31-B -> 31 B)
-    s = s.str.replace(r"(?<!\d)-|-(?!\d)", " ", regex=True)
-
-    # 3.4 szám utáni betű közé szóköz (10a -> 10 a)
-    s = s.str.replace(r"(\d)([A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű])", r"\1 \2", regex=True)
-
-    # extra: több szóköz összehúzás, szélek vágása
-    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
-
-    # 3.5 betűk nagybetűsek
-    s = s.str.upper()
-
-    df.loc[m, "cim"] = s
+    df.loc[m, "cim"] = _egyedi_map(df.loc[m, "cim"], _cim_egy, cache, _CIM_VERZIO)
 
     return df
 
@@ -95,11 +253,10 @@ def cim_standardizalas(df):
 
 
 
-def gm_feldolgozas(jsonl_path):
-
-    # 1. google maps lekérdezések beolvasása
-    df = jsonl_load(jsonl_path)
-
+def _gm_standardizalas(df, cache=None):
+    '''
+    A jsonl_load kimenetén a 2-4. lépés (soronként független, ezért chunkokon is futtatható)
+    '''
 
     # 2. címek alapján utca név és házszám szétválasztása
 
@@ -118,39 +275,171 @@ def gm_feldolgozas(jsonl_path):
 
 
     # 3. közterület nevek egységesítése
-    df["utca"] = utca_normalizalas(df["utca"])
+    df["utca"] = utca_normalizalas(df["utca"], cache)
 
 
     # 4. házszámok egységesítése
-    df = cim_standardizalas(df)
+    df = cim_standardizalas(df, cache)
 
-    print('Google maps lekérdezés adatok standardizálva')
+    return df
 
 
-    # 5. geoDataFrame létrehozása a kordinátákkal
+def _to_gdf(df):
+    # geoDataFrame létrehozása a kordinátákkal
     gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["lon"], df["lat"]), crs="EPSG:4326")
     gdf = gdf.drop(columns=["lat", "lon"])
+    return gdf
+
+
+def gm_feldolgozas_chunks(jsonl_path, chunk_size=100_000, cache=None):
+    '''
+    A gm_feldolgozas chunkolt változata: a jsonl_load_chunks darabjait egyenként standardizálja
+    és GeoDataFrame darabokat ad vissza (generátor)
+    '''
+
+    for df in jsonl_load_chunks(jsonl_path, chunk_size):
+        yield _to_gdf(_gm_standardizalas(df, cache))
+
+
+def gm_feldolgozas(jsonl_path, chunk_size=None, cache=None):
+    '''
+    chunk_size megadásával a jsonl-t darabokban olvassa és dolgozza fel (kisebb memória csúcs)
+    '''
+
+    if chunk_size:
+        gdfs = list(gm_feldolgozas_chunks(jsonl_path, chunk_size, cache))
+        gdf = gpd.GeoDataFrame(pd.concat(gdfs), geometry="geometry", crs="EPSG:4326")
+
+        print('Google maps lekérdezés adatok standardizálva')
+        return gdf
+
+    # 1. google maps lekérdezések beolvasása
+    df = jsonl_load(jsonl_path)
+
+    # 2-4. utca/házszám szétválasztás és egységesítés
+    df = _gm_standardizalas(df, cache)
+
+    print('Google maps lekérdezés adatok standardizálva')
+
+
+    # 5. geoDataFrame létrehozása a kordinátákkal
+    gdf = _to_gdf(df)
 
     # exportálás
-    #gdf.to_file('../../adatok/working/orszagos_valid_kordinatak.gpkg', layer='network_polygons', driver='GPKG')
+    #gdf.to_parquet('../../adatok/working/orszagos_valid_kordinatak.parquet', write_covering_bbox=True, schema_version='1.1.0')
 
     return gdf
 
 
 
-def db_feldolgozas(csv_path):
+# a címjegyzék CSV oszlopai és típusai
+DB_DTYPES = {'szavazokorid': int, 'kozteruletid': 'Int64', 'kozteruletnevid': int, 'kozteruletnev': str,
+             'utcacim': str, 'telepulesid': 'Int64', 'telepulesnev': str, 'eventfromid': int, 'date': str}
+
+# választások ahol van / nincs cím az adatbázisban
+VAN_CIM = ['2014-04-06', '2022-04-03']
+NINCS_CIM = ['2006-04-09', '2010-04-11', '2018-04-08']
+
+
+def cimjegyzek_parquetba(csv_path, out_dir, chunksize=1_000_000, felulir=False):
+    '''
+    A címjegyzék CSV-t egyszer átalakítja date szerint particionált parquet adathalmazzá,
+    hogy a db_feldolgozas ne parse-olja újra a CSV-t minden futáskor.
+
+    A telepulesid sima oszlop marad: település szerinti partíciókkal választásonként több ezer apró fájl lenne,
+    aminek a megnyitása lassabb mint maga a CSV parse (meresek.cimjegyzek_parquet_benchmark).
+
+    A _sor oszlopban megmarad az eredeti CSV sor száma (ebből áll vissza a CSV szerinti sorrend és index).
+
+    Használat:
+    cimjegyzek_parquetba('../../adatok/fix/2006_tol_cimek.csv', '../../adatok/fix/cimek_parquet')
+    df = db_feldolgozas('../../adatok/fix/cimek_parquet')
+    '''
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        if not felulir:
+            raise FileExistsError(f"A {out_dir} mappa nem üres (felulir=True-val törlöm és újraírom)")
+        shutil.rmtree(out_dir)
+
+    sor = 0
+    for i, chunk in enumerate(pd.read_csv(csv_path, dtype=DB_DTYPES, usecols=list(DB_DTYPES), chunksize=chunksize)):
+        chunk['_sor'] = np.arange(sor, sor + len(chunk), dtype=np.int64)
+        sor += len(chunk)
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        pq.write_to_dataset(table, out_dir, partition_cols=['date'],
+                            basename_template=f'resz-{i}-{{i}}.parquet', existing_data_behavior='overwrite_or_ignore')
+
+    print(sor, 'sor parquetba írva:', out_dir)
+
+    return out_dir
+
+
+def cimjegyzek_olvasas(path, datumok=None, columns=None):
+    '''
+    A cimjegyzek_parquetba-val készült adathalmaz olvasása: csak a megadott választások partícióit
+    és csak a kért oszlopokat olvassa be. A telepulesnev és kozteruletnev categorical lesz.
+    A sorrend és az index ugyanaz mint a CSV beolvasásnál.
+
+    columns: a beolvasandó oszlopok (None: mind a DB_DTYPES oszlopai), pl. csak a szavazókör és a település:
+    df = cimjegyzek_olvasas('../../adatok/fix/cimek_parquet', VAN_CIM, columns=['szavazokorid', 'telepulesnev'])
+    '''
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    columns = list(DB_DTYPES) if columns is None else list(columns)
+    ismeretlen = [c for c in columns if c not in DB_DTYPES]
+    if ismeretlen:
+        raise ValueError(f"Ismeretlen oszlop(ok): {ismeretlen}")
+
+    particio = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+    dataset = ds.dataset(path, format='parquet', partitioning=particio)
+
+    # a _sor a sorrendhez mindig kell (a szűrő a partíciókon megy, ahhoz nem kell beolvasni a date-et)
+    szuro = ds.field('date').isin(datumok) if datumok is not None else None
+    table = dataset.to_table(columns=columns + ['_sor'], filter=szuro)
+
+    # ismétlődő szöveges oszlopok dictionary (categorical) kódolással
+    for col in ['telepulesnev', 'kozteruletnev']:
+        if col in columns:
+            table = table.set_column(table.schema.get_field_index(col), col, pc.dictionary_encode(table[col]))
+
+    df = table.to_pandas()
+    df = df.sort_values('_sor', kind='stable').set_index('_sor')
+    df.index.name = None
+
+    df = df.astype({c: 'Int64' for c in ['kozteruletid', 'telepulesid'] if c in columns})
+
+    return df
+
+
+def db_feldolgozas(csv_path, cache=None, map_path='../../adatok/fix/varosnevek_hu_map.pkl'):
     '''
     Felglgozza az adatbázisból lementett címjegyzéket és visszad egy standardizált df-et
 
     Használat:
     df = db_feldolgozas('../../adatok/fix/2006_tol_cimek.csv')
-    '''
 
-    df = pd.read_csv(csv_path,
-                     dtype={'szavazokorid': int, 'kozteruletid': 'Int64', 'kozteruletnevid': int, 'kozteruletnev': str,
-                            'utcacim': str, 'telepulesid': 'Int64', 'telepulesnev': str, 'eventfromid': int, 'date': str})
+    Ha a csv_path egy cimjegyzek_parquetba-val készült mappa, akkor csak a szükséges választásokat
+    és oszlopokat olvassa be (a CSV újraparse-olása nélkül):
+    df = db_feldolgozas('../../adatok/fix/cimek_parquet')
+
+    cache (NormCache) megadásával a normalizálások eredményét a futások között megőrzi:
+    df = db_feldolgozas('../../adatok/fix/2006_tol_cimek.csv', cache=NormCache('../../adatok/working/norm_cache.sqlite'))
+    '''
 
-    print('CSV beolvasva')
+    if os.path.isdir(csv_path):
+        # a date szűrés már olvasáskor megtörténik (csak a van_cim partíciók); a feldolgozás minden oszlopot használ
+        df = cimjegyzek_olvasas(csv_path, VAN_CIM, columns=list(DB_DTYPES))
+        print('Parquet beolvasva')
+    else:
+        df = pd.read_csv(csv_path, dtype=DB_DTYPES)
+        print('CSV beolvasva')
 
     # a None id értékű sorokat törlöm
     df = df.dropna(subset=['telepulesid', 'kozteruletid'])
@@ -159,11 +448,8 @@ def db_feldolgozas(csv_path):
     df = df.drop_duplicates(
         subset=['szavazokorid', 'kozteruletid', 'kozteruletnevid', 'kozteruletnev', 'utcacim', 'telepulesid', 'date'])
 
-    van_cim = ['2014-04-06', '2022-04-03']
-    nincs_cim = ['2006-04-09', '2010-04-11', '2018-04-08']
-
     # most csak azokkal az adatokkal dolgozok ahol van cím, szűröm az adatbázist
-    df = df[df['date'].isin(van_cim)]
+    df = df[df['date'].isin(VAN_CIM)]
 
     # azokat a sorokat ahol az utcacim 0 törlöm
     df = df[df['utcacim'] != '0']
@@ -178,54 +464,41 @@ def db_feldolgozas(csv_path):
     '''
 
     # beolvasom a lementett map szótárat
-    with open('../../adatok/fix/varosnevek_hu_map.pkl', 'rb') as f:
+    with open(map_path, 'rb') as f:
         m = pickle.load(f)
 
-    # mappolom a várhoz
-    df['telepulesnev_hu'] = df['telepulesnev'].map(m)
+    if isinstance(df['telepulesnev'].dtype, pd.CategoricalDtype):
+        # categorical esetén csak a kategóriákat mappolom
+        kat = df['telepulesnev'].cat.categories.to_series()
+        df['telepulesnev_hu'] = df['telepulesnev'].map(kat.map(m).fillna(kat))
+    else:
+        # mappolom a várhoz
+        df['telepulesnev_hu'] = df['telepulesnev'].map(m)
 
-    # ahol a telepulesnev_hu None oda vissza kerül a telepulesnev
-    df["telepulesnev_hu"] = df["telepulesnev_hu"].fillna(df["telepulesnev"])
+        # ahol a telepulesnev_hu None oda vissza kerül a telepulesnev
+        df["telepulesnev_hu"] = df["telepulesnev_hu"].fillna(df["telepulesnev"])
 
     print('városnév mappolás megtörtént')
 
 
     # rendberakom az utcacím oszlop értékeket (előkészítem a közös normalizáláshoz)
 
-    # 1. kapcsos zárójelek és egyenlőségjelek el tüntése szóközzel
-    df['utcacim'] = df['utcacim'].str.replace(r'[{}=]', ' ', regex=True)
-    df['utcacim'] = df['utcacim'].str.replace(r'[<>]', ' ', regex=True)
-
-    # 2. building és hasonló szavak eltüntetése
-    df['utcacim'] = df['utcacim'].str.replace(
-        r'\b(building|bldg\.?|block|blokk|épület|epulet)\b', ' ', regex=True, flags=re.IGNORECASE)
-
-    # 3. feleleslegesen sokszorozott szóközök törlése
-    df['utcacim'] = df['utcacim'].str.replace(r'\s+', ' ', regex=True).str.strip()
-
-    # 4. felesleges nullák eltüntetése a számok elől
-    df['utcacim'] = df['utcacim'].str.replace(r'\d+', lambda m: str(int(m.group(0))), regex=True)
-
-    # szóköz rendbetétel, ha a nullázás után bármi hiba van
-    df['utcacim'] = df['utcacim'].str.replace(r'\s+', ' ', regex=True).str.strip()
-
-    # 1/B A  -> 1/B
-    # 1/B B  -> 1/B
-    df['utcacim'] = df['utcacim'].str.replace(r'(\b\d+/\w)\s+[A-Z]\b', r'\1', regex=True)
+    # az adathibák javítása az UTCACIM_SZABALYOK szerint (zárójelek, building szavak, szóközök, nullák, betű duplázások)
+    df['utcacim'], szabaly_stat = szabalyok_alkalmazasa(df['utcacim'], UTCACIM_SZABALYOK, cache, 'utcacim_szabalyok')
 
-    # 10 A B -> 10 A
-    df['utcacim'] = df['utcacim'].str.replace(r'(\b\d+\s+[A-Z])\s+[A-Z]\b', r'\1', regex=True)
-
-    # 2-4D D -> 2-4D
-    df['utcacim'] = df['utcacim'].str.replace(r'(\b\d+-\d+[A-Z])\s+[A-Z]\b', r'\1', regex=True)
+    print('utcacim szabályok lefutottak:')
+    print(szabaly_stat.to_string(index=False))
 
     # most hogy eltüntetk az adathibák rárakom az univerzális standardizáló függvényt
     # ehhez át kell nevetni az oszlopokat -> utca es cim nevű oszlopk kellenek
     df = df.rename(columns={'kozteruletnev':'utca', 'utcacim':'cim'})
-    df = cim_standardizalas(df)
+    if isinstance(df['utca'].dtype, pd.CategoricalDtype):
+        # a cim_standardizalas új értékeket ír az utca oszlopba
+        df['utca'] = df['utca'].astype(object)
+    df = cim_standardizalas(df, cache)
 
     # standardizálom az utca neveket
-    df["utca"] = utca_normalizalas(df["utca"])
+    df["utca"] = utca_normalizalas(df["utca"], cache)
 
     # oszlop sorrendek
     df = df[['szavazokorid', 'kozteruletid', 'kozteruletnevid', 'utca', 'cim', 'telepulesid', 'telepulesnev',
@@ -0,0 +1,208 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+import geopandas as gpd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from shapely.geometry import box
+from shapely.ops import unary_union, polygonize
+
+from polygon_fuggvenyek import kapcsolas, kicsik_beolvasztasa
+
+
+'''
+Foltonkénti kapcsolas és csempézett (tiled) egyesites nagy hálózatokra (pl. Budapest), hogy ne egyetlen óriási
+unary_union / polygonize fusson egy szálon, a teljes város vonalhálójával a memóriában.
+
+- kapcsolas_foltonkent: a lakott terület egymástól független foltcsoportjain (a kapcsolas toleranciáinál
+  távolabbi foltok nem hatnak egymásra) külön-külön fut a kapcsolas, worker folyamatokban.
+- egyesites_csempezve: a vonalhálót rácsra vágja, csempénként (worker folyamatban) csomópontosít és
+  polygonize-ol, a csempehatáron átnyúló poligonok darabjait determinisztikusan összevarrja, utána jön a
+  kicsi poligonok beolvasztása (kicsik_beolvasztasa).
+
+A polygonize memóriacsúcsa a csempe méretével skálázódik, a kapcsolas-é a legnagyobb foltcsoportéval, nem a városéval.
+
+Használat:
+network_gs_proj = kapcsolas_foltonkent(edges, orange, blue, res_area)
+polygons_merged_gdf = egyesites_csempezve(network_gs_proj, MIN_AREA=5000, TILE_SIZE=3000)
+'''
+
+
+
+def _futtat(fn, feladatok, max_workers=None):
+    # feladatok párhuzamosan, a bemenet sorrendjében (max_workers=1: ugyanebben a folyamatban)
+    if max_workers == 1 or len(feladatok) <= 1:
+        return [fn(*f) for f in feladatok]
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(fn, *zip(*feladatok)))
+
+
+def csempe_racs(bounds, TILE_SIZE):
+    '''
+    TILE_SIZE méretű négyzetrács (sorfolytonosan) a bounds téglalap lefedésére
+    '''
+
+    minx, miny, maxx, maxy = bounds
+    nx_ = max(1, int(np.ceil((maxx - minx) / TILE_SIZE)))
+    ny_ = max(1, int(np.ceil((maxy - miny) / TILE_SIZE)))
+
+    return [box(minx + i * TILE_SIZE, miny + j * TILE_SIZE,
+                min(maxx, minx + (i + 1) * TILE_SIZE), min(maxy, miny + (j + 1) * TILE_SIZE))
+            for j in range(ny_) for i in range(nx_)]
+
+
+def foltcsoportok(res_area, tol):
+    '''
+    A lakott terület foltjai csoportosítva: egy csoportba kerülnek a tol távolságon belüli foltok
+    (láncolva). Visszaad: csoportonként a foltok uniója, az első folt sorrendjében.
+    '''
+
+    foltok = shapely.get_parts(res_area)
+    foltok = foltok[~shapely.is_empty(foltok)]
+
+    i, j = shapely.STRtree(foltok).query(foltok, predicate="dwithin", distance=tol)
+    n = len(foltok)
+    _, cimke = connected_components(coo_matrix((np.ones(len(i)), (i, j)), shape=(n, n)), directed=False)
+
+    # címkék újraszámozása az első folt sorrendjében
+    _, elso, cimke = np.unique(cimke, return_index=True, return_inverse=True)
+    sorrend = np.argsort(np.argsort(elso))
+    cimke = sorrend[cimke]
+
+    return [unary_union(foltok[cimke == c]) for c in range(len(elso))]
+
+
+
+def _kapcsolas_egyseg(vonalak, orange, blue, terulet, crs, param):
+    # worker: kapcsolas egy foltcsoportra
+    return kapcsolas(gpd.GeoSeries(vonalak, crs=crs), gpd.GeoSeries(orange, crs=crs), gpd.GeoSeries(blue, crs=crs),
+                     terulet, **param).values
+
+
+def kapcsolas_foltonkent(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_TOL=12.0, DEDUP_EPS=1.0,
+                         VEGPONT_SNAP=1e-6, max_workers=None):
+    '''
+    Ugyanaz, mint a kapcsolas, a lakott terület független foltcsoportjain külön-külön, párhuzamosan.
+
+    Az eredmény (a vonalak sorrendjétől eltekintve) megegyezik a kapcsolas(..., VEGPONT_SNAP=1e-6)-éval, mert a
+    snap / strip / connector lépések csak toleranciányi távolságra hatnak, a csoportok pedig ennél messzebb vannak
+    egymástól. A VEGPONT_SNAP itt alapból be van kapcsolva: nélküle a GEOS noder választása (és így a topológia)
+    a csoport tartalmától függene.
+    Rácsra vágni itt nem lehet: a snap és az átfedések lebegőpontos eredménye a csempe tartalmától függ,
+    a csempehatár két oldalán 1e-7 m-es eltérések (szilánk poligonok) maradnak.
+
+    max_workers=1: minden csoport ugyanabban a folyamatban fut
+    '''
+
+    param = dict(SNAP_TOL=SNAP_TOL, STRIP_TOL=STRIP_TOL, JOIN_TOL=JOIN_TOL, DEDUP_EPS=DEDUP_EPS,
+                 VEGPONT_SNAP=VEGPONT_SNAP)
+
+    retegek = [np.asarray([g for g in s.geometry if g is not None and not g.is_empty], dtype=object)
+               if s is not None and len(s) else np.empty(0, dtype=object) for s in (edges, orange, blue)]
+    fak = [shapely.STRtree(r) for r in retegek]
+
+    feladatok = []
+    for csoport in foltcsoportok(res_area, max(SNAP_TOL, STRIP_TOL, JOIN_TOL, DEDUP_EPS)):
+        # csak a csoportot érintő vonalak kerülnek át a workerbe
+        reszek = [r[np.sort(fa.query(csoport, predicate="intersects"))] for r, fa in zip(retegek, fak)]
+        feladatok.append((*reszek, csoport, edges.crs, param))
+
+    eredmenyek = _futtat(_kapcsolas_egyseg, feladatok, max_workers)
+
+    return gpd.GeoSeries(np.concatenate(eredmenyek), crs=edges.crs)
+
+
+
+def _csempe_poligonok(vonalak, keret):
+    # worker: a csempére vágott vonalháló + csempe kerete csomópontosítva, polygonize
+    # + a keret vágásból származó része (ahol nem fut rajta valódi vonal): csak ezen át szabad összevarrni
+    vagott = shapely.intersection(vonalak, keret)
+    vagott = vagott[~shapely.is_empty(vagott)]
+    linework = unary_union(list(vagott) + [keret.boundary])
+    vago = shapely.difference(keret.boundary, unary_union(vagott)) if len(vagott) else keret.boundary
+    return np.asarray(list(polygonize(linework)), dtype=object), vago
+
+
+def _osszevarras(darabok, csempe_id, vago, kulso):
+    '''
+    Csempehatáron átnyúló poligon darabok összevarrása: két darab egy poligonhoz tartozik, ha különböző
+    csempében vannak és pozitív hosszon közös a határuk a csempe vágás-vonalán (vago: a csempe keretének az a
+    része, amin nem fut valódi vonal). A pontosan csempehatáron futó utca két oldalán lévő darabok így külön
+    poligonok maradnak. A külső kerethez érő összefüggő csoport a hálón kívüli terület, kimarad.
+
+    Visszaad: poligonok, az első darabjuk sorrendjében (csempe sorrend, azon belül polygonize sorrend)
+    '''
+
+    n = len(darabok)
+    hatar = shapely.boundary(darabok)
+
+    # a csempe vágás-vonalához érő darabok
+    vago = np.asarray(vago, dtype=object)
+    szelso = shapely.length(shapely.intersection(hatar, vago[csempe_id])) > 0
+    sz = np.flatnonzero(szelso)
+
+    i, j = shapely.STRtree(darabok[sz]).query(darabok[sz], predicate="intersects")
+    i, j = sz[i], sz[j]
+    jo = (i < j) & (csempe_id[i] != csempe_id[j])
+    i, j = i[jo], j[jo]
+    kozos = shapely.intersection(hatar[i], hatar[j])
+    jo = shapely.length(shapely.intersection(kozos, vago[csempe_id[i]])) > 0
+    i, j = i[jo], j[jo]
+
+    _, cimke = connected_components(coo_matrix((np.ones(len(i)), (i, j)), shape=(n, n)), directed=False)
+
+    # a külső kerethez érő csoport(ok) kiesnek
+    kint = np.unique(cimke[sz[shapely.length(shapely.intersection(hatar[sz], kulso.boundary)) > 0]])
+    marad = ~np.isin(cimke, kint)
+
+    _, elso, cimke_m = np.unique(cimke[marad], return_index=True, return_inverse=True)
+    idx = np.flatnonzero(marad)
+
+    out = []
+    for c in np.argsort(elso):
+        tag = idx[cimke_m == c]
+        out.append(darabok[tag[0]] if len(tag) == 1 else unary_union(darabok[tag]))
+
+    return out
+
+
+def egyesites_csempezve(network_gs_proj, MIN_AREA=5000, MAX_STEPS=20000, TILE_SIZE=2000, max_workers=None):
+    '''
+    Ugyanaz, mint az egyesites, de a polygonize csempénként (párhuzamosan) fut, a határon átnyúló
+    poligonokat összevarrja. A poligonok halmaza megegyezik az egyesites-ével, a sorrendjük
+    csempe szerinti (egyenlő területek / határhosszak esetén a beolvasztás sorrendje ettől függhet).
+
+    Ellenőrzés: a teljes unió helyett (ami épp a nagy memóriaigényű lépés) a területösszeg változása.
+    '''
+
+    geoms = np.asarray([g for g in network_gs_proj.geometry if g is not None and not g.is_empty], dtype=object)
+    if not len(geoms):
+        raise RuntimeError("polygonize nem adott vissza poligonokat (nincs elég zárt hurok / noding probléma).")
+
+    # a külső keret kicsit nagyobb a hálónál, így valódi poligon nem ér hozzá
+    minx, miny, maxx, maxy = shapely.total_bounds(geoms)
+    kulso = box(minx - 1.0, miny - 1.0, maxx + 1.0, maxy + 1.0)
+    csempek = csempe_racs(kulso.bounds, TILE_SIZE)
+
+    fa = shapely.STRtree(geoms)
+    feladatok = [(geoms[np.sort(fa.query(cs))], cs) for cs in csempek]
+
+    eredmenyek = _futtat(_csempe_poligonok, feladatok, max_workers)
+    csempe_id = np.repeat(np.arange(len(csempek)), [len(e) for e, _ in eredmenyek])
+    darabok = np.concatenate([e for e, _ in eredmenyek])
+
+    polys = _osszevarras(darabok, csempe_id, [v for _, v in eredmenyek], kulso)
+    if not polys:
+        raise RuntimeError("polygonize nem adott vissza poligonokat (nincs elég zárt hurok / noding probléma).")
+
+    # tisztítás (mint az egyesites-ben)
+    polys = shapely.buffer(np.asarray(polys, dtype=object), 0)
+    polys = polys[np.isin(shapely.get_type_id(polys), (3, 6))]  # Polygon, MultiPolygon
+
+    pg = gpd.GeoDataFrame(geometry=kicsik_beolvasztasa(polys, MIN_AREA, MAX_STEPS), crs=network_gs_proj.crs)
+
+    terulet_elteres = abs(float(shapely.area(polys).sum()) - float(pg.area.sum()))
+    print("Ellenőrzés: területösszeg eltérés:", terulet_elteres)
+
+    return pg
@@ -1,28 +1,265 @@
+import re
 import json
 import os
+import time
 import random
+from itertools import compress
+from operator import itemgetter
+
+import numpy as np
 import pandas as pd
 
 
 class JsonlWriter:
-    def __init__(self, path):
+    '''
+    jsonl fájl írása és olvasása
+
+    - alapból minden rekord után megnyitja a fájlt és fsync-el (lassú, de minden sor rögtön lemezen van)
+    - batch_size / flush_interval megadásával nyitva tartja a fájlt és csoportosan commitol:
+      batch_size rekordonként vagy flush_interval másodpercenként flush + fsync
+    - az első íráskor a félbemaradt utolsó sort (program leállás írás közben) levágja; olvasáskor a fájlt
+      nem módosítja (egy másik, még futó író épp félig kiírt sorát sem), a sortörés nélküli utolsó sort kihagyja
+    '''
+
+    def __init__(self, path, batch_size=None, flush_interval=None):
         self.path = path
-        open(self.path, "a", encoding="utf-8").close()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._f = None
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._recovered = False
+
+    @property
+    def buffered(self):
+        return self.batch_size is not None or self.flush_interval is not None
+
+    def _irasra_nyit(self):
+        # csak az író nyúl a fájlhoz: létrehozás + félbemaradt sor javítása az első írás előtt
+        if not self._recovered:
+            open(self.path, "a", encoding="utf-8").close()
+            self._recover()
+            self._recovered = True
+
+    def _recover(self):
+        # ha a fájl nem sortöréssel végződik akkor az utolsó sor írása megszakadt
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # utolsó sortörés megkeresése visszafelé olvasva
+            pos = end
+            start = 0
+            while pos > 0:
+                step = min(1 << 16, pos)
+                pos -= step
+                f.seek(pos)
+                i = f.read(step).rfind(b"\n")
+                if i != -1:
+                    start = pos + i + 1
+                    break
+
+            f.seek(start)
+            tail = f.read()
+            try:
+                json.loads(tail.decode("utf-8"))
+                # a sor egész, csak a sortörés hiányzik
+                f.write(b"\n")
+            except ValueError:
+                print('Félbemaradt utolsó sor levágva:', self.path)
+                f.truncate(start)
 
-    def write(self, record: dict):
-        line = json.dumps(record, ensure_ascii=False)
-        # data lemezre
-        with open(self.path, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
             f.flush()
             os.fsync(f.fileno())
 
+    def write(self, record: dict):
+        self._irasra_nyit()
+        line = json.dumps(record, ensure_ascii=False)
+
+        if not self.buffered:
+            # data lemezre
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            return
+
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+
+        self._f.write(line + "\n")
+        self._pending += 1
+
+        if self.batch_size is not None and self._pending >= self.batch_size:
+            self.commit()
+        elif self.flush_interval is not None and time.monotonic() - self._last_commit >= self.flush_interval:
+            self.commit()
+
+    def commit(self):
+        '''
+        A pufferelt sorok lemezre írása (group commit)
+        '''
+        if self._f is not None and self._pending:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        if self._f is not None:
+            self.commit()
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def read_all(self):
         if not os.path.exists(self.path):
             return []
+        self.commit()
+        with open(self.path, "r", encoding="utf-8") as f:
+            return list(self._rekordok(f))
+
+    @staticmethod
+    def _rekordok(f):
+        # a sortörés nélküli utolsó sor félbemaradt (vagy egy író épp most írja): csak ha egész json, akkor kell
+        for line in f:
+            if not line.strip():
+                continue
+            if not line.endswith("\n"):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    pass
+                return
+            yield json.loads(line)
+
+    def iter_chunks(self, chunk_size=100_000):
+        '''
+        A fájl sorait chunk_size méretű listákban adja vissza (nem tölti be az egész fájlt)
+        '''
+        if not os.path.exists(self.path):
+            return
+        self.commit()
+        chunk = []
         with open(self.path, "r", encoding="utf-8") as f:
-            return [json.loads(line) for line in f if line.strip()]
+            for rekord in self._rekordok(f):
+                chunk.append(rekord)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+
+OSZLOPOK = ['gid', 'cim', 'telepules', 'iszam', 'orszag', 'lat', 'lon']
+
+
+def _tipusok(df):
+    if df.empty:
+        df = pd.DataFrame(columns=OSZLOPOK)
+
+    # kiszűröm azokat a sorkat ahol az irányítószám nem alakítható int-é mert hibás adat van benne
+    # (kevés különböző irányítószám van: csak az egyedi értékeket alakítom át)
+    kodok, egyedi = pd.factorize(df['iszam'])
+    szam = pd.to_numeric(pd.Series(egyedi, dtype=object), errors='coerce').notna().to_numpy()
+    df = df[np.append(szam, False)[kodok]]
+
+    # megadom az adatípusokat
+    df = df.astype({'gid':int, 'cim':str, 'telepules':str, 'iszam':int, 'orszag':str, 'lat':float, "lon": float})
+
+    return df
+
+
+# a sorhossz szerinti elrendezések: melyik elemekből lesz (gid, cim, telepules, iszam+orszag, lat, lon)
+ELRENDEZESEK = {
+    6: (0, 1, 2, 3, 4, 5),      # sima cím
+    7: (0, 3, 2, 4, 5, 6),      # cég vagy üzlethelyiség van a címen
+    9: (0, -4, -5, -3, -2, -1), # > 8 elem: az utolsó 5 a hasznos
+}
+
+
+_BETU = re.compile(r'[^\W\d_]')
+_SZAM = re.compile(r'\d')
+_ISZAM_ORSZAG = re.compile(r'^\s*(\S+)\s+(\S+)\s*$')
+
+
+def _betu_es_szam(ertekek):
+    # tartalmaz-e betűt és számot is (nem string -> False)
+    return np.fromiter((isinstance(s, str) and _BETU.search(s) is not None and _SZAM.search(s) is not None
+                        for s in ertekek), dtype=bool, count=len(ertekek))
+
+
+def _cimek_osztalyozasa(cimek, start=0):
+    '''
+    A nyers google sorokat egységes oszlopokra rendezi (gid, cim, telepules, iszam, orszag, lat, lon):
+    a sorokat hossz szerint csoportosítja, csoportonként egyben rendezi át a mezőket (oszloponként),
+    az ellenőrzéseket és az irányítószám/ország szétválasztást csak az oszlopok egyedi értékein végzi.
+    A rendezett (még nem típusos) DF-et adja vissza, start-tól induló indexszel.
+
+    - a 8 elemű és a hibás > 8 elemű sorok kiesnek (a régi soronkénti ciklus ezeknél az előző sor
+      tiszta listáját dolgozta fel újra, ami mindig kiesett vagy hibát dobott)
+    - az irányítószám + ország mezőnek pontosan két szóból kell állnia; a régi ciklus a három szavas,
+      "Hungary" második szavú értéket továbbengedte (8 oszlopos sor lett, ami a DF-nél hibát dobott),
+      az egy szavasnál IndexError-ral állt le. Itt mindkettő kiesik.
+    '''
+
+    hosszak = np.fromiter(map(len, cimek), dtype=np.int64, count=len(cimek))
+    csoport = np.where(hosszak > 8, 9, hosszak)
+
+    # először csak az ellenőrzött két oszlop (cim, iszam + orszag), csoportonként egy C szintű map (itemgetter)
+    poz, csoportok, cim, iszam_orszag = [], [], [], []
+    for hossz, elemek in ELRENDEZESEK.items():
+        idx = np.flatnonzero(csoport == hossz)
+        if len(idx):
+            sorok = list(map(cimek.__getitem__, idx.tolist()))
+            poz.append(idx)
+            csoportok.append((elemek, sorok))
+            cim.extend(map(itemgetter(elemek[1]), sorok))
+            iszam_orszag.extend(map(itemgetter(elemek[3]), sorok))
+
+    # az 1-es oszlopnak (utca + házszám) tartalmaznia kell számokat és betűket is
+    kodok, egyedi = pd.factorize(np.asarray(cim, dtype=object))
+    jo = np.append(_betu_es_szam(egyedi), False)[kodok]  # -1 (None) -> False
+
+    # a 3-as oszlop (irányító szám + ország) nagyon ismétlődik, ezt is csak az egyedi értékeken dolgozom fel:
+    # számokat és betűket is tartalmaznia kell, és pontosan ketté kell tudni osztani
+    kodok, egyedi = pd.factorize(np.asarray(iszam_orszag, dtype=object))
+    reszek = [_ISZAM_ORSZAG.match(s) if isinstance(s, str) else None for s in egyedi]
+    iszam = np.array([m.group(1) if m else None for m in reszek] + [None], dtype=object)
+    orszag = np.array([m.group(2) if m else None for m in reszek] + [None], dtype=object)
+    jo &= np.append(_betu_es_szam(egyedi) & np.array([m is not None for m in reszek], dtype=bool), False)[kodok]
+
+    # a többi mezőt már csak a jó sorokból szedem ki
+    tobbi = {'gid': [], 'telepules': [], 'lat': [], 'lon': []}
+    eleje = 0
+    for elemek, sorok in csoportok:
+        jo_sorok = list(compress(sorok, jo[eleje:eleje + len(sorok)].tolist()))
+        eleje += len(sorok)
+        for nev, k in zip(tobbi, (elemek[0], elemek[2], elemek[4], elemek[5])):
+            tobbi[nev].extend(map(itemgetter(k), jo_sorok))
 
+    # eredeti sorrend visszaállítása
+    sorrend = np.argsort(np.concatenate(poz)[jo], kind='stable') if poz else np.empty(0, dtype=np.int64)
+    kodok = kodok[jo][sorrend]
+    tobbi = {nev: np.asarray(o, dtype=object)[sorrend] for nev, o in tobbi.items()}
+
+    df = pd.DataFrame({'gid': tobbi['gid'], 'cim': np.asarray(cim, dtype=object)[jo][sorrend],
+                       'telepules': tobbi['telepules'], 'iszam': iszam[kodok], 'orszag': orszag[kodok],
+                       'lat': tobbi['lat'], 'lon': tobbi['lon']},
+                      index=pd.RangeIndex(start, start + len(sorrend)))
+
+    return df
 
 
 def jsonl_load(path):
@@ -35,81 +272,59 @@ def jsonl_load(path):
 
     print(len(cimek), 'cím beolvasva')
 
-    # struktúrált feldolhozás
-    adatok = []
-    for cim in cimek:
-
-        # ha a cím kevesebb mint 6 elemből áll akkor tuti None
-        if len(cim) < 6:
-            continue
-
-        # ha pont 6 elemű a lekérdezés akkor minden jó
-        elif len(cim) == 6:
-            # ha nincsen házszám akkor kövi
-            if not cim[1]:
-                continue
-            else:
-                # print(len(cim), cim)
-                tiszta = cim
-
-        # cég vagy üzelethelyiség van a címen (biztos, hogy nincsen None)
-        elif len(cim) == 7:
-            idd = cim[0]
-            utca = cim[3]
-            varos = cim[2]
-            tobbi = cim[-3:]
-            # print(len(cim), [idd, utca, varos, *tobbi])
-            tiszta = [idd, utca, varos, *tobbi]
+    # struktúrált feldolhozás (oszlopos)
+    df = _cimek_osztalyozasa(cimek)
 
-        elif len(cim) > 8:
-            idd = cim[0]
-            hasznos = cim[-5:]
-            rend = [idd, hasznos[1], hasznos[0], *hasznos[2:]]
+    print(len(df), 'használható cím átadva', f'ez a címek {round((100*len(df))/len(cimek), 2)}%-a')
 
-            # ha a cím sor tartalmaz számokat és betűket is akkor jó esélyel nem hibás az adatsor
-            s = rend[1]
-            if any(c.isalpha() for c in s) and any(c.isdigit() for c in s):
-                # print(len(cim), '\t', rend)
-                tiszta = rend
+    # df alap beállítások kezelések
+    df = _tipusok(df)
 
-        # itt még lehet feltételeket adni az adatosornak szűréshez
+    return df
 
-        # az 1-es oszlopnak szintén tartalmaznia kell számkat és betűket is mert utca + házszám
-        s = tiszta[1]
-        if not (any(c.isalpha() for c in s) and any(c.isdigit() for c in s)):
-            continue
 
-        # 3-as oszlopnak tartalmaznia kell számokat és betűket is mert irányitó szám + ország
-        s = tiszta[3]
-        if not (any(c.isalpha() for c in s) and any(c.isdigit() for c in s)):
-            continue
+def jsonl_load_chunks(path, chunk_size=100_000):
+    '''
+    Mint a jsonl_load, csak chunk_size soronként típusos DF darabokat ad vissza (generátor),
+    így a memória a chunk mérettől függ és nem a fájl méretétől.
 
-        # 3-as oszlopot tudonom kell pontosan ketté osztani irányító szám és ország
-        reszek = tiszta[3].split()
-        tiszta = tiszta[:3] + reszek + tiszta[4:]
+    pl. df = pd.concat(jsonl_load_chunks(path)) ugyanazt adja mint a jsonl_load(path)
+    '''
 
-        # ha nem 7 elemű listát kaptam és ha a második tag nem Magyarország akkor baj van
-        if len(tiszta) != 7 and reszek[1] != 'Hungary':
-            continue
+    writer = JsonlWriter(path)
 
+    beolvasott = 0
+    hasznos = 0
 
-        adatok.append(tiszta)
+    for cimek in writer.iter_chunks(chunk_size):
+        df = _cimek_osztalyozasa(cimek, start=hasznos)
 
+        beolvasott += len(cimek)
+        hasznos += len(df)
 
-    print(len(adatok), 'használható cím átadva', f'ez a címek {round((100*len(adatok))/len(cimek), 2)}%-a')
+        yield _tipusok(df)
 
-    # df alap beállítások kezelések
+    print(beolvasott, 'cím beolvasva')
+    print(hasznos, 'használható cím átadva', f'ez a címek {round((100*hasznos)/max(beolvasott, 1), 2)}%-a')
 
-    df = pd.DataFrame(adatok)
-    # ozslopok átnevezése
-    df = df.rename(columns={0: "gid", 1: 'cim', 2: 'telepules', 3: 'iszam', 4: 'orszag', 5: 'lat', 6: 'lon'})
 
-    # kiszűröm azokat a sorkat ahol az irányítószám nem alakítható int-é mert hibás adat van benne
-    mask = pd.to_numeric(df['iszam'], errors='coerce').notna()
-    df = df[mask]
+def jsonl_to_parquet(path, out_path, chunk_size=100_000):
+    '''
+    A jsonl_load_chunks darabjait egyenként egy parquet fájlba írja (a teljes DF soha nincs memóriában)
+    '''
 
-    # megadom az adatípusokat
-    df = df.astype({'gid':int, 'cim':str, 'telepules':str, 'iszam':int, 'orszag':str, 'lat':float, "lon": float})
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
-    return df
+    pq_writer = None
+    try:
+        for df in jsonl_load_chunks(path, chunk_size):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if pq_writer is None:
+                pq_writer = pq.ParquetWriter(out_path, table.schema)
+            pq_writer.write_table(table.cast(pq_writer.schema))
+    finally:
+        if pq_writer is not None:
+            pq_writer.close()
 
+    return out_path
@@ -0,0 +1,257 @@
+import os
+import re
+import inspect
+import pickle
+import time
+
+import pandas as pd
+
+from norm_cache import verzio
+
+
+'''
+Lépésenkénti (stage) memoizálás a poligon generáló pipeline-hoz.
+
+Minden lépés kimenete a lépés kulcsa alatt kerül lemezre. A kulcs a lépés nevének, függvénye forráskódjának,
+paramétereinek és a bemenő lépések kulcsainak hash-e, így egy késői paraméter (pl. egyesites MIN_AREA)
+változásakor csak az attól függő lépések futnak újra, a korábbiak a cache-ből jönnek.
+
+A kulcsba a lépés függvényéből (tranzitívan) hivatkozott helyi függvények, osztályok és modul szintű konstansok
+forrása / értéke is bekerül (fuggveny_verzio), így egy használt segédfüggvény (pl. dedup_points,
+kicsik_beolvasztasa, osm_cache) módosítása érvényteleníti a tárolt eredményt, egy nem használté viszont nem.
+Ami nem helyi forráskód (shapely / GEOS, osmnx verzió), vagy csak futásidőben derül ki (pl. getattr-ral,
+paraméterként átadott függvény), az nem kerül bele: ilyenkor a VERZIO-t kell növelni (vagy a cache mappát törölni).
+
+A bemenő lépések kimenetét csak akkor olvasom be, ha egy lépést tényleg újra kell futtatni
+(ha minden lépés találat, csak az utolsó kerül beolvasásra).
+
+Használat:
+futtato = LepesFuttato('../../adatok/working/lepes_cache')
+a = futtato.lepes("letoltes", letoltes, VAROS)
+b = futtato.lepes("vag_residential_city", vag_residential_city, a[3], a[4])
+...
+futtato.riport()
+'''
+
+
+LEPES_CACHE_DIR = '../../adatok/working/lepes_cache'
+
+# kézzel növelendő, ha a kulcsba nem kerülő dolog változik (pl. shapely / GEOS verzió, kimenet formátum)
+VERZIO = 1
+
+
+
+# a kulcsba értékükkel bekerülő modul szintű konstansok (szabály táblák, tűrések, regexek)
+_KONSTANS_TIPUSOK = (int, float, str, bytes, bool, tuple, list, dict, set, frozenset, re.Pattern)
+
+
+def _nevek(kod):
+    # a kódban (és a benne definiált belső függvényekben, lambdákban) hivatkozott globális / attribútum nevek
+    nevek = set(kod.co_names)
+    for c in kod.co_consts:
+        if inspect.iscode(c):
+            nevek |= _nevek(c)
+    return nevek
+
+
+def fuggveny_verzio(fn):
+    '''
+    Hash a fn-ből (tranzitívan) ténylegesen hivatkozott helyi függvények, osztályok és modul szintű konstansok
+    forráskódjából / értékéből. Helyi: a fn moduljában vagy azzal egy mappában lévő modulban definiált.
+
+    Így pl. a polygon_fuggvenyek egy lépés által nem használt függvényének módosítása nem érvényteleníti
+    a lépés tárolt eredményét, a használt segédfüggvényeké (dedup_points, osm_cache.kivonat_teljes, ...) igen.
+    '''
+
+    fn = inspect.unwrap(fn)
+    modul = inspect.getmodule(fn)
+    fajl = getattr(modul, "__file__", None)
+    mappa = os.path.dirname(os.path.abspath(fajl)) if fajl else None
+
+    def helyi(obj):
+        m = inspect.getmodule(obj)
+        if m is None:
+            return False
+        if m is modul:
+            return True
+        f = getattr(m, "__file__", None)
+        return mappa is not None and f is not None and os.path.dirname(os.path.abspath(f)) == mappa
+
+    reszek = {}
+    sor = [fn]
+    while sor:
+        f = sor.pop()
+        if inspect.isclass(f):
+            # osztály: a teljes forrása, és a metódusai által hivatkozott nevek
+            metodusok = [inspect.unwrap(getattr(m, "__func__", m)) for m in vars(f).values()]
+            kod_lista = [m.__code__ for m in metodusok if inspect.isfunction(m)]
+            nevter = vars(inspect.getmodule(f))
+        else:
+            kod_lista = [f.__code__]
+            nevter = dict(f.__globals__)
+            # az alapértelmezett paraméterek (pl. ttl=TTL) értéke a definíciókor dől el, a nevük nincs a kódban
+            if f.__defaults__ or f.__kwdefaults__:
+                reszek[_nev(f) + ".__defaults__"] = [_ertek(v) for v in (f.__defaults__ or ())] + \
+                                                    [(k, _ertek(v)) for k, v in sorted((f.__kwdefaults__ or {}).items())]
+            # closure változók (pl. belső függvényből hivatkozott segédfüggvény)
+            for nev, cella in zip(f.__code__.co_freevars, f.__closure__ or ()):
+                try:
+                    nevter[nev] = cella.cell_contents
+                except ValueError:
+                    pass
+
+        nevek = set().union(*(_nevek(k) for k in kod_lista))
+        if not inspect.isclass(f):
+            nevek |= set(f.__code__.co_freevars)
+
+        for nev in nevek:
+            obj = nevter.get(nev)
+            # modul.fuggveny hivatkozás: a helyi modul hivatkozott attribútumai
+            if inspect.ismodule(obj):
+                if helyi(obj):
+                    for attr in nevek:
+                        if attr in vars(obj):
+                            _felvesz(reszek, sor, f"{obj.__name__}.{attr}", vars(obj)[attr], helyi)
+                continue
+            _felvesz(reszek, sor, f"{getattr(inspect.getmodule(f), '__name__', '')}.{nev}", obj, helyi)
+
+    return verzio(sorted(reszek.items()))
+
+
+def _ertek(v):
+    # stabilan hash-elhető forma: a halmaz repr-je futásonként más sorrendű lehet, egyéb objektumnak csak a típusa
+    if isinstance(v, (set, frozenset)):
+        return sorted(map(repr, v))
+    if v is None or callable(v) or isinstance(v, _KONSTANS_TIPUSOK):
+        return v
+    return type(v).__name__
+
+
+def _nev(obj):
+    # függvény / osztály a definiáló modulja szerint (egy importált segédfüggvény így csak egyszer kerül be)
+    return f"{obj.__module__}.{obj.__qualname__}"
+
+
+def _felvesz(reszek, sor, nev, obj, helyi):
+    # egy hivatkozott objektum a verzióba: helyi függvény / osztály a forrásával (és bejárásra), konstans az értékével
+    if obj is None:
+        return
+    if inspect.isfunction(inspect.unwrap(obj)) or inspect.isclass(obj):
+        nev = _nev(obj)
+        if helyi(obj) and nev not in reszek:
+            try:
+                reszek[nev] = inspect.getsource(obj)
+            except (OSError, TypeError):
+                reszek[nev] = obj
+            sor.append(inspect.unwrap(obj) if not inspect.isclass(obj) else obj)
+    elif isinstance(obj, _KONSTANS_TIPUSOK) and nev not in reszek:
+        reszek[nev] = _ertek(obj)
+
+
+
+class Eredmeny:
+    '''
+    Egy lépés (lusta) kimenete: kulcs + érték, az érték csak első használatkor töltődik be
+    '''
+
+    def __init__(self, kulcs, ertek=None, path=None):
+        self.kulcs = kulcs
+        self._ertek = ertek
+        self._path = path
+        self._betoltve = path is None
+
+    @property
+    def ertek(self):
+        if not self._betoltve:
+            with open(self._path, "rb") as f:
+                self._ertek = pickle.load(f)
+            self._betoltve = True
+        return self._ertek
+
+    def __getitem__(self, i):
+        # több kimenetű lépés (tuple) egy eleme, saját kulccsal
+        return _Resz(self, i)
+
+
+class _Resz(Eredmeny):
+    def __init__(self, szulo, i):
+        super().__init__(f"{szulo.kulcs}[{i}]")
+        self._szulo = szulo
+        self._i = i
+        self._betoltve = False
+
+    @property
+    def ertek(self):
+        return self._szulo.ertek[self._i]
+
+
+
+class LepesFuttato:
+    def __init__(self, cache_dir=None, verbose=False):
+        '''
+        cache_dir=None: nincs lemezre mentés (minden lépés lefut), de az időmérés és a riport működik
+        '''
+
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.sorok = []
+
+    def lepes(self, nev, fn, *bemenetek, kulcs_param=None, lejarat=None, **param):
+        '''
+        fn(*bemenetek értékei, **param) futtatása vagy betöltése a cache-ből
+
+        bemenetek: korábbi lépések Eredmeny-ei vagy sima értékek (utóbbiak a repr-jükkel kerülnek a kulcsba)
+        kulcs_param: ha a param nem hash-elhető stabilan (pl. nagy objektum), ez kerül helyette a kulcsba
+        lejarat: ennyi mp után a mentett kimenet lejár (pl. online letöltésnél); a param-ok változatlanul
+        mennek tovább fn-nek (pl. a letoltes saját ttl-je)
+        '''
+
+        kulcsok = [b.kulcs if isinstance(b, Eredmeny) else b for b in bemenetek]
+        kulcs = verzio(VERZIO, nev, fn, fuggveny_verzio(fn), kulcsok, param if kulcs_param is None else kulcs_param)
+
+        path = None
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, nev, kulcs + ".pkl")
+
+        t0 = time.perf_counter()
+        if path is not None and os.path.exists(path) and (lejarat is None or time.time() - os.path.getmtime(path) <= lejarat):
+            eredmeny = Eredmeny(kulcs, path=path)
+            talalat = True
+        else:
+            ertekek = [b.ertek if isinstance(b, Eredmeny) else b for b in bemenetek]
+            t_bemenet = time.perf_counter()
+            ertek = fn(*ertekek, **param)
+            t_szamol = time.perf_counter() - t_bemenet
+
+            if path is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = path + f".tmp{os.getpid()}"
+                with open(tmp, "wb") as f:
+                    pickle.dump(ertek, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+
+            eredmeny = Eredmeny(kulcs, ertek)
+            talalat = False
+
+        sor = {"lepes": nev, "kulcs": kulcs, "talalat": talalat, "ido": time.perf_counter() - t0}
+        if not talalat:
+            sor["szamolas"] = t_szamol
+        self.sorok.append(sor)
+
+        if self.verbose:
+            print(f'{nev}: {"cache" if talalat else "futtatva"} ({sor["ido"]:.2f} s)')
+
+        return eredmeny
+
+    def riport(self):
+        '''
+        Melyik lépés jött a cache-ből, és mennyi idő ment el lépésenként (a betöltés a lusta értékek miatt
+        a felhasználó lépésnél jelenik meg)
+        '''
+
+        df = pd.DataFrame(self.sorok, columns=["lepes", "kulcs", "talalat", "ido", "szamolas"])
+        for s in self.sorok:
+            print(f'{s["lepes"]:<22} {"cache" if s["talalat"] else "futtatva":<9} {s["ido"]:8.2f} s')
+        print(f'{"összesen":<22} {int(df["talalat"].sum())}/{len(df)} cache {df["ido"].sum():8.2f} s')
+        print(f'(kulcs: helyi forráskód + paraméterek, VERZIO={VERZIO}; könyvtár verzió változásakor a VERZIO-t növelni kell)')
+        return df
@@ -0,0 +1,1739 @@
+import os
+import sys
+import time
+import importlib
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+import re
+import json
+import pickle
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+import networkx as nx
+import osmnx as ox
+from shapely.geometry import LineString, Point, box
+
+from adat_strukturalas import utca_normalizalas, cim_standardizalas, szabalyok_alkalmazasa, UTCACIM_SZABALYOK
+from adat_strukturalas import DB_DTYPES, VAN_CIM, NINCS_CIM, cimjegyzek_parquetba, cimjegyzek_olvasas
+from norm_cache import NormCache
+from varosnev_lekerdezo import VarosnevResolver
+from gm_rendezes import JsonlWriter, jsonl_load, jsonl_load_chunks
+from osm_cache import kivonat_iras
+from polygon_fuggvenyek import letoltes, orange_gen, blue_gen, res_area_es_boundary, dedup_points
+from polygon_fuggvenyek import vag_residential_city, kapcsolas
+from polygon_fuggvenyek import _legkozelebbi_vonalak, egyesites
+from shapely.ops import nearest_points, unary_union, polygonize
+from orszagos import OrszagosAdat
+from szk_pipeline import generalas_batch, poly_gen_pipeline
+from lepes_cache import LepesFuttato, fuggveny_verzio
+import poligon_szk_fuggvenyek
+from poligon_szk_fuggvenyek import pontok_polygonban, polygon_tobb_szavazokor, polygon_voronoi_felosztas
+from poligon_szk_fuggvenyek import ures_polyk_besorolasa, polygonok_egyesitese
+from csempezes import kapcsolas_foltonkent, egyesites_csempezve, foltcsoportok, csempe_racs
+from tarolas import particio_iras, particio_olvasas, particiok
+from gm_rendezes import _cimek_osztalyozasa, _tipusok
+
+
+'''
+Sebesség mérések a feldolgozó függvényekhez (futtatás: python meresek.py)
+'''
+
+
+
+def _minta_rekord(i):
+    # egy tipikus 6 elemű google maps lekérdezés sor
+    return [i, f"Fő utca {i % 200 + 1}", "Budapest", "1111 Hungary", 47.4979 + i * 1e-7, 19.0402 + i * 1e-7]
+
+
+def _minta_gm_sorok(n, seed=0):
+    '''
+    Szintetikus google maps sorok a valós változó hosszúságú formátumokkal (5, 6, 7, 8, 9, 10 elem)
+    '''
+
+    rnd = random.Random(seed)
+    utcak = ["Fő utca", "Petőfi u.", "Kossuth Lajos krt.", "Rákóczi út", "Dózsa György stny", "Ady Endre ltp"]
+    varosok = ["Budapest", "Tököl", "Dunaharaszti", "Szigetszentmiklós"]
+
+    sorok = []
+    for i in range(n):
+        utca = f"{rnd.choice(utcak)} {rnd.randint(1, 150)}{rnd.choice(['', '', 'A', '/B'])}"
+        varos = rnd.choice(varosok)
+        iszam = rnd.choice(["1111 Hungary", "2330 Hungary", "2316 Hungary", "Hungary", "2330"])
+        lat, lon = round(rnd.uniform(45.8, 48.5), 7), round(rnd.uniform(16.2, 22.8), 7)
+
+        tipus = rnd.random()
+        if tipus < 0.05:
+            sor = [i, utca, varos, lat, lon]
+        elif tipus < 0.55:
+            sor = [i, rnd.choice([utca, utca, "", "Fő utca"]), varos, iszam, lat, lon]
+        elif tipus < 0.75:
+            sor = [i, "Kft.", varos, utca, iszam, lat, lon]
+        elif tipus < 0.8:
+            sor = [i, "Kft.", "Bolt", varos, utca, iszam, lat, lon]
+        else:
+            sor = [i, "Kft.", "Bolt", "4.5"] + [None] * rnd.randint(0, 1) + [varos, rnd.choice([utca, "Bolt"]), iszam, lat, lon]
+
+        sorok.append(sor)
+
+    # az első sor mindig egy jó 6 elemű, hogy legyen "előző" sor
+    sorok[0] = [0, "Fő utca 1", "Budapest", "1111 Hungary", 47.5, 19.0]
+
+    return sorok
+
+
+def jsonl_iras_benchmark(n=5000, batch_size=1000, flush_interval=1.0):
+    '''
+    JsonlWriter: rekordonkénti fsync vs. csoportos commit (rekord / másodperc)
+    '''
+
+    eredmeny = {}
+
+    with tempfile.TemporaryDirectory() as mappa:
+        for mod, kw in [('rekordonként', {}), ('batch', {'batch_size': batch_size, 'flush_interval': flush_interval})]:
+            path = os.path.join(mappa, f'{mod}.jsonl')
+
+            t0 = time.perf_counter()
+            with JsonlWriter(path, **kw) as writer:
+                for i in range(n):
+                    writer.write(_minta_rekord(i))
+            dt = time.perf_counter() - t0
+
+            # ellenőrzés: minden sor visszaolvasható
+            assert len(JsonlWriter(path).read_all()) == n
+
+            eredmeny[mod] = n / dt
+            print(f'JsonlWriter {mod}: {n / dt:,.0f} rekord/s')
+
+    print(f"gyorsulás: {eredmeny['batch'] / eredmeny['rekordonként']:.1f}x")
+
+    return eredmeny
+
+
+
+def jsonl_load_benchmark(n=200_000, chunk_size=20_000):
+    '''
+    jsonl_load (egyben) vs. jsonl_load_chunks: futásidő és memória csúcs (tracemalloc)
+    '''
+
+    with tempfile.TemporaryDirectory() as mappa:
+        path = os.path.join(mappa, 'gm.jsonl')
+        with JsonlWriter(path, batch_size=10_000) as writer:
+            for sor in _minta_gm_sorok(n):
+                writer.write(sor)
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        df_egyben = jsonl_load(path)
+        dt_egyben = time.perf_counter() - t0
+        _, csucs_egyben = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del df_egyben
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        sorok = 0
+        for df in jsonl_load_chunks(path, chunk_size):
+            sorok += len(df)
+        dt_chunk = time.perf_counter() - t0
+        _, csucs_chunk = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # ellenőrzés: a chunkok összefűzve ugyanazt adják
+        pd.testing.assert_frame_equal(jsonl_load(path), pd.concat(jsonl_load_chunks(path, chunk_size)))
+
+    print(f'jsonl_load egyben: {dt_egyben:.2f} s, memória csúcs {csucs_egyben / 2**20:.1f} MB')
+    print(f'jsonl_load_chunks: {dt_chunk:.2f} s, memória csúcs {csucs_chunk / 2**20:.1f} MB ({sorok} sor)')
+
+
+
+def _cimek_rendezese_regi(cimek, tiszta=None):
+    '''
+    Az eredeti soronkénti ciklus (összehasonlításhoz).
+    A nyers google sorokat egységes 7 elemű listákra rendezi (gid, cim, telepules, iszam, orszag, lat, lon)
+
+    A tiszta az előző sor eredménye, chunkolt feldolgozásnál a következő hívásnak át kell adni
+    (ugyanúgy viselkedik mint egyben feldolgozva)
+    '''
+
+    adatok = []
+    for cim in cimek:
+
+        # ha a cím kevesebb mint 6 elemből áll akkor tuti None
+        if len(cim) < 6:
+            continue
+
+        # ha pont 6 elemű a lekérdezés akkor minden jó
+        elif len(cim) == 6:
+            # ha nincsen házszám akkor kövi
+            if not cim[1]:
+                continue
+            else:
+                # print(len(cim), cim)
+                tiszta = cim
+
+        # cég vagy üzelethelyiség van a címen (biztos, hogy nincsen None)
+        elif len(cim) == 7:
+            idd = cim[0]
+            utca = cim[3]
+            varos = cim[2]
+            tobbi = cim[-3:]
+            # print(len(cim), [idd, utca, varos, *tobbi])
+            tiszta = [idd, utca, varos, *tobbi]
+
+        elif len(cim) > 8:
+            idd = cim[0]
+            hasznos = cim[-5:]
+            rend = [idd, hasznos[1], hasznos[0], *hasznos[2:]]
+
+            # ha a cím sor tartalmaz számokat és betűket is akkor jó esélyel nem hibás az adatsor
+            s = rend[1]
+            if any(c.isalpha() for c in s) and any(c.isdigit() for c in s):
+                # print(len(cim), '\t', rend)
+                tiszta = rend
+
+        # itt még lehet feltételeket adni az adatosornak szűréshez
+
+        # az 1-es oszlopnak szintén tartalmaznia kell számkat és betűket is mert utca + házszám
+        s = tiszta[1]
+        if not (any(c.isalpha() for c in s) and any(c.isdigit() for c in s)):
+            continue
+
+        # 3-as oszlopnak tartalmaznia kell számokat és betűket is mert irányitó szám + ország
+        s = tiszta[3]
+        if not (any(c.isalpha() for c in s) and any(c.isdigit() for c in s)):
+            continue
+
+        # 3-as oszlopot tudonom kell pontosan ketté osztani irányító szám és ország
+        reszek = tiszta[3].split()
+        tiszta = tiszta[:3] + reszek + tiszta[4:]
+
+        # ha nem 7 elemű listát kaptam és ha a második tag nem Magyarország akkor baj van
+        if len(tiszta) != 7 and reszek[1] != 'Hungary':
+            continue
+
+
+        adatok.append(tiszta)
+
+    return adatok, tiszta
+
+
+
+
+def _adatok_to_df_regi(adatok, start=0):
+    '''
+    A rendezett listákból típusos DF (start: az első sor indexe, chunkoknál folytatólagos index)
+    '''
+
+    df = pd.DataFrame(adatok, index=pd.RangeIndex(start, start + len(adatok)))
+    # ozslopok átnevezése
+    df = df.rename(columns={0: "gid", 1: 'cim', 2: 'telepules', 3: 'iszam', 4: 'orszag', 5: 'lat', 6: 'lon'})
+
+    return _tipusok(df)
+
+
+def cim_osztalyozas_benchmark(n=200_000):
+    '''
+    jsonl_load sor osztályozás: régi soronkénti ciklus vs. oszlopos _cimek_osztalyozasa (egyezés és futásidő)
+    '''
+
+    cimek = _minta_gm_sorok(n)
+
+    # a legjobb 3 futás (a gc és a gép zaja miatt)
+    dt_regi, dt_uj = np.inf, np.inf
+    for _ in range(3):
+        t0 = time.perf_counter()
+        regi = _adatok_to_df_regi(_cimek_rendezese_regi(cimek)[0])
+        dt_regi = min(dt_regi, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        uj = _tipusok(_cimek_osztalyozasa(cimek))
+        dt_uj = min(dt_uj, time.perf_counter() - t0)
+
+    pd.testing.assert_frame_equal(regi, uj)
+
+    # a 8 elemű és a hibás > 8 elemű sorok kiesnek (nem az előző sort ismétlik meg),
+    # akkor is ha ők az elsők
+    jo = [1, "Fő utca 1", "Budapest", "1111 Hungary", 47.5, 19.0]
+    rossz_8 = [2, "Kft.", "Bolt", "Budapest", "Fő utca 2", "1111 Hungary", 47.5, 19.0]
+    rossz_9 = [3, "Kft.", "Bolt", "4.5", "Budapest", "Bolt", "1111 Hungary", 47.5, 19.0]
+    for cimek in ([jo, rossz_8, rossz_9], [rossz_8, rossz_9, jo]):
+        df = _tipusok(_cimek_osztalyozasa(cimek))
+        assert df['gid'].tolist() == [1], df
+
+    # az irányítószám + ország pontosan két szó: a három szavas (régen 8 oszlopos sor, hiba) és az egy szavas
+    # (régen IndexError) érték kiesik
+    harom = [4, "Fő utca 4", "Budapest", "1111 Budapest Hungary", 47.5, 19.0]
+    egy = [5, "Fő utca 5", "Budapest", "1111Hungary", 47.5, 19.0]
+    assert _tipusok(_cimek_osztalyozasa([jo, harom, egy]))['gid'].tolist() == [1]
+
+    print(f'cím osztályozás régi: {dt_regi:.2f} s, oszlopos: {dt_uj:.2f} s, gyorsulás: {dt_regi / dt_uj:.1f}x ({n} sor)')
+
+    return dt_regi, dt_uj
+
+
+
+def _utca_normalizalas_regi(s):
+    # az eredeti, rövidítésenként egy teljes oszlop menetet futtató változat (összehasonlításhoz)
+    kozter_map = {
+        r"\bu\.?\b": "utca", r"\bkrt\.?\b": "körút", r"\bstny\.?\b": "sétány", r"\brkp\.?\b": "rakpart",
+        r"\bfs\.?\b": "fasor", r"\bsgt\.?\b": "sugárút", r"\bltp\.?\b": "lakótelep", r"\budv\.?\b": "udvar",
+        r"\bhrsz\b": "helyrajzi szám", r"\bst\.?\b": "utca", r"\brd\.?\b": "út", r"\bave\.?\b": "sugárút",
+        r"\bblvd\.?\b": "körút",
+    }
+    for pattern, repl in kozter_map.items():
+        s = s.str.replace(pattern, repl, regex=True, flags=re.IGNORECASE)
+    return s.str.replace(r"\s+", " ", regex=True).str.strip().str.rstrip(".")
+
+
+def _cim_standardizalas_regi(df):
+    # az eredeti, soronkénti .str menetekkel dolgozó cim_standardizalas (összehasonlításhoz)
+    m_hrsz = df["cim"].str.contains(r"\bhrsz\b", case=False, na=False)
+    df.loc[m_hrsz, "utca"] = df.loc[m_hrsz, "cim"]
+    df.loc[m_hrsz, "cim"] = pd.NA
+
+    m_move = (df["utca"].isna() | df["utca"].str.strip().eq("")) & df["cim"].notna() & df["cim"].str.strip().ne("")
+    df.loc[m_move, "utca"] = df.loc[m_move, "cim"]
+    df.loc[m_move, "cim"] = pd.NA
+
+    m = df["cim"].notna() & df["cim"].str.strip().ne("")
+    s = df.loc[m, "cim"].str.strip()
+    s = s.str.replace(r"\s*(épület|epulet|l[eé]pcs[őo]h[áa]z|lph\.?|lh\.?|emelet|ajt[óo]|szint|building)\b.*$", "",
+                      regex=True, flags=re.IGNORECASE)
+    s = s.str.replace("/", " ", regex=False)
+    s = s.str.replace(r"(?<!\d)-|-(?!\d)", " ", regex=True)
+    s = s.str.replace(r"(\d)([A-Za-zÁÉÍÓÖŐÚÜŰáéíóöőúüű])", r"\1 \2", regex=True)
+    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
+    df.loc[m, "cim"] = s.str.upper()
+
+    return df
+
+
+def _minta_cimjegyzek(n, egyedi_utca=50_000, seed=0):
+    '''
+    Címjegyzék méretű szintetikus utca és házszám oszlop (object dtype, mint a régi pandas str oszlopok)
+    '''
+
+    rnd = random.Random(seed)
+    nevek = ["Petőfi", "Kossuth Lajos", "Ady Endre", "Dózsa György", "Rákóczi", "Béke", "Fő", "Széchenyi", "Arany János"]
+    tipusok = ["u.", "u", "utca", "krt.", "Krt", "stny", "rkp.", "fs.", "sgt", "ltp.", "udv.", "hrsz", "st.", "Rd",
+               "ave.", "blvd", "út", "tér", "u.st", "st.u.", "krt.u", "u..", "köz."]
+
+    utcak = [f"{rnd.choice(nevek)}{'' if i < 9 else ' ' + str(i)}  {rnd.choice(tipusok)}{rnd.choice(['', ' ', '.'])}"
+             for i in range(egyedi_utca)]
+    hazszamok = ["1", "12/a", "31-B épület", "112-114", "10a", " 3 lph. 2", "2-4D", "-5", "7 B", "9/B A", "11 emelet 2",
+                 "4ajtó", "1-", None, ""]
+
+    utca = [rnd.choice(utcak) for _ in range(n)]
+    cim = [rnd.choice(hazszamok) if rnd.random() < 0.5 else str(rnd.randint(1, 300)) + rnd.choice(["", "a", "/C"])
+           for _ in range(n)]
+
+    return pd.DataFrame({"utca": pd.Series(utca, dtype=object), "cim": pd.Series(cim, dtype=object)})
+
+
+def normalizalas_benchmark(n=1_000_000):
+    '''
+    utca_normalizalas és cim_standardizalas: régi oszlopos regex menetek vs. egyedi értékenkénti egy menet
+    '''
+
+    df = _minta_cimjegyzek(n)
+
+    t0 = time.perf_counter()
+    regi_utca = _utca_normalizalas_regi(df["utca"])
+    dt_regi_utca = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    uj_utca = utca_normalizalas(df["utca"])
+    dt_uj_utca = time.perf_counter() - t0
+
+    pd.testing.assert_series_equal(regi_utca, uj_utca)
+
+    t0 = time.perf_counter()
+    regi_cim = _cim_standardizalas_regi(df.copy())
+    dt_regi_cim = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    uj_cim = cim_standardizalas(df.copy())
+    dt_uj_cim = time.perf_counter() - t0
+
+    pd.testing.assert_frame_equal(regi_cim, uj_cim)
+
+    print(f'utca_normalizalas régi: {dt_regi_utca:.2f} s, új: {dt_uj_utca:.2f} s, '
+          f'gyorsulás: {dt_regi_utca / dt_uj_utca:.1f}x ({n} sor)')
+    print(f'cim_standardizalas régi: {dt_regi_cim:.2f} s, új: {dt_uj_cim:.2f} s, '
+          f'gyorsulás: {dt_regi_cim / dt_uj_cim:.1f}x ({n} sor)')
+
+
+
+def norm_cache_benchmark(n=1_000_000):
+    '''
+    NormCache: első (üres cache) és második futás az utca/házszám normalizálásra, találati arány riporttal
+    '''
+
+    df = _minta_cimjegyzek(n)
+    elvart = cim_standardizalas(df.copy())
+    elvart["utca"] = utca_normalizalas(elvart["utca"])
+
+    with tempfile.TemporaryDirectory() as mappa:
+        for futas in (1, 2):
+            with NormCache(os.path.join(mappa, 'norm_cache.sqlite')) as cache:
+                t0 = time.perf_counter()
+                uj = cim_standardizalas(df.copy(), cache)
+                uj["utca"] = utca_normalizalas(uj["utca"], cache)
+                dt = time.perf_counter() - t0
+
+                pd.testing.assert_frame_equal(elvart, uj)
+
+                print(f'{futas}. futás cache-el: {dt:.2f} s')
+                cache.riport()
+
+
+
+def _utcacim_tisztitas_regi(s):
+    # a db_feldolgozas eredeti, teljes oszlopos regex menetei (összehasonlításhoz)
+    s = s.str.replace(r'[{}=]', ' ', regex=True)
+    s = s.str.replace(r'[<>]', ' ', regex=True)
+    s = s.str.replace(r'\b(building|bldg\.?|block|blokk|épület|epulet)\b', ' ', regex=True, flags=re.IGNORECASE)
+    s = s.str.replace(r'\s+', ' ', regex=True).str.strip()
+    s = s.str.replace(r'\d+', lambda m: str(int(m.group(0))), regex=True)
+    s = s.str.replace(r'\s+', ' ', regex=True).str.strip()
+    s = s.str.replace(r'(\b\d+/\w)\s+[A-Z]\b', r'\1', regex=True)
+    s = s.str.replace(r'(\b\d+\s+[A-Z])\s+[A-Z]\b', r'\1', regex=True)
+    s = s.str.replace(r'(\b\d+-\d+[A-Z])\s+[A-Z]\b', r'\1', regex=True)
+    return s
+
+
+def utcacim_szabalyok_benchmark(n=1_000_000, seed=0):
+    '''
+    db_feldolgozas utcacim tisztítás: régi oszlopos menetek vs. UTCACIM_SZABALYOK az egyedi értékeken,
+    szabályonkénti találat és idő statisztikával
+    '''
+
+    rnd = random.Random(seed)
+    mintak = ["{12}", "<5>", "007", "1/B A", "1/B B", "10 A B", "2-4D D", "building 3", "0012  A", "3=4", "Bldg. 7",
+              "12 épület", "05/a", "blokk 2 A B", None, "0", "  1  "]
+    s = pd.Series([rnd.choice(mintak) if rnd.random() < 0.3 else f"{rnd.randint(0, 400):0{rnd.randint(1, 4)}d}"
+                   f"{rnd.choice(['', ' A', '/B A', '-12C C', ' a b'])}" for _ in range(n)], dtype=object)
+
+    t0 = time.perf_counter()
+    regi = _utcacim_tisztitas_regi(s)
+    dt_regi = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    uj, stat = szabalyok_alkalmazasa(s, UTCACIM_SZABALYOK)
+    dt_uj = time.perf_counter() - t0
+
+    pd.testing.assert_series_equal(regi, uj)
+
+    print(f'utcacim tisztítás régi: {dt_regi:.2f} s, szabály pipeline: {dt_uj:.2f} s, '
+          f'gyorsulás: {dt_regi / dt_uj:.1f}x ({n} sor)')
+    print(stat.to_string(index=False))
+
+    return stat
+
+
+
+def cimjegyzek_parquet_benchmark(n=1_000_000, telepules=300, seed=0):
+    '''
+    Címjegyzék beolvasás: CSV (pd.read_csv + date szűrés) vs. cimjegyzek_olvasas a parquet adathalmazból,
+    egyezés ellenőrzéssel (értékek, sorrend, index, categorical telepulesnev), és oszlop projekcióval
+    '''
+
+    rng = np.random.default_rng(seed)
+    datumok = np.array(VAN_CIM + NINCS_CIM)
+    telepulesid = rng.integers(1, telepules + 1, n)
+    kozteruletid = pd.array(rng.integers(1, 20_000, n), dtype='Int64')
+    kozteruletid[rng.random(n) < 0.01] = pd.NA
+    utcak = np.array([f"Utca {i}" for i in range(2000)], dtype=object)
+    nevek = np.array([f"Település {i}" for i in range(telepules + 1)], dtype=object)
+
+    df = pd.DataFrame({
+        'szavazokorid': rng.integers(1, 10_000, n),
+        'kozteruletid': kozteruletid,
+        'kozteruletnevid': rng.integers(1, 50_000, n),
+        'kozteruletnev': utcak[rng.integers(0, len(utcak), n)],
+        'utcacim': rng.integers(0, 300, n).astype(str).astype(object),
+        'telepulesid': telepulesid,
+        'telepulesnev': nevek[telepulesid],
+        'eventfromid': rng.integers(1, 100, n),
+        'date': datumok[rng.integers(0, len(datumok), n)],
+    })
+    df.loc[rng.random(n) < 0.01, 'utcacim'] = None
+
+    with tempfile.TemporaryDirectory() as mappa:
+        csv_path = os.path.join(mappa, 'cimek.csv')
+        df.to_csv(csv_path, index=False)
+        pq_path = cimjegyzek_parquetba(csv_path, os.path.join(mappa, 'cimek_parquet'))
+
+        t0 = time.perf_counter()
+        csv = pd.read_csv(csv_path, dtype=DB_DTYPES)
+        csv = csv[csv['date'].isin(VAN_CIM)]
+        dt_csv = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pq = cimjegyzek_olvasas(pq_path, VAN_CIM)
+        dt_pq = time.perf_counter() - t0
+
+        oszlopok = ['szavazokorid', 'telepulesnev']
+        t0 = time.perf_counter()
+        pq_proj = cimjegyzek_olvasas(pq_path, VAN_CIM, columns=oszlopok)
+        dt_proj = time.perf_counter() - t0
+
+    # a két szöveges oszlop categorical, az értékek (és a hiányzók) ugyanazok mint a CSV-ben
+    for c in ['telepulesnev', 'kozteruletnev']:
+        assert isinstance(pq[c].dtype, pd.CategoricalDtype), c
+        assert isinstance(pq_proj[c].dtype, pd.CategoricalDtype) if c in oszlopok else c not in pq_proj.columns
+    egyszeru = pq.astype({'telepulesnev': object, 'kozteruletnev': object})
+    pd.testing.assert_frame_equal(csv[list(DB_DTYPES)].fillna({'utcacim': np.nan}),
+                                  egyszeru[list(DB_DTYPES)].fillna({'utcacim': np.nan}))
+    pd.testing.assert_frame_equal(csv[oszlopok], pq_proj.astype({'telepulesnev': object}))
+
+    print(f'címjegyzék beolvasás CSV: {dt_csv:.2f} s, parquet: {dt_pq:.2f} s ({dt_csv / dt_pq:.1f}x), '
+          f'parquet {len(oszlopok)} oszlop: {dt_proj:.2f} s ({dt_csv / dt_proj:.1f}x), {len(pq)} / {n} sor')
+    print(f'memória CSV: {csv.memory_usage(deep=True).sum() / 1e6:.0f} MB, '
+          f'parquet (categorical): {pq.memory_usage(deep=True).sum() / 1e6:.0f} MB')
+
+
+
+class _NominatimStub(BaseHTTPRequestHandler):
+    # helyi, offline Nominatim utánzat: a "q" névből "<q> (hu)" városnevet ad vissza
+    # a "Hibas" kezdetű nevekre először 503-at (Retry-After: 0), másodszorra rendes választ ad
+    keresek = 0
+    hibazott = set()
+
+    def do_GET(self):
+        q = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        type(self).keresek += 1
+        time.sleep(0.01)  # hálózati késleltetés
+        if q.startswith("Hibas") and q not in self.hibazott:
+            self.hibazott.add(q)
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps([{"address": {"town": f"{q} (hu)"}}] if q != "ismeretlen" else []).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def nominatim_benchmark(n=200, rate=100.0, max_workers=8):
+    '''
+    VarosnevResolver egy helyi stub szerver ellen: áteresztőképesség, majd második futás a cache-ből.
+    Az újrapróbálások is a token bucketen mennek át (minden HTTP kérésre egy acquire jut).
+    '''
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _NominatimStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/search"
+
+    nevek = [f"Varos{i}" for i in range(n)] + [f"Hibas{i}" for i in range(n // 10)] + ["ismeretlen"]
+    _NominatimStub.hibazott = set()
+
+    try:
+        with tempfile.TemporaryDirectory() as mappa:
+            cache_path = os.path.join(mappa, 'varosnevek.jsonl')
+
+            # első futás: a felét oldom fel (megszakadt futás), a második futás innen folytatja
+            for futas, resz in ((1, nevek[:n // 2]), (2, nevek)):
+                _NominatimStub.keresek = 0
+                t0 = time.perf_counter()
+                with VarosnevResolver(cache_path, url=url, rate=rate, capacity=max_workers,
+                                      max_workers=max_workers) as resolver:
+                    acquire, tokenek = resolver.bucket.acquire, []
+                    resolver.bucket.acquire = lambda: (tokenek.append(1), acquire())
+                    m = resolver.bulk(resz, verbose=False)
+                    stat = dict(resolver.stat)
+                dt = time.perf_counter() - t0
+
+                assert m["Varos0"] == "Varos0 (hu)"
+                assert len(tokenek) == _NominatimStub.keresek == stat["lekerdezve"] + stat["ujraprobalva"]
+                print(f'{futas}. futás: {len(resz)} név, {_NominatimStub.keresek} HTTP kérés, {dt:.2f} s, '
+                      f'{_NominatimStub.keresek / dt:.1f} kérés/s, {stat}')
+
+            assert m["ismeretlen"] == "ismeretlen" and len(m) == len(nevek)
+            assert m["Hibas0"] == "Hibas0 (hu)" and len(_NominatimStub.hibazott) == n // 10
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+
+def _minta_halozat(n=60, nx_telepules=2, ny_telepules=2, lepes=0.001, x0=19.0, y0=47.3, seed=0, hiany=0.08):
+    '''
+    Szintetikus (vetítetlen) osm adat: n x n rácsos úthálózat hiany arányban hiányzó élekkel (zsákutcák),
+    lakott terület tömbök és nx_telepules x ny_telepules négyzetes településhatár ("Telepules{i}_{j}")
+    '''
+
+    rnd = random.Random(seed)
+
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    for i in range(n):
+        for j in range(n):
+            G.add_node(i * n + j, x=x0 + i * lepes, y=y0 + j * lepes, street_count=4)
+
+    osmid = 0
+    for i in range(n):
+        for j in range(n):
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < n and j + dj < n and rnd.random() > hiany:
+                    u, v = i * n + j, (i + di) * n + (j + dj)
+                    geom = LineString([(G.nodes[u]["x"], G.nodes[u]["y"]), (G.nodes[v]["x"], G.nodes[v]["y"])])
+                    osmid += 1
+                    for a, b in ((u, v), (v, u)):
+                        G.add_edge(a, b, key=0, osmid=osmid, length=lepes * 75_000, oneway=False,
+                                   name=f"utca {i}" if di else f"köz {j}", geometry=geom if a == u else geom.reverse())
+
+    G.remove_nodes_from([x for x in list(G.nodes) if G.degree(x) == 0])
+
+    # lakott terület: a rács tömbjeinek nagy része, kis résekkel
+    res_geom = []
+    meret = 5
+    for i in range(0, n - meret, meret):
+        for j in range(0, n - meret, meret):
+            if rnd.random() < 0.8:
+                res_geom.append(box(x0 + (i + 0.5) * lepes, y0 + (j + 0.5) * lepes,
+                                    x0 + (i + meret + 0.4) * lepes, y0 + (j + meret + 0.4) * lepes))
+    res = gpd.GeoDataFrame({"landuse": ["residential"] * len(res_geom)}, geometry=res_geom, crs="EPSG:4326")
+    res.index = pd.MultiIndex.from_arrays([["way"] * len(res), np.arange(len(res))], names=["element", "id"])
+
+    dx = (n - 1) * lepes / nx_telepules
+    dy = (n - 1) * lepes / ny_telepules
+    places, hatar = [], []
+    for i in range(nx_telepules):
+        for j in range(ny_telepules):
+            places.append(f"Telepules{i}_{j}")
+            hatar.append(box(x0 + i * dx - lepes / 3, y0 + j * dy - lepes / 3,
+                             x0 + (i + 1) * dx - lepes / 3, y0 + (j + 1) * dy - lepes / 3))
+    boundaries = gpd.GeoDataFrame({"place": places}, geometry=hatar, crs="EPSG:4326")
+
+    return G, res, boundaries
+
+
+def osm_cache_benchmark(n=120):
+    '''
+    letoltes offline kivonatból: hideg futás (kivonat olvasás + projektálás + cache írás) vs. meleg (cache olvasás)
+    '''
+
+    with tempfile.TemporaryDirectory() as mappa:
+        path = os.path.join(mappa, 'kivonat.gpkg')
+        cache_dir = os.path.join(mappa, 'osm_cache')
+        kivonat_iras(*_minta_halozat(n, 1, 1), path)
+
+        t0 = time.perf_counter()
+        Gp, nodes, edges, res_p, city_boundary = letoltes("Telepules0_0", cache_dir=cache_dir, kivonat=path)
+        dt_hideg = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        Gp2, nodes2, edges2, res_p2, city_boundary2 = letoltes("Telepules0_0", cache_dir=cache_dir, kivonat=path)
+        dt_meleg = time.perf_counter() - t0
+
+        # egyezés
+        assert nx.utils.graphs_equal(Gp, Gp2)
+        pd.testing.assert_frame_equal(pd.DataFrame(nodes), pd.DataFrame(nodes2))
+        pd.testing.assert_frame_equal(pd.DataFrame(edges), pd.DataFrame(edges2))
+        assert res_p.geometry.geom_equals(res_p2.geometry).all() and city_boundary.equals(city_boundary2)
+        assert nodes.crs == nodes2.crs == res_p2.crs
+
+        # lejárt cache -> újratöltés
+        t0 = time.perf_counter()
+        letoltes("Telepules0_0", cache_dir=cache_dir, kivonat=path, ttl=0)
+        dt_lejart = time.perf_counter() - t0
+
+    print(f'letoltes ({len(nodes)} node, {len(edges)} él): kivonatból {dt_hideg:.2f} s, cache-ből {dt_meleg:.3f} s, '
+          f'gyorsulás: {dt_hideg / dt_meleg:.0f}x (lejárt cache: {dt_lejart:.2f} s)')
+
+    return dt_hideg, dt_meleg
+
+
+
+def _orszagos_kijeloles_regi(orszag, node_ids):
+    # a régi kijelölés: np.isin az országos node és él tömbökön, minden településre
+    u = orszag.edges.index.get_level_values("u").to_numpy()
+    v = orszag.edges.index.get_level_values("v").to_numpy()
+    node_mask = np.isin(orszag._node_id, node_ids)
+    edge_mask = np.isin(u, orszag._node_id[node_mask]) & np.isin(v, orszag._node_id[node_mask])
+    return np.flatnonzero(node_mask), np.flatnonzero(edge_mask)
+
+
+def orszagos_benchmark(n=240, telepulesek=4, ellenoriz=3):
+    '''
+    Településenkénti letoltes (kivonatból) vs. egyszer betöltött országos adatból vágás,
+    és a település node / él kijelölése: országos np.isin vs. CSR (csak a település méretével arányos)
+    '''
+
+    with tempfile.TemporaryDirectory() as mappa:
+        path = os.path.join(mappa, 'orszag.gpkg')
+        kivonat_iras(*_minta_halozat(n, telepulesek, telepulesek), path)
+
+        t0 = time.perf_counter()
+        orszag = OrszagosAdat(path, verbose=False)
+        dt_betoltes = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for PLACE in orszag.helyek:
+            letoltes(PLACE, orszagos=orszag)
+        dt_vagas = (time.perf_counter() - t0) / len(orszag.helyek)
+
+        dt_regi = 0.0
+        for PLACE in orszag.helyek[:ellenoriz]:
+            t0 = time.perf_counter()
+            regi = letoltes(PLACE, kivonat=path)
+            dt_regi += time.perf_counter() - t0
+            uj = letoltes(PLACE, orszagos=orszag)
+
+            # egyezés: ugyanazok a node-ok, élek, lakott területek, ugyanaz a határ
+            assert set(regi[0].nodes) == set(uj[0].nodes)
+            assert set(regi[0].edges(keys=True)) == set(uj[0].edges(keys=True))
+            assert sorted(regi[1].index) == sorted(uj[1].index)
+            assert sorted(regi[2].index) == sorted(uj[2].index)
+            assert len(regi[3]) == len(uj[3])
+            assert regi[4].symmetric_difference(uj[4]).area < 1e-3 * regi[4].area
+        dt_regi /= ellenoriz
+
+        dt_isin = dt_csr = 0.0
+        for PLACE in orszag.helyek:
+            node_pos = np.sort(orszag._pontok_sidx.query(orszag._hatar(PLACE), predicate="intersects"))
+            t0 = time.perf_counter()
+            regi_nodes, regi_elek = _orszagos_kijeloles_regi(orszag, orszag._node_id[node_pos])
+            dt_isin += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            uj_elek = orszag._elek(node_pos)
+            dt_csr += time.perf_counter() - t0
+            assert np.array_equal(regi_nodes, node_pos) and np.array_equal(regi_elek, uj_elek)
+
+    print(f'{len(orszag.helyek)} település: országos betöltés {dt_betoltes:.1f} s (egyszer), '
+          f'településenként kivonatból {dt_regi:.2f} s vs. országosból vágás {dt_vagas:.3f} s')
+    print(f'node / él kijelölés ({len(orszag.nodes)} node, {len(orszag.edges)} él): országos np.isin '
+          f'{1000 * dt_isin / len(orszag.helyek):.1f} ms vs. CSR {1000 * dt_csr / len(orszag.helyek):.1f} ms / település')
+
+    return dt_regi, dt_vagas
+
+
+
+def _minta_pontok(res, boundaries, n=2000, DATE='2022-04-03', seed=0):
+    '''
+    Szintetikus összekapcsolt pontok: lakott területen belül, településenként két szavazókör (nyugati / keleti fél)
+    '''
+
+    rnd = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = res.total_bounds
+    x = rnd.uniform(minx, maxx, n * 3)
+    y = rnd.uniform(miny, maxy, n * 3)
+    pts = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs=res.crs)
+    pts = gpd.sjoin(pts, res[["geometry"]].reset_index(drop=True), predicate="within").drop(columns="index_right")
+    pts = pts[~pts.index.duplicated()].head(n)
+    pts = gpd.sjoin(pts, boundaries[["place", "geometry"]], predicate="within").drop(columns="index_right")
+
+    b = boundaries.set_index("place").bounds
+    kozep = (b["minx"] + b["maxx"]) / 2
+    pts["telepulesnev_hu"] = pts["place"]
+    pts["szavazokorid"] = pts["place"] + np.where(pts.geometry.x < pts["place"].map(kozep), "_1", "_2")
+    pts["date"] = DATE
+
+    return pts.drop(columns="place").reset_index(drop=True).to_crs(epsg=23700)
+
+
+def generalas_batch_benchmark(n=60, max_workers=2):
+    '''
+    generalas_batch szintetikus kivonaton: első futás (egy hibás településsel), folytatás (kész kihagyva), időtúllépés,
+    és országos adattal (útvonalként átadva: a workerek egyszer töltik be, nem kerül minden feladatba)
+    '''
+
+    G, res, boundaries = _minta_halozat(n, 2, 2)
+    pts = _minta_pontok(res, boundaries)
+    # nem létező település (nincs a kivonatban): hibát kell rögzíteni, a többi fut tovább
+    hibas = pts.head(5).copy()
+    hibas["telepulesnev_hu"] = "Nincs"
+    pts = pd.concat([pts, hibas], ignore_index=True)
+
+    with tempfile.TemporaryDirectory() as mappa:
+        path = os.path.join(mappa, 'kivonat.gpkg')
+        kivonat_iras(G, res, boundaries, path)
+        param = {"kivonat": path}
+
+        t0 = time.perf_counter()
+        st1 = generalas_batch('2022-04-03', gdf=pts, out_dir=mappa, max_workers=max_workers, timeout=300,
+                              letoltes_param=param, verbose=False)
+        dt1 = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        st2 = generalas_batch('2022-04-03', gdf=pts, out_dir=mappa, max_workers=max_workers, timeout=300,
+                              letoltes_param=param, verbose=False)
+        dt2 = time.perf_counter() - t0
+
+        st3 = generalas_batch('2022-04-03', gdf=pts, out_dir=os.path.join(mappa, 'timeout'), max_workers=max_workers,
+                              timeout=1, letoltes_param=param, verbose=False)
+
+        t0 = time.perf_counter()
+        st4 = generalas_batch('2022-04-03', gdf=pts, out_dir=os.path.join(mappa, 'orszagos'), max_workers=max_workers,
+                              timeout=300, letoltes_param={"orszagos": path}, verbose=False)
+        dt4 = time.perf_counter() - t0
+        orszag_meret = len(pickle.dumps(OrszagosAdat(path, verbose=False)))
+
+        with JsonlWriter(os.path.join(mappa, 'generalas_statusz_2022-04-03.jsonl')) as naplo:
+            napl_sorok = naplo.read_all()
+
+    assert st1["Nincs"]["statusz"] == "hiba"
+    assert all(r["statusz"] == "kesz" for v, r in st1.items() if v != "Nincs")
+    assert all(r["statusz"] == "kihagyva" for v, r in st2.items() if v != "Nincs") and st2["Nincs"]["statusz"] == "hiba"
+    assert all(r["statusz"] == "idotullepes" for v, r in st3.items() if v != "Nincs")
+    assert len(napl_sorok) == len(st1) + 1  # első futás + a hibás újrapróbálása
+    assert all(r["statusz"] == "kesz" for v, r in st4.items() if v != "Nincs") and st4["Nincs"]["statusz"] == "hiba"
+
+    print(f'generalas_batch: {len(st1)} település, első futás {dt1:.1f} s, folytatás {dt2:.1f} s '
+          f'(kész kihagyva), státuszok: {pd.Series([r["statusz"] for r in st1.values()]).value_counts().to_dict()}')
+    print(f'országos adattal (worker initializer): {dt4:.1f} s, feladatonként nem küldött OrszagosAdat: '
+          f'{orszag_meret / 1e6:.1f} MB x {len(st4)} település')
+
+    return dt1, dt2
+
+
+
+def lepes_cache_benchmark(n=50):
+    '''
+    poly_gen_pipeline lépés cache-sel: hideg futás, ugyanaz újra, késői paraméter (MIN_AREA, SNAP_TOL) változtatása
+    '''
+
+    with tempfile.TemporaryDirectory() as mappa:
+        path = os.path.join(mappa, 'kivonat.gpkg')
+        kivonat_iras(*_minta_halozat(n, 1, 1), path)
+        cache_dir = os.path.join(mappa, 'lepes_cache')
+
+        futasok = [("hideg", {}), ("ugyanaz", {}), ("MIN_AREA", {"MIN_AREA": 3000}),
+                   ("SNAP_TOL", {"MIN_AREA": 3000, "SNAP_TOL": 2.0})]
+        eredmenyek = {}
+        for nev, param in futasok:
+            futtato = LepesFuttato(cache_dir)
+            t0 = time.perf_counter()
+            eredmenyek[nev] = poly_gen_pipeline("Telepules0_0", futtato=futtato, kivonat=path, **param)
+            dt = time.perf_counter() - t0
+            df = pd.DataFrame(futtato.sorok)
+            futtatva = df.loc[~df["talalat"], "lepes"].tolist()
+            print(f'{nev}: {dt:.2f} s, újrafuttatva: {futtatva or "-"}')
+            eredmenyek[nev + "_futtatva"] = futtatva
+
+        # cache nélkül ugyanaz jön ki
+        referencia = poly_gen_pipeline("Telepules0_0", kivonat=path, MIN_AREA=3000, SNAP_TOL=2.0)
+
+    assert eredmenyek["ugyanaz_futtatva"] == []
+    assert eredmenyek["MIN_AREA_futtatva"] == ["egyesites"]
+    assert eredmenyek["SNAP_TOL_futtatva"] == ["kapcsolas", "egyesites"]
+    assert eredmenyek["hideg"].geometry.geom_equals(eredmenyek["ugyanaz"].geometry).all()
+    assert referencia.geometry.geom_equals(eredmenyek["SNAP_TOL"].geometry).all()
+
+
+
+def _lepes_kulcs_modulok(mappa, hasznalt="return x + 1", nem_hasznalt="return 0", TUR=1.0):
+    # két ideiglenes helyi modul: a lepes_fn a seged egyik függvényét és egy konstansát használja, a másikat nem
+    with open(os.path.join(mappa, "kulcs_seged.py"), "w") as f:
+        f.write(f"TUR = {TUR}\n\n\ndef hasznalt(x):\n    {hasznalt}\n\n\ndef nem_hasznalt():\n    {nem_hasznalt}\n")
+    with open(os.path.join(mappa, "kulcs_lepes.py"), "w") as f:
+        f.write("import kulcs_seged\nfrom kulcs_seged import TUR\n\n\n"
+                "def lepes_fn(x):\n    return kulcs_seged.hasznalt(x) * TUR\n")
+
+    for m in ("kulcs_seged", "kulcs_lepes"):
+        sys.modules.pop(m, None)
+    importlib.invalidate_caches()
+    sys.path.insert(0, mappa)
+    try:
+        return fuggveny_verzio(importlib.import_module("kulcs_lepes").lepes_fn)
+    finally:
+        sys.path.remove(mappa)
+
+
+def lepes_kulcs_ellenorzes():
+    '''
+    fuggveny_verzio: egy lépés kulcsa csak a ténylegesen hivatkozott helyi függvényektől / konstansoktól függ,
+    és a valódi lépések kulcsa mennyi idő
+    '''
+
+    with tempfile.TemporaryDirectory() as mappa:
+        alap = _lepes_kulcs_modulok(mappa)
+        assert _lepes_kulcs_modulok(mappa) == alap
+        # nem használt függvény módosítása: a kulcs marad
+        assert _lepes_kulcs_modulok(mappa, nem_hasznalt="return 1") == alap
+        # használt függvény vagy konstans módosítása: új kulcs
+        assert _lepes_kulcs_modulok(mappa, hasznalt="return x + 2") != alap
+        assert _lepes_kulcs_modulok(mappa, TUR=2.0) != alap
+
+    for fn in (letoltes, orange_gen, blue_gen, kapcsolas, egyesites):
+        t0 = time.perf_counter()
+        fuggveny_verzio(fn)
+        print(f'{fn.__name__}: kulcs {1000 * (time.perf_counter() - t0):.1f} ms')
+
+
+
+def _orange_gen_regi(Gp, nodes, edges, MAX_EXT=200.0, EPS=0.25, MIN_SEG=0.1):
+    '''
+    NARANCS (dead-end -> következő utca)
+    '''
+
+    deg = dict(Gp.to_undirected().degree())
+    dead = nodes.loc[[n for n, d in deg.items() if d == 1]].copy()
+
+    def _pts(geom):
+        if geom.is_empty:
+            return []
+        t = geom.geom_type
+        if t == "Point":
+            return [geom]
+        if t == "MultiPoint":
+            return list(geom.geoms)
+        if t == "LineString":
+            return [Point(geom.coords[0]), Point(geom.coords[-1])]
+        if t in ("MultiLineString", "GeometryCollection"):
+            out = []
+            for gg in geom.geoms:
+                out += _pts(gg)
+            return out
+        return []
+
+    def _ray_from_deadend(node_id):
+        pt = nodes.loc[node_id].geometry
+
+        elist = list(Gp.edges(node_id, keys=True, data=True))
+        if not elist:
+            elist = list(Gp.in_edges(node_id, keys=True, data=True))
+        if not elist:
+            return None, None
+
+        u, v, k, data = elist[0]
+        geom = data.get("geometry")
+        if geom is None:
+            other = v if u == node_id else u
+            geom = LineString([pt, nodes.loc[other].geometry])
+
+        c = list(geom.coords)
+        if len(c) < 2:
+            return None, None
+
+        a0, a1 = Point(c[0]), Point(c[-1])
+        if pt.distance(a0) <= pt.distance(a1):
+            a, b = c[0], c[1]
+        else:
+            a, b = c[-1], c[-2]
+
+        dx, dy = (a[0] - b[0], a[1] - b[1])  # kifelé
+        n = (dx * dx + dy * dy) ** 0.5
+        if n == 0:
+            return None, None
+
+        far = Point(pt.x + dx / n * MAX_EXT, pt.y + dy / n * MAX_EXT)
+        return pt, LineString([pt, far])
+
+    sidx_edges = edges.sindex
+    orange = []
+
+    for node_id in dead.index:
+        pt, ray = _ray_from_deadend(node_id)
+        if ray is None:
+            continue
+
+        cand = edges.iloc[list(sidx_edges.intersection(ray.bounds))]
+
+        best_p, best_s = None, np.inf
+        for (eu, ev, ek), row in cand.iterrows():
+            if node_id in (eu, ev):
+                continue
+            inter = ray.intersection(row.geometry)
+            for p in _pts(inter):
+                s = ray.project(p)
+                if s <= EPS or s >= best_s:
+                    continue
+                best_s, best_p = s, p
+
+        if best_p is not None:
+            seg = LineString([pt, best_p])
+            if seg.length > MIN_SEG:
+                orange.append(seg)
+
+    return gpd.GeoSeries(orange, crs=nodes.crs)
+
+
+def _geoseries_egyezik(a, b, tol=1e-6):
+    return len(a) == len(b) and bool(a.geom_equals_exact(b.set_axis(a.index), tolerance=tol).all())
+
+
+def orange_gen_benchmark(n=300, hiany=0.3):
+    '''
+    orange_gen: régi (zsákutcánként iterrows) vs. kötegelt, nagy városnyi szintetikus hálózaton
+    '''
+
+    G, _, _ = _minta_halozat(n, 1, 1, hiany=hiany)
+    # görbe élek is legyenek (több pontú geometria)
+    for u, v, k, data in G.edges(keys=True, data=True):
+        if (u + v) % 3 == 0:
+            (x0, y0), (x1, y1) = data["geometry"].coords
+            data["geometry"] = LineString([(x0, y0), ((x0 + x1) / 2 + 0.0001, (y0 + y1) / 2 + 0.0001), (x1, y1)])
+    Gp = ox.project_graph(G)
+    nodes, edges = ox.graph_to_gdfs(Gp, nodes=True, edges=True)
+
+    t0 = time.perf_counter()
+    regi = _orange_gen_regi(Gp, nodes, edges)
+    dt_regi = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    uj = orange_gen(Gp, nodes, edges)
+    dt_uj = time.perf_counter() - t0
+
+    assert _geoseries_egyezik(regi, uj) and regi.crs == uj.crs
+
+    print(f'orange_gen ({len(nodes)} node, {len(uj)} szakasz): régi {dt_regi:.2f} s, kötegelt {dt_uj:.2f} s, '
+          f'gyorsulás: {dt_regi / dt_uj:.0f}x')
+
+    return dt_regi, dt_uj
+
+
+
+def _blue_gen_regi(nodes, boundary, DIST_LIM=100.0, MIN_SEG=0.1):
+    '''
+    KÉK (node -> lakóhatár, ha közel van)
+    '''
+
+    blue = []
+    for _, row in nodes.iterrows():
+        pt = row.geometry
+        d = pt.distance(boundary)
+        if np.isfinite(d) and d <= DIST_LIM:
+            _, near = nearest_points(pt, boundary)
+            if near is not None and (not near.is_empty):
+                seg = LineString([pt, near])
+                if seg.length > MIN_SEG:
+                    blue.append(seg)
+
+    return gpd.GeoSeries(blue, crs=nodes.crs)
+
+
+def blue_gen_benchmark(n=300, regi_minta=3000):
+    '''
+    blue_gen: régi (node-onként distance + nearest_points a teljes határra) vs. STRtree query_nearest.
+    A régit regi_minta node-on futtatom (egyezés ellenőrzés), az idejét a teljes node számra vetítem.
+    '''
+
+    G, res, _ = _minta_halozat(n, 1, 1, hiany=0.1)
+    Gp = ox.project_graph(G)
+    nodes, edges = ox.graph_to_gdfs(Gp, nodes=True, edges=True)
+    res_p = res.to_crs(nodes.crs)
+    # zajos (sok csúcsú) lakóterület határ
+    res_p["geometry"] = res_p.geometry.buffer(7, quad_segs=16).simplify(0.5)
+    boundary = unary_union(res_p.geometry.values).boundary
+
+    minta = nodes.sample(regi_minta, random_state=0).sort_index()
+
+    t0 = time.perf_counter()
+    regi = _blue_gen_regi(minta, boundary)
+    dt_regi = (time.perf_counter() - t0) * len(nodes) / len(minta)
+
+    assert _geoseries_egyezik(regi, blue_gen(minta, boundary))
+
+    t0 = time.perf_counter()
+    uj = blue_gen(nodes, boundary)
+    dt_uj = time.perf_counter() - t0
+
+    print(f'blue_gen ({len(nodes)} node, {len(shapely.get_coordinates(boundary))} határpont, {len(uj)} szakasz): '
+          f'régi ~{dt_regi:.1f} s (becsült), STRtree {dt_uj:.2f} s, gyorsulás: ~{dt_regi / dt_uj:.0f}x')
+
+    return dt_regi, dt_uj
+
+
+
+def _dedup_points_regi(points, eps):
+    kept = []
+    for p in points:
+        ok = True
+        for q in kept:
+            if p.distance(q) <= eps:
+                ok = False
+                break
+        if ok:
+            kept.append(p)
+    return kept
+
+
+def dedup_points_benchmark(meretek=(500, 1000, 2000, 4000, 16_000, 64_000, 256_000), regi_max=4000, eps=1.0):
+    '''
+    dedup_points skálázódás: páronkénti (régi, O(n²)) vs. KD-fa, növekvő végpontszámra
+    (lakóhatár menti strip végpontjai: hosszú vonal mentén sűrűsödő, részben egybeeső pontok).
+    Utána a connector építés: végpontonkénti distance + nearest_points vs. kötegelt.
+    '''
+
+    rnd = np.random.default_rng(0)
+    for n in meretek:
+        # pontok egy n/2 m hosszú határ mentén, párokban (két szakasz közös végpontja) és zajjal
+        s = rnd.uniform(0, n / 2, n // 2)
+        xy = np.column_stack([s, np.sin(s / 50) * 20 + rnd.normal(0, 2, len(s))])
+        xy = np.concatenate([xy, xy + rnd.normal(0, 0.3, xy.shape)])[rnd.permutation(len(xy) * 2)]
+        pts = list(shapely.points(xy))
+
+        t0 = time.perf_counter()
+        uj = dedup_points(pts, eps)
+        dt_uj = time.perf_counter() - t0
+
+        if n <= regi_max:
+            t0 = time.perf_counter()
+            regi = _dedup_points_regi(pts, eps)
+            dt_regi = time.perf_counter() - t0
+            assert [p.wkb for p in regi] == [p.wkb for p in uj]
+            print(f'dedup_points n={n}: megtartva {len(uj)}, régi {dt_regi:.3f} s, KD-fa {dt_uj:.4f} s, '
+                  f'gyorsulás: {dt_regi / dt_uj:.0f}x')
+        else:
+            print(f'dedup_points n={n}: megtartva {len(uj)}, KD-fa {dt_uj:.3f} s')
+
+    # connectorok: boundary a pontok mellett
+    boundary = LineString(np.column_stack([np.linspace(0, 2000, 4001), np.sin(np.linspace(0, 2000, 4001) / 50) * 20 + 5]))
+    pts = dedup_points(list(shapely.points(xy[:20_000])), eps)
+
+    t0 = time.perf_counter()
+    regi = []
+    for p in pts:
+        d = p.distance(boundary)
+        if np.isfinite(d) and (1e-9 < d <= 12.0):
+            _, q = nearest_points(p, boundary)
+            seg = LineString([p, q])
+            if seg.length > 1e-6:
+                regi.append(seg)
+    dt_regi = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    _, segs, d = _legkozelebbi_vonalak(np.asarray(pts, dtype=object), boundary, 12.0)
+    uj = segs[(d > 1e-9) & (shapely.length(segs) > 1e-6)]
+    dt_uj = time.perf_counter() - t0
+
+    assert _geoseries_egyezik(gpd.GeoSeries(regi), gpd.GeoSeries(uj))
+    print(f'connectorok ({len(pts)} végpont, {len(uj)} connector): régi {dt_regi:.2f} s, kötegelt {dt_uj:.3f} s')
+
+
+def _egyesites_regi(network_gs_proj, MIN_AREA=5000, MAX_STEPS=20000):
+    '''
+    MIN_AREA m2: ez alatt beolvasztjuk
+    MAX_STEPS biztonsági limit (nagy hálónál se szálljon el)
+    '''
+
+    # 1. A vonalhálót poligonokká alakítom
+
+    linework = unary_union([g for g in network_gs_proj.geometry if g is not None and (not g.is_empty)])
+    polys = list(polygonize(linework))
+
+    if not polys:
+        raise RuntimeError("polygonize nem adott vissza poligonokat (nincs elég zárt hurok / noding probléma).")
+
+    polygons_gdf = gpd.GeoDataFrame(geometry=polys, crs=network_gs_proj.crs).reset_index(drop=True)
+
+    # tisztítás
+    # buffer(0) itt csak validálásra: nem használunk toleranciás szomszédkeresést!
+    polygons_gdf["geometry"] = polygons_gdf.geometry.buffer(0)
+    polygons_gdf = polygons_gdf[polygons_gdf.geometry.type.isin(["Polygon", "MultiPolygon"])].reset_index(drop=True)
+
+    # eredeti lefedettség (ellenőrzéshez)
+    orig_union = unary_union(polygons_gdf.geometry)
+
+    # ------------------------------------------------------------
+    # 2. KICS I POLIGONOK BEOLVASZTÁSA (EGYENKÉNT)
+    #    - csak VALÓDI szomszéd: közös határhossz > 0
+    #    - cél: akivel a leghosszabb a közös határ
+
+    pg = polygons_gdf.copy().reset_index(drop=True)
+
+    def shared_boundary_length(a, b):
+        inter = a.boundary.intersection(b.boundary)
+        return getattr(inter, "length", 0.0)
+
+    steps = 0
+    while steps < MAX_STEPS:
+        steps += 1
+
+        areas = pg.geometry.area
+        small_idx = areas[areas < MIN_AREA].index.tolist()
+        if not small_idx:
+            break
+
+        # mindig a legkisebbet olvasztjuk be először (stabilabb)
+        i = min(small_idx, key=lambda k: areas.iloc[k])
+        gi = pg.geometry.iloc[i]
+
+        # szomszédkeresés bbox + valódi közös határ
+        sidx = pg.sindex
+        cand = list(sidx.intersection(gi.bounds))
+        cand = [j for j in cand if j != i]
+
+        best_j = None
+        best_len = 0.0
+
+        for j in cand:
+            gj = pg.geometry.iloc[j]
+            L = shared_boundary_length(gi, gj)
+            if L > best_len:
+                best_len = L
+                best_j = j
+
+        # Ha nincs valódi szomszéd közös éllel, akkor nem tudjuk szabályosan beolvasztani
+        # (ez tipikusan azt jelenti, hogy a polygonize partícióban van mikro rés / diszkontinuitás)
+        if best_j is None or best_len <= 0:
+            print(f"[STOP] Kicsi poligon ({i}, area={areas.iloc[i]:.6f}) nem talál valódi szomszédot közös éllel.")
+            break
+
+        # olvasztás: i -> best_j
+        new_geom = unary_union([gi, pg.geometry.iloc[best_j]]).buffer(0)
+
+        # frissítés: célpoligon helyére új geom, kicsit eldobjuk
+        pg.at[best_j, "geometry"] = new_geom
+
+        pg = pg.drop(index=i).reset_index(drop=True)  # !!!!
+
+    # ------------------------------------------------------------
+    # 3) ELLENŐRZÉS: nincs átfedés, nincs területvesztés
+
+    final_union = unary_union(pg.geometry)
+
+    symdiff_area = float(orig_union.symmetric_difference(final_union).area)  # ha > 0, akkor vesztés/hozzáadás történt
+    print("Ellenőrzés: symmetric_difference area (terület eltérés):", symdiff_area)
+
+    return pg
+
+
+def _minta_particio(n, seed=0, meret=3000.0):
+    # véletlen Voronoi felosztás határvonalai (vonalháló, mint a kapcsolas kimenete), méteres CRS-ben
+    rnd = np.random.default_rng(seed)
+    pts = shapely.multipoints(rnd.uniform(0, meret, (n, 2)))
+    keret = box(0, 0, meret, meret)
+    cellak = shapely.get_parts(shapely.voronoi_polygons(pts, extend_to=keret))
+    vonalak = shapely.boundary(shapely.intersection(cellak, keret))
+    return gpd.GeoSeries(vonalak, crs="EPSG:23700")
+
+
+def egyesites_benchmark(meretek=(500, 1000, 2000), MIN_AREA=None):
+    '''
+    egyesites: minden lépésben újraépített térbeli index + teljes geometria unió (régi) vs.
+    egyszer felépített szomszédsági gráf + kupac, unió csak a végén. Véletlen Voronoi felosztáson
+    (nincs egyenlő terület / határhossz), az eredménynek ugyanannak kell lennie.
+    '''
+
+    for n in meretek:
+        network = _minta_particio(n)
+        # a poligonok kb. fele kicsi
+        min_area = MIN_AREA or 3000.0 ** 2 / n
+
+        t0 = time.perf_counter()
+        regi = _egyesites_regi(network, MIN_AREA=min_area)
+        dt_regi = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        uj = egyesites(network, MIN_AREA=min_area)
+        dt_uj = time.perf_counter() - t0
+
+        assert len(regi) == len(uj)
+        assert shapely.equals(shapely.normalize(regi.geometry.values), shapely.normalize(uj.geometry.values)).all()
+        print(f'egyesites n={n}: {len(uj)} poligon marad, régi {dt_regi:.2f} s, gráf + kupac {dt_uj:.2f} s, '
+              f'gyorsulás: {dt_regi / dt_uj:.1f}x')
+
+
+def _poligonok_elterese(a, b):
+    # két poligon halmaz párosítva (belső pont szerint), a legnagyobb relatív szimmetrikus differencia terület
+    a, b = a.geometry.values, b.geometry.values
+    assert len(a) == len(b)
+    ai, bi = shapely.STRtree(b).query(shapely.point_on_surface(a), predicate="within")
+    assert len(ai) == len(a) and len(np.unique(bi)) == len(b)
+    return float((shapely.area(shapely.symmetric_difference(a[ai], b[bi])) / shapely.area(a[ai])).max())
+
+
+def csempezes_benchmark(n_particio=8000, TILE_SIZE=800, n_halozat=100, max_workers=None):
+    '''
+    egyesites vs. egyesites_csempezve (Voronoi felosztáson), kapcsolas vs. kapcsolas_foltonkent
+    (szintetikus hálózaton, egymástól távoli lakott foltokkal). Az eredmény ugyanaz a poligon halmaz
+    (a csempehatárokon lebegőpontos pontossággal), a sorrend eltérhet.
+    '''
+
+    network = _minta_particio(n_particio)
+    min_area = 3000.0 ** 2 / n_particio
+
+    t0 = time.perf_counter()
+    egesz = egyesites(network, MIN_AREA=min_area)
+    dt_egesz = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    csempe = egyesites_csempezve(network, MIN_AREA=min_area, TILE_SIZE=TILE_SIZE, max_workers=max_workers)
+    dt_csempe = time.perf_counter() - t0
+
+    print(f'egyesites ({n_particio} poligon, {len(csempe_racs(network.total_bounds, TILE_SIZE))} csempe): '
+          f'egyben {dt_egesz:.2f} s, csempézve {dt_csempe:.2f} s, '
+          f'max. relatív eltérés: {_poligonok_elterese(egesz, csempe):.1e}')
+
+    # pontosan csempehatáron futó utca (x=250, a külső keret -1-ről indul): a két oldala nem varródhat össze
+    racs = gpd.GeoSeries([LineString([(x, 0), (x, 1000)]) for x in range(0, 1001, 50)] +
+                         [LineString([(0, y), (1000, y)]) for y in range(0, 1001, 50)], crs="EPSG:23700")
+    assert len(egyesites_csempezve(racs, MIN_AREA=0, TILE_SIZE=251, max_workers=1)) == len(egyesites(racs, MIN_AREA=0))
+
+    with tempfile.TemporaryDirectory() as mappa:
+        path = os.path.join(mappa, 'kivonat.gpkg')
+        kivonat_iras(*_minta_halozat(n_halozat, 1, 1, hiany=0.2), path)
+        Gp, nodes, edges, res_p, city_boundary = letoltes("Telepules0_0", kivonat=path)
+
+    # a lakott tömbök közti rés 7.5 m -> összehúzva ~30 m, így a foltok függetlenek
+    res_area, boundary = res_area_es_boundary(vag_residential_city(res_p, city_boundary), edges)
+    res_area = unary_union(shapely.buffer(shapely.get_parts(res_area), -10, join_style="mitre"))
+    boundary = res_area.boundary
+    orange, blue = orange_gen(Gp, nodes, edges), blue_gen(nodes, boundary)
+
+    t0 = time.perf_counter()
+    egesz = kapcsolas(edges, orange, blue, res_area, VEGPONT_SNAP=1e-6)
+    dt_egesz = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    foltonkent = kapcsolas_foltonkent(edges, orange, blue, res_area, max_workers=max_workers)
+    dt_folt = time.perf_counter() - t0
+
+    assert unary_union(egesz.values).equals(unary_union(foltonkent.values))
+    print(f'kapcsolas ({len(edges)} él, {len(foltcsoportok(res_area, 12.0))} foltcsoport): egyben {dt_egesz:.2f} s, '
+          f'foltonként {dt_folt:.2f} s')
+
+
+def _pontok_polygonban_regi(gdf, gdf_szigetek, max_depth=25):
+    '''
+    Végigmegy minden poligonon, megkeresi a pontokat, és:
+      - ha több szavazókör van egy poligonon belül -> print és skip
+      - ha egyetlen szavazókör van -> results (GeoDataFrame) sorba menti:
+          geometry (poligon), szavazokorid, color
+    '''
+
+    # Biztonsági ellenőrzés
+    if gdf.crs is None or gdf_szigetek.crs is None:
+        raise ValueError("Mindkét GeoDataFrame-nek kell legyen CRS-e")
+
+    # CRS egységesítés
+    if gdf.crs != gdf_szigetek.crs:
+        gdf = gdf.to_crs(gdf_szigetek.crs)
+
+    # Ebbe gyűjtjük a "jó" poligonokat (amiknél 1 db szavazókör azonosítható)
+    rows = []
+
+    # Végigmegyünk az összes poligonon
+
+    for poly_idx, poly_row in gdf_szigetek.iterrows():
+        polygon_geom = poly_row.geometry
+
+        # Pontok a poligonon belül
+        inside_mask = gdf.within(polygon_geom)
+        points_inside = gdf[inside_mask].copy()
+
+        # Ha nincs pont, csak jelezzük és megyünk tovább
+        if len(points_inside) == 0:
+            # print(f"\nPoligon {poly_idx}: NINCS benne pont.")
+            rows.append({"szavazokorid": None, "color": None, "geometry": polygon_geom})
+            continue
+
+        # print(f"\nPoligon {poly_idx}: {len(points_inside)} pont található benne.")
+
+        # Egyedi szavazókörök a poligonon belül
+        unique_szavazokorok = points_inside["szavazokorid"].dropna().unique()
+
+        if len(unique_szavazokorok) != 1:
+            # print("több szavazókörhöz tartozik")
+
+            # meghívom a poly-n a rekúriv függvényt
+            rows_darabok = poligon_szk_fuggvenyek.polygon_tobb_szavazokor(polygon_geom, points_inside, max_depth=max_depth)
+            rows.extend(rows_darabok)
+            continue
+
+        # Ha ide jutunk, akkor pontosan 1 szavazókör van
+        szavazokorid_value = unique_szavazokorok[0]
+
+        # Color: azonos (a szavazókörhöz)
+        color_value = points_inside.iloc[0]["color"]
+
+        # Mentjük a poligont a hozzárendelt szavazokorid-val és colorral
+        rows.append({
+            "szavazokorid": szavazokorid_value,
+            "color": color_value,
+            "geometry": polygon_geom
+        })
+
+    # Results GeoDataFrame
+    results = gpd.GeoDataFrame(rows, geometry="geometry", crs=gdf_szigetek.crs)
+
+    return results
+
+
+def _minta_cimpontok(szigetek, n=20_000, szk=40, seed=0):
+    # címpontok a felosztás területén, szavazókör: a legközelebbi szk központ (néhány hiányzó azonosító),
+    # pár pont pontosan poligon határon
+    rnd = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = szigetek.total_bounds
+    xy = rnd.uniform((minx, miny), (maxx, maxy), (n, 2))
+    kozep = rnd.uniform((minx, miny), (maxx, maxy), (szk, 2))
+    szkid = ((xy[:, None, :] - kozep[None]) ** 2).sum(axis=2).argmin(axis=1).astype(float)
+    szkid[rnd.random(n) < 0.01] = np.nan
+
+    hatar = shapely.get_coordinates(szigetek.geometry.values[:50].boundary)[::7]
+    xy = np.concatenate([xy, hatar])
+    szkid = np.concatenate([szkid, rnd.integers(0, szk, len(hatar))])
+
+    gdf = gpd.GeoDataFrame({"szavazokorid": szkid}, geometry=shapely.points(xy), crs=szigetek.crs)
+    return poligon_szk_fuggvenyek.add_color_to_gdf(gdf)
+
+
+def pontok_polygonban_benchmark(n_poly=3000, n_pont=20_000):
+    '''
+    pontok_polygonban: poligononként within a teljes ponthalmazra (régi) vs. egy sjoin + groupby besorolás
+    '''
+
+    szigetek = gpd.GeoDataFrame(geometry=list(polygonize(unary_union(_minta_particio(n_poly).values))), crs="EPSG:23700")
+    gdf = _minta_cimpontok(szigetek, n_pont)
+
+    t0 = time.perf_counter()
+    regi = _pontok_polygonban_regi(gdf, szigetek)
+    dt_regi = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    uj = pontok_polygonban(gdf, szigetek)
+    dt_uj = time.perf_counter() - t0
+
+    assert len(regi) == len(uj) and regi.geometry.geom_equals_exact(uj.geometry, 0).all()
+    pd.testing.assert_frame_equal(pd.DataFrame(regi.drop(columns="geometry")), pd.DataFrame(uj.drop(columns="geometry")))
+
+    print(f'pontok_polygonban ({n_poly} poligon, {len(gdf)} pont, {len(uj)} sor): régi {dt_regi:.2f} s, '
+          f'sjoin {dt_uj:.2f} s, gyorsulás: {dt_regi / dt_uj:.0f}x')
+
+
+def _polygon_tobb_szavazokor_regi(polygon_geom, points_inside, max_depth=25):
+    rows = []
+    queue = [(polygon_geom, points_inside, 0)]
+    while queue:
+        poly, pts, depth = queue.pop()
+        if depth >= max_depth:
+            print('Elérte a poly a mélységi szintet!')
+            continue
+        for darab in poligon_szk_fuggvenyek.felez(poly):
+            darab_pts = poligon_szk_fuggvenyek.pontok_poligonban(pts, darab)
+            if len(darab_pts) == 0:
+                rows.append({"szavazokorid": None, "color": None, "geometry": darab})
+                continue
+            uniq = poligon_szk_fuggvenyek.szavazokorok_szama(darab_pts)
+            if len(uniq) == 1:
+                rows.append({"szavazokorid": uniq[0], "color": darab_pts.iloc[0]["color"], "geometry": darab})
+                continue
+            queue.append((darab, darab_pts, depth + 1))
+    return rows
+
+
+def polygon_tobb_szavazokor_benchmark(n_poly=40, n_pont=40_000, max_depth=25):
+    '''
+    polygon_tobb_szavazokor: GeoDataFrame within + copy szintenként (régi) vs. koordináta tömbök oldal szerinti
+    szétosztással (ugyanaz az eredmény), és a súlyozott medián vágás (kevesebb darab / szint).
+    '''
+
+    szigetek = gpd.GeoDataFrame(geometry=list(polygonize(unary_union(_minta_particio(n_poly).values))), crs="EPSG:23700")
+    gdf = _minta_cimpontok(szigetek, n_pont)
+    gdf = gdf[gdf["szavazokorid"].notna()]
+
+    polyk = szigetek.geometry.values
+    par = gpd.sjoin(gdf, szigetek, predicate="within")
+    bemenet = [(polyk[i], grp) for i, grp in par.drop(columns="index_right").groupby(par["index_right"])
+               if grp["szavazokorid"].nunique() > 1]
+
+    eredmeny = {}
+    for nev, fn in (("régi", _polygon_tobb_szavazokor_regi),
+                    ("tömbös", lambda p, g: polygon_tobb_szavazokor(p, g, max_depth=max_depth)),
+                    ("medián", lambda p, g: polygon_tobb_szavazokor(p, g, max_depth=max_depth, vagas="median"))):
+        t0 = time.perf_counter()
+        eredmeny[nev] = [fn(p, g) for p, g in bemenet]
+        eredmeny[nev + "_ido"] = time.perf_counter() - t0
+
+    regi, uj = sum(eredmeny["régi"], []), sum(eredmeny["tömbös"], [])
+    assert len(regi) == len(uj)
+    assert all(a["geometry"].equals_exact(b["geometry"], 0) and a["color"] == b["color"] and
+               (a["szavazokorid"] == b["szavazokorid"] or a["szavazokorid"] is b["szavazokorid"] is None)
+               for a, b in zip(regi, uj))
+
+    # medián vágás: a darabok lefedik a poligont, és minden besorolt darabban csak egy szavazókör pontjai vannak
+    median = sum(eredmeny["medián"], [])
+    for (p, g), rows in zip(bemenet, eredmeny["medián"]):
+        assert abs(sum(r["geometry"].area for r in rows) - p.area) < 1e-6 * p.area
+        for r in rows:
+            if r["szavazokorid"] is not None:
+                bent = g[g.within(r["geometry"])]
+                assert (bent["szavazokorid"] == r["szavazokorid"]).all()
+
+    print(f'polygon_tobb_szavazokor ({len(bemenet)} kevert poligon, {sum(len(g) for _, g in bemenet)} pont): '
+          f'régi {eredmeny["régi_ido"]:.2f} s, tömbös {eredmeny["tömbös_ido"]:.2f} s '
+          f'({eredmeny["régi_ido"] / eredmeny["tömbös_ido"]:.0f}x), {len(uj)} darab; '
+          f'medián vágás {eredmeny["medián_ido"]:.2f} s, {len(median)} darab')
+
+
+def voronoi_felosztas_benchmark(n_poly=40, n_pont=40_000, max_depth=25):
+    '''
+    Kevert poligonok felosztása: felezés (polygon_tobb_szavazokor) vs. Voronoi (polygon_voronoi_felosztas):
+    idő, darabszám, mélységi limitbe futott poligonok. Voronoinál a darabok lefedik a poligont, és minden
+    pont a saját szavazókörének darabjába esik.
+    '''
+
+    szigetek = gpd.GeoDataFrame(geometry=list(polygonize(unary_union(_minta_particio(n_poly).values))), crs="EPSG:23700")
+    gdf = _minta_cimpontok(szigetek, n_pont)
+
+    polyk = szigetek.geometry.values
+    par = gpd.sjoin(gdf, szigetek, predicate="within")
+    bemenet = [(polyk[i], grp) for i, grp in par.drop(columns="index_right").groupby(par["index_right"])
+               if grp["szavazokorid"].nunique() > 1]
+
+    t0 = time.perf_counter()
+    felezes = [polygon_tobb_szavazokor(p, g, max_depth=max_depth) for p, g in bemenet]
+    dt_felezes = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    voronoi = [polygon_voronoi_felosztas(p, g) for p, g in bemenet]
+    dt_voronoi = time.perf_counter() - t0
+
+    for (p, g), rows in zip(bemenet, voronoi):
+        assert abs(sum(r["geometry"].area for r in rows) - p.area) < 1e-6 * p.area
+        d = gpd.GeoDataFrame(rows, geometry="geometry", crs=szigetek.crs)
+        j = gpd.sjoin(g[g["szavazokorid"].notna()], d, predicate="within")
+        assert (j["szavazokorid_left"] == j["szavazokorid_right"]).all()
+
+    # felezésnél a mélységi limitbe futott részek kimaradnak (lyuk a poligonban)
+    hiany = sum(p.area - sum(r["geometry"].area for r in rows) > 1e-9 * p.area for (p, _), rows in zip(bemenet, felezes))
+
+    print(f'kevert poligonok felosztása ({len(bemenet)} poligon, {sum(len(g) for _, g in bemenet)} pont): '
+          f'felezés {dt_felezes:.2f} s, {sum(map(len, felezes))} darab, {hiany} poligon hiányos (mélységi limit); '
+          f'Voronoi {dt_voronoi:.2f} s, {sum(map(len, voronoi))} darab')
+
+
+def _ures_polyk_besorolasa_regi(results):
+    """
+    Azokat a sorokat kezeli, ahol szavazokorid hiányzik (NaN/None):
+      - megkeresi a szomszédos poligonokat (touches: közös határ/pont érintés)
+      - a szomszédok szavazokorid-jai közül a leggyakoribbat választja
+      - beírja a hiányzó szavazokorid-t és a hozzá tartozó color-t (a nyertes szomszéd első colorja)
+
+    Megjegyzés:
+      - a "szomszéd" itt: geometriailag érintkező poligon (touches)
+      - döntetlen esetén: a leggyakoribbak közül az első (deterministikus sorrend szerint) kerül kiválasztásra
+    """
+
+    out = results.copy()
+
+    # Spatial index gyorsításhoz (olvasható marad, de nem lassú)
+    sindex = out.sindex
+
+    # Hiányzó szavazokorid sorok indexei (NaN is ide esik)
+    missing_idxs = out.index[out["szavazokorid"].isna()].tolist()
+
+    for idx in missing_idxs:
+        geom = out.at[idx, "geometry"]
+
+        # Jelöltek: bbox alapján (sindex), majd pontos szűrés touches-szal
+        candidate_idxs = list(sindex.intersection(geom.bounds))
+        candidates = out.loc[candidate_idxs]
+
+        neighbors = candidates[candidates.geometry.touches(geom)]
+
+        # Csak azok a szomszédok kellenek, ahol van szavazokorid
+        neighbors_labeled = neighbors[neighbors["szavazokorid"].notna()]
+
+        if len(neighbors_labeled) == 0:
+            # nincs kitől örökölni -> marad NaN/None
+            continue
+
+        # Szavazokorid többség meghatározása
+        counts = neighbors_labeled["szavazokorid"].value_counts()
+
+        winner_szavazokorid = counts.index[0]
+
+        # Color átvétele: az első olyan szomszédból, amelyik a nyertes szavazokorid
+        winner_color = neighbors_labeled.loc[
+            neighbors_labeled["szavazokorid"] == winner_szavazokorid, "color"
+        ].iloc[0]
+
+        out.at[idx, "szavazokorid"] = winner_szavazokorid
+        out.at[idx, "color"] = winner_color
+
+    return out
+
+
+def ures_polyk_benchmark(n_poly=6000, n_pont=1500):
+    '''
+    ures_polyk_besorolasa: poligononkénti touches egy menetben (régi) vs. egyszer felépített szomszédsági
+    gráf + szélességi terjesztés. Ritka címpontokkal sok (egymással is szomszédos) üres poligon van.
+    Ellenőrzés: a sorok keverése nem változtat az eredményen, és csak olyan poligon marad üres, amelynek
+    a komponensében nincs besorolt poligon.
+    '''
+
+    szigetek = gpd.GeoDataFrame(geometry=list(polygonize(unary_union(_minta_particio(n_poly).values))), crs="EPSG:23700")
+    gdf = _minta_cimpontok(szigetek, n_pont)
+    results = pontok_polygonban(gdf, szigetek, vagas="voronoi")
+
+    t0 = time.perf_counter()
+    regi = _ures_polyk_besorolasa_regi(results)
+    dt_regi = time.perf_counter() - t0
+
+    for suly in (None, "hossz"):
+        t0 = time.perf_counter()
+        uj = ures_polyk_besorolasa(results, suly=suly)
+        dt_uj = time.perf_counter() - t0
+
+        kevert = ures_polyk_besorolasa(results.sample(frac=1, random_state=1), suly=suly).loc[results.index]
+        assert uj["szavazokorid"].equals(kevert["szavazokorid"]) and uj["color"].equals(kevert["color"])
+
+        # üresen maradt: a komponensében nincs besorolt poligon
+        i, j = results.sindex.query(results.geometry, predicate="touches")
+        G = nx.Graph(list(zip(i.tolist(), j.tolist())))
+        G.add_nodes_from(range(len(results)))
+        cimkes = set(np.flatnonzero(results["szavazokorid"].notna().to_numpy()).tolist())
+        for k in np.flatnonzero(uj["szavazokorid"].isna().to_numpy()):
+            assert not cimkes & nx.node_connected_component(G, k)
+
+        print(f'ures_polyk_besorolasa ({len(results)} poligon, {int(results["szavazokorid"].isna().sum())} üres, '
+              f'suly={suly}): régi {dt_regi:.2f} s, {int(regi["szavazokorid"].isna().sum())} marad üresen; '
+              f'gráf {dt_uj:.2f} s, {int(uj["szavazokorid"].isna().sum())} marad üresen')
+
+
+def polygonok_egyesitese_benchmark(n_poly=3000, n_pont=6000, max_tol=20):
+    '''
+    polygonok_egyesitese: buffer+/- zárás (a teljes szavazókör geometrián) vs. hidak (minimális feszítőfa):
+    idő, több részből álló szavazókörök száma, torzítás (az eredeti darabok uniójához képest
+    hozzáadott / elvesztett terület)
+    '''
+
+    szigetek = gpd.GeoDataFrame(geometry=list(polygonize(unary_union(_minta_particio(n_poly).values))), crs="EPSG:23700")
+    gdf = _minta_cimpontok(szigetek, n_pont)
+    results = ures_polyk_besorolasa(pontok_polygonban(gdf, szigetek))
+    # hézagok a darabok között (mint a valódi hálóban az utcák), hogy legyen mit összekötni
+    results["geometry"] = results.geometry.buffer(-2, join_style="mitre")
+    results = results[~results.geometry.is_empty]
+
+    eredeti = results.dissolve("szavazokorid", dropna=False).geometry
+
+    for mod in ("zaras", "hid"):
+        t0 = time.perf_counter()
+        out = polygonok_egyesitese(results, start_tol=0.2, max_tol=max_tol, mod=mod)
+        dt = time.perf_counter() - t0
+
+        out = out.set_index("szavazokorid").geometry.loc[eredeti.index]
+        tobb = int((shapely.get_num_geometries(out.values) > 1).sum())
+        hozzaadott = float(shapely.area(shapely.difference(out.values, eredeti.values)).sum())
+        elveszett = float(shapely.area(shapely.difference(eredeti.values, out.values)).sum())
+
+        print(f'polygonok_egyesitese mod={mod} ({len(eredeti)} szavazókör, {len(results)} darab): {dt:.2f} s, '
+              f'több részből áll: {tobb}, hozzáadott terület: {hozzaadott:.0f} m2, elvesztett: {elveszett:.0f} m2')
+
+
+
+def geoparquet_benchmark(n=300_000, telepulesek=40, seed=0):
+    '''
+    Összekapcsolt pontok tárolása: GPKG (teljes írás / olvasás + szűrés) vs. particionált GeoParquet
+    (írás, egy település partíciójának olvasása, ugyanez bbox pushdownnal)
+    '''
+
+    rnd = np.random.default_rng(seed)
+    nevek = np.array([f'Település {i} ő' for i in range(telepulesek - 1)] + ['Szigetszentmiklós'])
+    t = rnd.integers(0, telepulesek, n)
+    # településenként külön 10 km-es négyzet, EOV körül
+    x = 600_000 + (t % 8) * 10_000 + rnd.uniform(0, 10_000, n)
+    y = 200_000 + (t // 8) * 10_000 + rnd.uniform(0, 10_000, n)
+    gdf = gpd.GeoDataFrame({
+        "telepulesnev_hu": nevek[t],
+        "date": np.where(rnd.random(n) < 0.5, '2022-04-03', '2024-06-09'),
+        "szavazokorid": pd.Series(rnd.integers(0, 20, n)).astype(str).values,
+        "cim": [f'Fő utca {i}' for i in range(n)],
+    }, geometry=gpd.points_from_xy(x, y), crs="EPSG:23700")
+
+    VAROS, DATE = 'Szigetszentmiklós', '2022-04-03'
+    elvart = gdf[(gdf["telepulesnev_hu"] == VAROS) & (gdf["date"] == DATE)]
+    minx, miny, _, _ = elvart.total_bounds
+    bbox = (minx, miny, minx + 2_000, miny + 2_000)
+
+    with tempfile.TemporaryDirectory() as mappa:
+        gpkg = os.path.join(mappa, 'pontok.gpkg')
+        t0 = time.perf_counter()
+        gdf.to_file(gpkg, layer='network_polygons', driver='GPKG')
+        dt_gpkg_ir = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        g = gpd.read_file(gpkg)
+        g = g[(g["telepulesnev_hu"] == VAROS) & (g["date"] == DATE)]
+        dt_gpkg_olv = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        mappak = particio_iras(gdf, 'pontok', gyoker=mappa)
+        dt_pq_ir = time.perf_counter() - t0
+
+        # félbeszakadt írás maradéka (ideiglenes mappa a partíció mellett): nem kerülhet az olvasásba
+        m = next(x for x in mappak if quote(VAROS, safe="") in x)
+        maradek = os.path.join(os.path.dirname(m), f".tmp999_{os.path.basename(m)}")
+        shutil.copytree(m, maradek)
+
+        # hiányzó partíció kulcs: hiba, nem csendes kihagyás
+        hianyos = gdf.head(10).copy()
+        hianyos.loc[hianyos.index[:3], "date"] = None
+        try:
+            particio_iras(hianyos, 'pontok', gyoker=mappa)
+            raise AssertionError("hiányzó partíció kulcs nem dobott hibát")
+        except ValueError:
+            pass
+
+        t0 = time.perf_counter()
+        p = particio_olvasas('pontok', gyoker=mappa, telepulesnev_hu=VAROS, date=DATE)
+        dt_pq_olv = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        pb = particio_olvasas('pontok', gyoker=mappa, bbox=bbox, telepulesnev_hu=VAROS, date=DATE)
+        dt_pq_bbox = time.perf_counter() - t0
+
+        part = particiok('pontok', gyoker=mappa)
+
+    # ugyanazok a sorok (a partíció oszlopok a végére kerülnek)
+    oszlopok = list(gdf.columns)
+    for x_ in (g, p):
+        x_ = x_[oszlopok].reset_index(drop=True)
+        assert x_.drop(columns="geometry").equals(elvart[oszlopok].drop(columns="geometry").reset_index(drop=True))
+        assert x_.geometry.geom_equals(elvart.geometry.reset_index(drop=True)).all()
+        assert x_.crs == gdf.crs
+    bent = elvart.geometry.intersects(box(*bbox))
+    assert sorted(pb["cim"]) == sorted(elvart.loc[bent, "cim"])
+    assert len(part) == gdf.groupby(["telepulesnev_hu", "date"]).ngroups and VAROS in set(part["telepulesnev_hu"])
+
+    print(f'geoparquet: {n} pont, {len(part)} partíció; írás GPKG {dt_gpkg_ir:.2f} s, GeoParquet {dt_pq_ir:.2f} s; '
+          f'egy település olvasása GPKG {dt_gpkg_olv:.2f} s, GeoParquet {dt_pq_olv:.3f} s, + bbox {dt_pq_bbox:.3f} s '
+          f'({len(pb)} pont)')
+
+    return dt_gpkg_ir, dt_pq_ir, dt_gpkg_olv, dt_pq_olv, dt_pq_bbox
+
+
+
+
+if __name__ == '__main__':
+    jsonl_iras_benchmark()
+    jsonl_load_benchmark()
+    cim_osztalyozas_benchmark()
+    normalizalas_benchmark()
+    norm_cache_benchmark()
+    utcacim_szabalyok_benchmark()
+    cimjegyzek_parquet_benchmark()
+    nominatim_benchmark()
+    osm_cache_benchmark()
+    orszagos_benchmark()
+    generalas_batch_benchmark()
+    lepes_cache_benchmark()
+    lepes_kulcs_ellenorzes()
+    orange_gen_benchmark()
+    blue_gen_benchmark()
+    dedup_points_benchmark()
+    egyesites_benchmark()
+    csempezes_benchmark()
+    pontok_polygonban_benchmark()
+    polygon_tobb_szavazokor_benchmark()
+    voronoi_felosztas_benchmark()
+    ures_polyk_benchmark()
+    polygonok_egyesitese_benchmark()
+    geoparquet_benchmark()
@@ -0,0 +1,161 @@
+import hashlib
+import inspect
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+
+'''
+Lemezen tárolt (sqlite) cache a string normalizáló függvényekhez.
+
+Kulcs: normalizáló neve + verzió + nyers string. A verziót a normalizáló függvény forráskódjából és a
+szabály táblákból (regexek, map-ek) számolom, így ha a szabályok változnak, a régi értékek automatikusan
+érvénytelenek lesznek (és törlődnek).
+
+Használat:
+cache = NormCache('../../adatok/working/norm_cache.sqlite')
+df = db_feldolgozas('../../adatok/fix/2006_tol_cimek.csv', cache=cache)
+cache.riport()
+'''
+
+
+
+def verzio(*reszek):
+    '''
+    Normalizáló verzió: hash a függvények forráskódjából és a szabályok repr-jéből
+    '''
+
+    h = hashlib.sha1()
+    for r in reszek:
+        if isinstance(r, (list, tuple)):
+            # pl. szabály lista: elemenként, hogy a benne lévő függvények is forráskód szerint számítsanak
+            h.update(verzio(*r).encode("utf-8"))
+        elif isinstance(r, dict):
+            h.update(verzio(*r.items()).encode("utf-8"))
+        elif callable(r) and not isinstance(r, type):
+            try:
+                h.update(inspect.getsource(r).encode("utf-8"))
+            except (OSError, TypeError):
+                # pl. notebookban definiált függvény vagy beépített
+                kod = getattr(r, "__code__", None)
+                h.update(repr((kod.co_code, kod.co_consts) if kod else r).encode("utf-8"))
+        else:
+            h.update(repr(r).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+
+class NormCache:
+    def __init__(self, path):
+        self.path = path
+        self.con = sqlite3.connect(path)
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS norm (nev TEXT, verzio TEXT, kulcs TEXT, ertek TEXT, PRIMARY KEY (nev, verzio, kulcs))")
+        self.con.execute("CREATE TABLE IF NOT EXISTS meta (nev TEXT PRIMARY KEY, verzio TEXT, mp_per_ertek REAL)")
+        self.con.commit()
+
+        # futásonkénti statisztika normalizálónként
+        self.stat = {}
+
+    def _verzio_ellenorzes(self, nev, ver):
+        # ha a normalizáló szabályai változtak, a régi verzió értékeit törlöm
+        row = self.con.execute("SELECT verzio FROM meta WHERE nev = ?", (nev,)).fetchone()
+        if row is not None and row[0] != ver:
+            print(f'Normalizáló cache érvénytelenítve ({nev}): szabályok változtak')
+            self.con.execute("DELETE FROM norm WHERE nev = ? AND verzio != ?", (nev, ver))
+            self.con.execute("DELETE FROM meta WHERE nev = ?", (nev,))
+            self.con.commit()
+
+    def _lekeres(self, nev, ver, kulcsok):
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS keres (kulcs TEXT PRIMARY KEY)")
+        self.con.execute("DELETE FROM keres")
+        self.con.executemany("INSERT OR IGNORE INTO keres VALUES (?)", ((k,) for k in kulcsok))
+        rows = self.con.execute(
+            "SELECT n.kulcs, n.ertek FROM norm n JOIN keres k ON n.kulcs = k.kulcs WHERE n.nev = ? AND n.verzio = ?",
+            (nev, ver)).fetchall()
+        return dict(rows)
+
+    def alkalmaz(self, s, fn, nev, ver):
+        '''
+        fn(pd.Series egyedi, még nem látott stringekkel) -> ugyanolyan hosszú eredmény
+
+        Csak az egyedi string értékeket normalizálja, és azok közül is csak azokat, amik még nincsenek a cache-ben.
+        Nem string értékből None lesz (mint a .str műveleteknél).
+
+        ver: kész verzió string, vagy a verzió részei (tuple, pl. a normalizáló függvények), ebből itt számolom
+        (így a hívó modulnak nem kell importálnia a norm_cache-t, elég a cache objektumot megkapnia)
+        '''
+
+        if not isinstance(ver, str):
+            ver = verzio(*ver)
+        self._verzio_ellenorzes(nev, ver)
+
+        kodok, egyedi = pd.factorize(s)
+        egyedi = np.asarray(egyedi, dtype=object)
+        str_mask = np.fromiter((isinstance(x, str) for x in egyedi), dtype=bool, count=len(egyedi))
+        kulcsok = egyedi[str_mask].tolist()
+
+        t0 = time.perf_counter()
+        talalt = self._lekeres(nev, ver, kulcsok)
+        dt_keres = time.perf_counter() - t0
+
+        hianyzo = [k for k in kulcsok if k not in talalt]
+
+        t0 = time.perf_counter()
+        if hianyzo:
+            uj = list(fn(pd.Series(hianyzo, dtype=object)))
+            uj = [None if (x is None or x is pd.NA or (isinstance(x, float) and np.isnan(x))) else x for x in uj]
+        else:
+            uj = []
+        dt_szamol = time.perf_counter() - t0
+
+        if hianyzo:
+            self.con.executemany("INSERT OR REPLACE INTO norm VALUES (?, ?, ?, ?)",
+                                 ((nev, ver, k, v) for k, v in zip(hianyzo, uj)))
+            # egy érték normalizálásának átlagos ideje (a megspórolt idő becsléséhez)
+            self.con.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, ?)", (nev, ver, dt_szamol / len(hianyzo)))
+            self.con.commit()
+            talalt.update(zip(hianyzo, uj))
+
+        row = self.con.execute("SELECT mp_per_ertek FROM meta WHERE nev = ?", (nev,)).fetchone()
+        mp_per_ertek = row[0] if row else 0.0
+
+        st = self.stat.setdefault(nev, {"egyedi": 0, "talalat": 0, "szamolt": 0, "ido": 0.0, "megsporolt": 0.0})
+        talalat = len(kulcsok) - len(hianyzo)
+        st["egyedi"] += len(kulcsok)
+        st["talalat"] += talalat
+        st["szamolt"] += len(hianyzo)
+        st["ido"] += dt_keres + dt_szamol
+        st["megsporolt"] += talalat * mp_per_ertek - dt_keres
+
+        tabla = np.empty(len(egyedi) + 1, dtype=object)
+        tabla[:] = None
+        tabla[:-1][str_mask] = [talalt[k] for k in kulcsok]
+
+        out = pd.Series(tabla[kodok], index=s.index, name=s.name, dtype=object)
+        return out if s.dtype == object else out.astype(s.dtype)
+
+    def riport(self):
+        '''
+        Találati arány és megspórolt idő normalizálónként (erre a futásra)
+        '''
+
+        rows = []
+        for nev, st in self.stat.items():
+            arany = st["talalat"] / st["egyedi"] if st["egyedi"] else 0.0
+            rows.append({"normalizalo": nev, **st, "talalati_arany": arany})
+            print(f'{nev}: {st["egyedi"]} egyedi érték, találati arány {100 * arany:.1f}%, '
+                  f'{st["szamolt"]} újraszámolva, idő {st["ido"]:.2f} s, megspórolva ~{st["megsporolt"]:.2f} s')
+
+        return pd.DataFrame(rows)
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
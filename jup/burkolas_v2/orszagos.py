@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+import geopandas as gpd
+import networkx as nx
+import osmnx as ox
+from shapely import make_valid
+
+from osm_cache import kivonat_teljes, kivonat_azonosito
+
+
+'''
+Országos előfeldolgozás: az úthálózatot és a lakott területeket egyszer töltöm be egyetlen helyi kivonatból
+(GeoPackage / .osm.pbf), egyszer projektálom, térbeli indexet építek rájuk, és ebből vágom ki településenként
+ugyanazt, amit a letoltes adna (memóriában, letöltés és újraprojektálás nélkül).
+
+Használat:
+orszag = OrszagosAdat('../../adatok/fix/hungary.gpkg')
+Gp, nodes, edges, res_p, city_boundary = letoltes('Dunaharaszti', orszagos=orszag)
+'''
+
+
+
+class OrszagosAdat:
+    def __init__(self, kivonat, to_crs=None, verbose=True):
+        '''
+        to_crs: közös méteres vetület (alapból az osmnx által választott UTM zóna, pl. EPSG:23700 is megadható)
+        '''
+
+        t0 = time.perf_counter()
+        G, res, boundaries = kivonat_teljes(kivonat)
+
+        # stabil azonosító (pl. lépés cache kulcshoz)
+        self.azonosito = [kivonat_azonosito(kivonat), str(to_crs)]
+
+        # vágáshoz a vetítetlen koordinátákat használom (mint a graph_from_place / features_from_place)
+        nodes_4326 = ox.graph_to_gdfs(G, nodes=True, edges=False)
+
+        self.Gp = ox.project_graph(G, to_crs=to_crs)
+        self.nodes, self.edges = ox.graph_to_gdfs(self.Gp, nodes=True, edges=True)
+        self.crs = self.nodes.crs
+
+        res = res[res.geometry.type.isin(["Polygon", "MultiPolygon"])]
+        self.res_p = res.to_crs(self.crs)
+
+        self.hatarok = boundaries.drop_duplicates("place").set_index("place").to_crs(epsg=4326)
+
+        # térbeli indexek (STRtree) a vetítetlen pontokra és lakott területekre
+        self._pontok = gpd.GeoSeries(nodes_4326.geometry.reindex(self.nodes.index).values, crs="EPSG:4326")
+        self._pontok_sidx = self._pontok.sindex
+        self._res = gpd.GeoSeries(res.geometry.values, crs=res.crs).to_crs(epsg=4326)
+        self._res_sidx = self._res.sindex
+
+        self._node_id = self.nodes.index.to_numpy()
+
+        # élek CSR szerkezetben a kezdő node pozíciója szerint: egy település éleit a saját node-jai alapján
+        # szedem ki, nem az országos tömbökön végigmenő np.isin-nel
+        self._u_pos = self.nodes.index.get_indexer(self.edges.index.get_level_values("u"))
+        self._v_pos = self.nodes.index.get_indexer(self.edges.index.get_level_values("v"))
+        self._el_rend = np.argsort(self._u_pos, kind="stable")
+        self._el_ptr = np.searchsorted(self._u_pos[self._el_rend], np.arange(len(self.nodes) + 1))
+
+        if verbose:
+            print(f'Országos adat betöltve: {len(self.nodes)} node, {len(self.edges)} él, {len(self.res_p)} lakott terület, '
+                  f'{len(self.hatarok)} határ ({time.perf_counter() - t0:.1f} s)')
+
+    @property
+    def helyek(self):
+        return list(self.hatarok.index)
+
+    def _hatar(self, PLACE):
+        if PLACE in self.hatarok.index:
+            return self.hatarok.geometry.loc[PLACE]
+        # "Dunaharaszti, Hungary" -> "Dunaharaszti"
+        nev = PLACE.split(",")[0].strip()
+        if nev in self.hatarok.index:
+            return self.hatarok.geometry.loc[nev]
+        raise RuntimeError(f"Nem lehet lekérni a hivatalos határt (nincs a kivonatban): {PLACE}")
+
+    def _elek(self, node_pos):
+        # azok az élek (pozíció, eredeti sorrendben), amiknek mindkét vége a node_pos (rendezett) node-ok között van
+        kezd, veg = self._el_ptr[node_pos], self._el_ptr[node_pos + 1]
+        db = veg - kezd
+        idx = np.repeat(kezd - np.cumsum(db) + db, db) + np.arange(db.sum())
+        el = self._el_rend[idx]
+        el = el[np.isin(self._v_pos[el], node_pos)]
+        return np.sort(el)
+
+    def telepules(self, PLACE):
+        '''
+        Ugyanaz a kimenet, mint a letoltes(PLACE): Gp, nodes, edges, res_p, city_boundary
+        '''
+
+        poly = make_valid(self._hatar(PLACE))
+
+        # node-ok a határon belül, ebből a legnagyobb (gyengén) összefüggő komponens
+        bent = np.sort(self._pontok_sidx.query(poly, predicate="intersects"))
+        if not len(bent):
+            raise RuntimeError(f"Nincs úthálózat a határon belül: {PLACE}")
+
+        sub = self.Gp.subgraph(self._node_id[bent])
+        komp = max(nx.weakly_connected_components(sub), key=len)
+
+        # a komponens node-jainak pozíciói (a komponens a határon belüli node-ok része, elég azokat nézni)
+        node_pos = bent[np.isin(self._node_id[bent], np.fromiter(komp, dtype=self._node_id.dtype, count=len(komp)))]
+        el_pos = self._elek(node_pos)
+        nodes = self.nodes.iloc[node_pos]
+        edges = self.edges.iloc[el_pos]
+
+        Gp = nx.MultiDiGraph(**self.Gp.graph)
+        Gp.add_nodes_from((n, dict(self.Gp.nodes[n])) for n in nodes.index)
+        Gp.add_edges_from((u, v, k, dict(self.Gp.edges[u, v, k])) for u, v, k in edges.index)
+
+        res_idx = np.sort(self._res_sidx.query(poly, predicate="intersects"))
+        if not len(res_idx):
+            raise RuntimeError("Nincs landuse=residential poligon ehhez a PLACE-hez az OSM-ben.")
+        res_p = self.res_p.iloc[res_idx].copy()
+
+        city_boundary = gpd.GeoSeries([poly], crs="EPSG:4326").to_crs(self.crs).iloc[0]
+        city_boundary = make_valid(city_boundary)
+
+        if city_boundary is None or city_boundary.is_empty:
+            raise RuntimeError("A városhatár projekció után üres/hibás lett.")
+
+        return Gp, nodes, edges, res_p, city_boundary
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import pandas as pd
+import geopandas as gpd
+import networkx as nx
+import osmnx as ox
+
+
+'''
+Lemezen tárolt cache a letoltes eredményéhez (projektált gráf, node / edge gdf, lakott terület, városhatár),
+és offline olvasás helyi kivonatból (GeoPackage vagy .osm.pbf).
+
+Kulcs: hely + lekérdezés paraméterei (+ osmnx verzió) hash-e, minden kulcs egy külön mappa.
+A mappa lejárati idő (ttl) után érvénytelen, ilyenkor újra letöltöm.
+
+Használat:
+Gp, nodes, edges, res_p, city_boundary = letoltes('Dunaharaszti', cache_dir=OSM_CACHE_DIR)
+Gp, nodes, edges, res_p, city_boundary = letoltes('Dunaharaszti', kivonat='../../adatok/fix/pest.gpkg')
+'''
+
+
+OSM_CACHE_DIR = '../../adatok/working/osm_cache'
+TTL = 30 * 24 * 3600  # mp
+
+
+
+def cache_kulcs(PLACE, **param):
+    '''
+    Tartalom alapú kulcs: hely + paraméterek + osmnx verzió
+    '''
+
+    s = json.dumps({"place": PLACE, "osmnx": ox.__version__, **param}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()[:16]
+
+
+def kivonat_azonosito(path):
+    '''
+    Helyi kivonat azonosítója a kulcshoz (ha a fájl változik, a cache is érvénytelen)
+    '''
+
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, int(st.st_mtime)]
+
+
+
+def _gdf_ment(gdf, path):
+    # GeoParquet, ha az oszlopok típusai engedik (pl. vegyes lista / string oszlopnál nem), különben pickle
+    try:
+        gdf.to_parquet(path + ".parquet")
+    except (ValueError, TypeError):
+        if os.path.exists(path + ".parquet"):
+            os.remove(path + ".parquet")
+        with open(path + ".pkl", "wb") as f:
+            pickle.dump(gdf, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _gdf_olvas(path):
+    if os.path.exists(path + ".parquet"):
+        return gpd.read_parquet(path + ".parquet")
+    with open(path + ".pkl", "rb") as f:
+        return pickle.load(f)
+
+
+
+def cache_olvas(cache_dir, kulcs, ttl=TTL):
+    '''
+    Visszaadja a letoltes eredményét a cache-ből, vagy None-t, ha nincs meg / lejárt
+    '''
+
+    mappa = os.path.join(cache_dir, kulcs)
+    meta_path = os.path.join(mappa, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    if ttl is not None and time.time() - meta["letrehozva"] > ttl:
+        print(f'OSM cache lejárt ({meta["place"]}), újratöltés')
+        return None
+
+    with open(os.path.join(mappa, "graph.pkl"), "rb") as f:
+        Gp = pickle.load(f)
+
+    nodes = _gdf_olvas(os.path.join(mappa, "nodes"))
+    edges = _gdf_olvas(os.path.join(mappa, "edges"))
+    res_p = _gdf_olvas(os.path.join(mappa, "residential"))
+    city_boundary = _gdf_olvas(os.path.join(mappa, "boundary")).geometry.iloc[0]
+
+    return Gp, nodes, edges, res_p, city_boundary
+
+
+def cache_iras(cache_dir, kulcs, adat, **meta):
+    '''
+    letoltes eredményének mentése; előbb ideiglenes mappába ír, így félbeszakadt írás nem marad a cache-ben
+    '''
+
+    Gp, nodes, edges, res_p, city_boundary = adat
+
+    mappa = os.path.join(cache_dir, kulcs)
+    tmp = mappa + f".tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    with open(os.path.join(tmp, "graph.pkl"), "wb") as f:
+        pickle.dump(Gp, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    _gdf_ment(nodes, os.path.join(tmp, "nodes"))
+    _gdf_ment(edges, os.path.join(tmp, "edges"))
+    _gdf_ment(res_p, os.path.join(tmp, "residential"))
+    _gdf_ment(gpd.GeoDataFrame(geometry=[city_boundary], crs=nodes.crs), os.path.join(tmp, "boundary"))
+
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"letrehozva": time.time(), **meta}, f, ensure_ascii=False, default=str)
+
+    shutil.rmtree(mappa, ignore_errors=True)
+    os.replace(tmp, mappa)
+
+
+
+def _lista_str(gdf):
+    # GeoPackage nem tud lista értéket tárolni (pl. osmid / name összevont éleknél)
+    gdf = gdf.copy()
+    for c in gdf.columns:
+        if c != gdf.geometry.name and gdf[c].dtype == object:
+            if gdf[c].map(lambda v: isinstance(v, (list, set, tuple))).any():
+                gdf[c] = gdf[c].map(lambda v: json.dumps(list(v), default=str) if isinstance(v, (list, set, tuple)) else v)
+    return gdf
+
+
+def kivonat_iras(G, res, boundaries, path):
+    '''
+    Offline kivonat írása GeoPackage-be (vetítetlen, EPSG:4326), rétegek: nodes, edges, residential, boundary
+
+    G: osmnx gráf (nem projektált), res: landuse=residential poligonok,
+    boundaries: GeoDataFrame "place" oszloppal (a letoltes PLACE paramétere) és a hivatalos határral
+    '''
+
+    nodes, edges = ox.graph_to_gdfs(G, nodes=True, edges=True)
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    _lista_str(nodes.reset_index()).to_file(path, layer="nodes", driver="GPKG")
+    _lista_str(edges.reset_index()).to_file(path, layer="edges", driver="GPKG")
+    _lista_str(res.reset_index()).to_file(path, layer="residential", driver="GPKG")
+    boundaries[["place", "geometry"]].to_crs(epsg=4326).to_file(path, layer="boundary", driver="GPKG")
+
+
+def kivonat_letoltes(places, path):
+    '''
+    Egyszeri letöltés osm-ről és kivonat írás (utána a futások offline, determinisztikusan mennek)
+    '''
+
+    grafok, resek, hatarok = [], [], []
+    for PLACE in places:
+        grafok.append(ox.graph_from_place(PLACE, network_type="drive"))
+        resek.append(ox.features_from_place(PLACE, tags={"landuse": "residential"}))
+        place_gdf = ox.geocode_to_gdf(PLACE)
+        hatarok.append(gpd.GeoDataFrame({"place": [PLACE]}, geometry=[place_gdf.geometry.iloc[0]], crs=place_gdf.crs))
+
+    G = nx.compose_all(grafok)
+    res = gpd.GeoDataFrame(pd.concat(resek))
+    res = res[~res.index.duplicated()]
+    boundaries = gpd.GeoDataFrame(pd.concat(hatarok), crs=hatarok[0].crs)
+
+    kivonat_iras(G, res, boundaries, path)
+
+
+
+def _kivonat_olvasas_gpkg(path, PLACE):
+    b = gpd.read_file(path, layer="boundary")
+    b = b[b["place"] == PLACE]
+    if b.empty:
+        raise RuntimeError(f"A kivonatban nincs határ ehhez a PLACE-hez: {PLACE}")
+    place_gdf = b.to_crs(epsg=4326)
+    poly = place_gdf.geometry.iloc[0]
+
+    # csak a határ bbox-án belüli elemeket olvasom be
+    nodes = gpd.read_file(path, layer="nodes", bbox=poly.bounds).set_index("osmid")
+    edges = gpd.read_file(path, layer="edges", bbox=poly.bounds).set_index(["u", "v", "key"])
+    edges = edges[edges.index.get_level_values("u").isin(nodes.index) &
+                  edges.index.get_level_values("v").isin(nodes.index)]
+
+    G = ox.graph_from_gdfs(nodes, edges, graph_attrs={"crs": nodes.crs})
+    # mint a graph_from_place: csak a határon belüli rész, abból a legnagyobb összefüggő komponens
+    G = ox.truncate.truncate_graph_polygon(G, poly)
+    G = ox.truncate.largest_component(G)
+
+    res = gpd.read_file(path, layer="residential", mask=poly)
+    if "element" in res.columns and "id" in res.columns:
+        res = res.set_index(["element", "id"])
+
+    return G, res, place_gdf
+
+
+def _kivonat_olvasas_pbf(path, PLACE):
+    try:
+        from pyrosm import OSM
+    except ImportError:
+        raise ImportError(".osm.pbf kivonathoz a pyrosm csomag kell (pip install pyrosm), vagy GeoPackage kivonat")
+
+    nev = PLACE.split(",")[0].strip()
+    b = OSM(path).get_boundaries(name=nev)
+    if b is None or b.empty:
+        raise RuntimeError(f"A kivonatban nincs határ ehhez a PLACE-hez: {PLACE}")
+    place_gdf = b.iloc[[0]].to_crs(epsg=4326)
+    poly = place_gdf.geometry.iloc[0]
+
+    osm = OSM(path, bounding_box=poly)
+    nodes, edges = osm.get_network(network_type="driving", nodes=True)
+    G = osm.to_graph(nodes, edges, graph_type="networkx", osmnx_compatible=True)
+    res = osm.get_landuse(custom_filter={"landuse": ["residential"]})
+
+    return G, res, place_gdf
+
+
+def kivonat_teljes(path):
+    '''
+    A teljes (pl. országos) kivonat egyszerre: (G nem projektált, residential, boundaries "place" oszloppal)
+    '''
+
+    if path.endswith(".osm.pbf"):
+        try:
+            from pyrosm import OSM
+        except ImportError:
+            raise ImportError(".osm.pbf kivonathoz a pyrosm csomag kell (pip install pyrosm), vagy GeoPackage kivonat")
+
+        osm = OSM(path)
+        nodes, edges = osm.get_network(network_type="driving", nodes=True)
+        G = osm.to_graph(nodes, edges, graph_type="networkx", osmnx_compatible=True)
+        res = osm.get_landuse(custom_filter={"landuse": ["residential"]})
+        b = osm.get_boundaries(boundary_type="administrative")
+        boundaries = b.rename(columns={"name": "place"})[["place", "geometry"]]
+        return G, res, boundaries
+
+    nodes = gpd.read_file(path, layer="nodes").set_index("osmid")
+    edges = gpd.read_file(path, layer="edges").set_index(["u", "v", "key"])
+    G = ox.graph_from_gdfs(nodes, edges, graph_attrs={"crs": nodes.crs})
+
+    res = gpd.read_file(path, layer="residential")
+    if "element" in res.columns and "id" in res.columns:
+        res = res.set_index(["element", "id"])
+
+    boundaries = gpd.read_file(path, layer="boundary")
+
+    return G, res, boundaries
+
+
+def kivonat_olvasas(path, PLACE):
+    '''
+    Helyi kivonatból ugyanaz, mint amit osm-ről töltenék le: (G nem projektált, residential, place_gdf)
+    '''
+
+    if path.endswith(".osm.pbf"):
+        return _kivonat_olvasas_pbf(path, PLACE)
+    return _kivonat_olvasas_gpkg(path, PLACE)
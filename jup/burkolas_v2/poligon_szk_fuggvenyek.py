@@ -1,9 +1,14 @@
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import random
 import matplotlib.pyplot as plt
 import colorsys
+from concurrent.futures import ProcessPoolExecutor
 
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
 from shapely.ops import unary_union, split
 from shapely.geometry import LineString
 
@@ -45,12 +50,19 @@ def add_color_to_gdf(gdf):
 
 
 
-def pontok_polygonban(gdf, gdf_szigetek, max_depth=25):
+def pontok_polygonban(gdf, gdf_szigetek, max_depth=25, vagas="kozep"):
     '''
-    Végigmegy minden poligonon, megkeresi a pontokat, és:
-      - ha több szavazókör van egy poligonon belül -> print és skip
+    Minden poligonhoz megkeresi a benne lévő pontokat, és:
+      - ha nincs benne pont -> üres sor (szavazokorid, color: None)
       - ha egyetlen szavazókör van -> results (GeoDataFrame) sorba menti:
           geometry (poligon), szavazokorid, color
+      - ha több szavazókör van egy poligonon belül -> felezéssel szétszedi (polygon_tobb_szavazokor)
+
+    A pont - poligon hozzárendelés egyetlen térbeli join (sjoin, STRtree), a besorolás groupby-jal,
+    csak a kevert poligonok mennek tovább a felezésre.
+
+    vagas: a kevert poligonok felosztása: "kozep" / "median" (felezés, lásd polygon_tobb_szavazokor),
+    "voronoi" (legközelebbi cím szerint, lásd polygon_voronoi_felosztas)
     '''
 
     # Biztonsági ellenőrzés
@@ -61,47 +73,49 @@ def pontok_polygonban(gdf, gdf_szigetek, max_depth=25):
     if gdf.crs != gdf_szigetek.crs:
         gdf = gdf.to_crs(gdf_szigetek.crs)
 
-    # Ebbe gyűjtjük a "jó" poligonokat (amiknél 1 db szavazókör azonosítható)
-    rows = []
+    # pont -> poligon párok egyszerre (pozíció szerint, az indexek lehetnek nem egyediek)
+    pontok = gpd.GeoDataFrame({"pont": range(len(gdf))}, geometry=gdf.geometry.values, crs=gdf.crs)
+    polyk = gpd.GeoDataFrame({"poly": range(len(gdf_szigetek))}, geometry=gdf_szigetek.geometry.values,
+                             crs=gdf_szigetek.crs)
+    parok = gpd.sjoin(pontok, polyk, how="inner", predicate="within")[["pont", "poly"]]
 
-    # Végigmegyünk az összes poligonon
+    # a pontok az eredeti sorrendjükben (mint a gdf[within] szűrés)
+    parok = parok.sort_values(["poly", "pont"], kind="stable")
+    parok["szavazokorid"] = gdf["szavazokorid"].to_numpy()[parok["pont"].to_numpy()]
 
-    for poly_idx, poly_row in gdf_szigetek.iterrows():
-        polygon_geom = poly_row.geometry
+    # besorolás poligononként: nincs pont (-1), szavazókörök száma (1: egy szavazókörös, 0 / több: kevert)
+    csoport = parok.groupby("poly", sort=True)
+    n_szk = csoport["szavazokorid"].nunique()
+    szk_szam = np.full(len(gdf_szigetek), -1)
+    szk_szam[n_szk.index.to_numpy()] = n_szk.to_numpy()
+    elso = csoport["pont"].first()  # color: a poligon első pontjáé
+    szk = csoport["szavazokorid"].first()  # az első nem üres szavazokorid
 
-        # Pontok a poligonon belül
-        inside_mask = gdf.within(polygon_geom)
-        points_inside = gdf[inside_mask].copy()
+    kevert = np.flatnonzero(szk_szam >= 0)[szk_szam[szk_szam >= 0] != 1]
+    pont_pos = {p: grp.to_numpy() for p, grp in parok[parok["poly"].isin(kevert)].groupby("poly")["pont"]}
+
+    rows = []
+    for poly_idx, polygon_geom in enumerate(gdf_szigetek.geometry):
 
         # Ha nincs pont, csak jelezzük és megyünk tovább
-        if len(points_inside) == 0:
-            # print(f"\nPoligon {poly_idx}: NINCS benne pont.")
+        if szk_szam[poly_idx] == -1:
             rows.append({"szavazokorid": None, "color": None, "geometry": polygon_geom})
             continue
 
-        # print(f"\nPoligon {poly_idx}: {len(points_inside)} pont található benne.")
-
-        # Egyedi szavazókörök a poligonon belül
-        unique_szavazokorok = points_inside["szavazokorid"].dropna().unique()
-
-        if len(unique_szavazokorok) != 1:
-            # print("több szavazókörhöz tartozik")
-
-            # meghívom a poly-n a rekúriv függvényt
-            rows_darabok = polygon_tobb_szavazokor(polygon_geom, points_inside, max_depth=max_depth)
-            rows.extend(rows_darabok)
+        if szk_szam[poly_idx] != 1:
+            points_inside = gdf.iloc[pont_pos[poly_idx]]
+            if vagas == "voronoi":
+                # legközelebbi cím szerinti felosztás
+                rows.extend(polygon_voronoi_felosztas(polygon_geom, points_inside))
+            else:
+                # több szavazókörhöz tartozik: meghívom a poly-n a rekúriv függvényt
+                rows.extend(polygon_tobb_szavazokor(polygon_geom, points_inside, max_depth=max_depth, vagas=vagas))
             continue
 
-        # Ha ide jutunk, akkor pontosan 1 szavazókör van
-        szavazokorid_value = unique_szavazokorok[0]
-
-        # Color: azonos (a szavazókörhöz)
-        color_value = points_inside.iloc[0]["color"]
-
-        # Mentjük a poligont a hozzárendelt szavazokorid-val és colorral
+        # pontosan 1 szavazókör
         rows.append({
-            "szavazokorid": szavazokorid_value,
-            "color": color_value,
+            "szavazokorid": szk[poly_idx],
+            "color": gdf["color"].iloc[elso[poly_idx]],
             "geometry": polygon_geom
         })
 
@@ -120,21 +134,26 @@ def pontok_polygonban(gdf, gdf_szigetek, max_depth=25):
 
 # segéd függvények
 
-def felez(poly):
+def felez(poly, vagas=None):
     """
     A poligont kettévágja a centroidon átmenő vágással (a hosszabb bbox tengely mentén).
+    vagas: (tengely, koordináta) megadott vágás (0: függőleges x = koordináta, 1: vízszintes y = koordináta)
     """
 
     minx, miny, maxx, maxy = poly.bounds
-    cx, cy = poly.centroid.x, poly.centroid.y
 
-    # Hosszabb irány kiválasztása
-    if (maxx - minx) >= (maxy - miny):
-        # függőleges vágás (x = cx)
-        vago = LineString([(cx, miny - 1), (cx, maxy + 1)])
+    if vagas is None:
+        cx, cy = poly.centroid.x, poly.centroid.y
+        # Hosszabb irány kiválasztása
+        vagas = (0, cx) if (maxx - minx) >= (maxy - miny) else (1, cy)
+
+    tengely, c = vagas
+    if tengely == 0:
+        # függőleges vágás (x = c)
+        vago = LineString([(c, miny - 1), (c, maxy + 1)])
     else:
-        # vízszintes vágás (y = cy)
-        vago = LineString([(minx - 1, cy), (maxx + 1, cy)])
+        # vízszintes vágás (y = c)
+        vago = LineString([(minx - 1, c), (maxx + 1, c)])
 
     darabok = list(split(poly, vago).geoms)
 
@@ -156,63 +175,195 @@ def szavazokorok_szama(pts_gdf):
     return pts_gdf["szavazokorid"].dropna().unique()
 
 
-def polygon_tobb_szavazokor(polygon_geom, points_inside, max_depth=25):
+def _median_vagas(poly, xy, kod):
+    '''
+    Vágás a szavazókörök között: a hosszabb bbox tengely mentén a szavazókörök medián koordinátáit sorba rakom,
+    és ott vágok (két szomszédos medián között félúton), ahol a pontszámmal súlyozott összeg eléri a felét.
+    Ha nincs legalább két szavazókör, None (marad a centroidos felezés).
+    '''
+
+    minx, miny, maxx, maxy = poly.bounds
+    tengely = 0 if (maxx - minx) >= (maxy - miny) else 1
+
+    jo = kod >= 0
+    szk, szam = np.unique(kod[jo], return_counts=True)
+    if len(szk) < 2:
+        return None
+
+    # szavazókörönkénti medián a vágás tengelyén
+    k = xy[jo, tengely]
+    o = np.lexsort((k, kod[jo]))
+    k = k[o]
+    eleje = np.concatenate([[0], np.cumsum(szam)[:-1]])
+    median = (k[eleje + (szam - 1) // 2] + k[eleje + szam // 2]) / 2
+
+    o = np.argsort(median, kind="stable")
+    median, szam = median[o], szam[o]
+    i = min(int(np.searchsorted(np.cumsum(szam), szam.sum() / 2)), len(szam) - 2)
+    if median[i] == median[i + 1]:
+        return None
+
+    return tengely, (median[i] + median[i + 1]) / 2
+
+
+def _darab_pontjai(darabok, xy, tengely, c):
+    '''
+    Pontok szétosztása a vágás darabjai között: a vágóvonal melyik oldalán van (koordináta összehasonlítás),
+    pontos contains csak ha az oldalon több darab van, vagy a pont a vágóvonal közelében van.
+    Visszaad: darabonként a pontok (a szülőn belüli) indexei, eredeti sorrendben.
+    '''
+
+    if len(darabok) == 1:
+        return [np.arange(len(xy))]
+
+    k = xy[:, tengely]
+    tol = 1e-9 * max(1.0, float(np.abs(k).max())) if len(k) else 0.0
+    kozel = np.abs(k - c) <= tol
+
+    # darabok oldala a reprezentatív pontjuk szerint
+    rep = shapely.get_coordinates(shapely.point_on_surface(np.asarray(darabok, dtype=object)))[:, tengely]
+    oldal = (rep > c).tolist()
+    db_oldal = [oldal.count(False), oldal.count(True)]
+
+    out = []
+    for darab, o in zip(darabok, oldal):
+        jelolt = (k > c) if o else (k < c)
+        if db_oldal[o] == 1:
+            # egyetlen darab az oldalon: a szülőben lévő, oldalon lévő pontok mind benne vannak
+            biztos = jelolt & ~kozel
+            vizsgal = np.flatnonzero(kozel)
+        else:
+            biztos = np.zeros(len(xy), dtype=bool)
+            vizsgal = np.flatnonzero(jelolt | kozel)
+
+        if len(vizsgal):
+            shapely.prepare(darab)
+            biztos[vizsgal[shapely.contains_xy(darab, xy[vizsgal, 0], xy[vizsgal, 1])]] = True
+
+        out.append(np.flatnonzero(biztos))
+
+    return out
+
+
+def polygon_tobb_szavazokor(polygon_geom, points_inside, max_depth=25, vagas="kozep"):
     '''
     Több szavazókörös poligon "szétszedése" felezéssel.
 
     Paraméterek:
       - polygon_geom: a poligon geometriája (shapely Polygon)
       - points_inside: GeoDataFrame, a poligonon belüli pontok (gdf szűrt része)
+      - vagas: "kozep" -> felezés a mértani közepén (centroid), "median" -> vágás a szavazókörök között
+        a pontszámmal súlyozott mediánnál (ugyanakkora szétválasztáshoz kevesebb szint kell)
 
     Működés:
     - Egy feldolgozási sorban (queue) tartjuk azokat a poligonokat, amik még kevertek
-    - Minden körben: poligon felezése a mértani közepén
+    - Minden körben: poligon felezése
     - A felekre újraszűrjük a pontokat:
         - 0 pont -> üres poligon, nem bontjuk tovább
         - 1 db szavazokorid -> nem bontjuk tovább, megvan a legkisebb egyedi poly
         - több szavazokorid -> visszakerül a sorba, és újra felezzük
+
+    A pontok koordináta tömbként és egész szavazókör kóddal mennek végig a soron (GeoDataFrame szűrés és
+    másolás nélkül), a darabokra osztás a vágóvonalhoz képesti oldal szerint történik.
     '''
 
-    rows = []
-    queue = [(polygon_geom, points_inside, 0)]  # (poly, pts, depth)
+    if vagas not in ("kozep", "median"):
+        raise ValueError(f"Ismeretlen vágás: {vagas}")
+
+    xy_mind = shapely.get_coordinates(points_inside.geometry.values)
+    kod_mind, szk_ertekek = pd.factorize(points_inside["szavazokorid"])  # NaN -> -1
+    color = points_inside["color"].to_numpy()
+
+    ki = []  # (darab, első pont index vagy -1, szavazókör kód vagy -1)
+    queue = [(polygon_geom, np.arange(len(xy_mind)), 0)]  # (poly, pont indexek, depth)
 
     # ameddig van nem egységes besorolású poligon
     while queue:
-        poly, pts, depth = queue.pop()  # kiveszünk egy polyt
+        poly, idx, depth = queue.pop()  # kiveszünk egy polyt
 
         # ne legyen végtelen ciklus: ha túl mélyre mentünk inkább hadjuk
         if depth >= max_depth:
             print('Elérte a poly a mélységi szintet!')
-            # rows.append({"szavazokorid":None, "color":None, "geometry":poly})
             continue
 
-        # 1) felezés
-        darabok = felez(poly)
+        xy, kod = xy_mind[idx], kod_mind[idx]
+
+        # 1) vágás
+        v = _median_vagas(poly, xy, kod) if vagas == "median" else None
+        if v is None:
+            minx, miny, maxx, maxy = poly.bounds
+            c = poly.centroid
+            v = (0, c.x) if (maxx - minx) >= (maxy - miny) else (1, c.y)
+        darabok = felez(poly, v)
 
         # 2) gyerekpoligonok értékelése
-        for darab in darabok:
-            darab_pts = pontok_poligonban(pts, darab)  # lekérdezem a darabban lévő pontokat
+        for darab, sajat in zip(darabok, _darab_pontjai(darabok, xy, *v)):
 
             # ha 0 pont van benne
-            if len(darab_pts) == 0:
-                rows.append({"szavazokorid": None, "color": None, "geometry": darab})
+            if len(sajat) == 0:
+                ki.append((darab, -1, -1))
                 continue
 
             # megnézem hogy egyediek e szkid-k
-            uniq = szavazokorok_szama(darab_pts)
+            k = kod[sajat]
+            k = k[k >= 0]
 
             # csak 1 szavazókör -> eredmény ezt kell!!!
-            if len(uniq) == 1:
-                # mentem a polyt
-                rows.append({
-                    "szavazokorid": uniq[0],
-                    "color": darab_pts.iloc[0]["color"],
-                    "geometry": darab
-                })
+            if len(k) and (k == k[0]).all():
+                ki.append((darab, idx[sajat[0]], k[0]))
                 continue
 
             # több szavazókör -> vissza a sorba, újra felezésre
-            queue.append((darab, darab_pts, depth + 1))
+            queue.append((darab, idx[sajat], depth + 1))
+
+    # eredmény sorok egyben
+    return [{"szavazokorid": szk_ertekek[k] if k >= 0 else None,
+             "color": color[e] if e >= 0 else None,
+             "geometry": darab} for darab, e, k in ki]
+
+
+
+
+
+
+def polygon_voronoi_felosztas(polygon_geom, points_inside):
+    '''
+    Több szavazókörös poligon felosztása a legközelebbi cím szerint (a felezés gyors alternatívája).
+
+    A poligonon belüli pontok Voronoi diagramja (shapely.voronoi_polygons), a cellák szavazókörönként
+    összevonva és a poligonra vágva. Egyetlen menet poligononként, nincs mélységi limit, és szavazókörönként
+    csak annyi darab keletkezik, ahány különálló része van a területének.
+
+    A szavazokorid nélküli pontok nem kapnak cellát; azonos koordinátájú pontoknál az első számít.
+    Visszaad: sorok (szavazokorid, color, geometry) listája, mint a polygon_tobb_szavazokor.
+    '''
+
+    kod, szk_ertekek = pd.factorize(points_inside["szavazokorid"])  # NaN -> -1
+    xy = shapely.get_coordinates(points_inside.geometry.values)
+    color = points_inside["color"].to_numpy()
+
+    # cellát a besorolt pontok kapnak, azonos koordinátáknál az első
+    jo = np.flatnonzero(kod >= 0)
+    _, elso = np.unique(xy[jo], axis=0, return_index=True)
+    hely = jo[np.sort(elso)]
+
+    if len(np.unique(kod[hely])) < 2:
+        # nincs mit felosztani
+        if not len(hely):
+            return [{"szavazokorid": None, "color": None, "geometry": polygon_geom}]
+        return [{"szavazokorid": szk_ertekek[kod[hely[0]]], "color": color[hely[0]], "geometry": polygon_geom}]
+
+    cellak = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(xy[hely]), extend_to=polygon_geom,
+                                                        ordered=True))
+
+    rows = []
+    for k in np.unique(kod[hely]):
+        sajat = hely[kod[hely] == k]
+        # a Voronoi cellák hézag- és átfedésmentes lefedést adnak: coverage union (sokkal gyorsabb a union_all-nál)
+        terulet = shapely.intersection(shapely.coverage_union_all(cellak[kod[hely] == k]), polygon_geom)
+        for darab in shapely.get_parts(terulet):
+            if shapely.get_type_id(darab) == 3 and not darab.is_empty:  # Polygon
+                rows.append({"szavazokorid": szk_ertekek[k], "color": color[sajat[0]], "geometry": darab})
 
     return rows
 
@@ -221,105 +372,198 @@ def polygon_tobb_szavazokor(polygon_geom, points_inside, max_depth=25):
 
 
 
-def ures_polyk_besorolasa(results):
+def ures_polyk_besorolasa(results, suly=None):
     """
     Azokat a sorokat kezeli, ahol szavazokorid hiányzik (NaN/None):
-      - megkeresi a szomszédos poligonokat (touches: közös határ/pont érintés)
-      - a szomszédok szavazokorid-jai közül a leggyakoribbat választja
-      - beírja a hiányzó szavazokorid-t és a hozzá tartozó color-t (a nyertes szomszéd első colorja)
+      - a szomszédsági gráfot egyszer építi fel (touches: közös határ/pont érintés, egy kötegelt STRtree query)
+      - a címkéket szélességi bejárással terjeszti: körönként minden olyan üres poligon, aminek már van
+        besorolt szomszédja, a szomszédok szavazokorid-jai közül a leggyakoribbat kapja (egyszerre, az adott
+        kör előtti állapot szerint), amíg van változás
+      - beírja a hiányzó szavazokorid-t és a hozzá tartozó color-t (a nyertes szavazókör színe)
+
+    Így a csak üres poligonokkal körülvett üres területek is címkét kapnak (ha elérhető besorolt poligon),
+    és az eredmény nem függ a sorok sorrendjétől.
+
+    suly: None -> szomszédok száma szerinti többség, "hossz" -> közös határhosszal súlyozva
+          (ha egy poligonnak csak pontban érintkező besorolt szomszédai vannak, darabszám szerint)
 
     Megjegyzés:
       - a "szomszéd" itt: geometriailag érintkező poligon (touches)
-      - döntetlen esetén: a leggyakoribbak közül az első (deterministikus sorrend szerint) kerül kiválasztásra
+      - döntetlen esetén: a legkisebb szavazokorid
     """
 
+    if suly not in (None, "hossz"):
+        raise ValueError(f"Ismeretlen súlyozás: {suly}")
+
     out = results.copy()
+    geoms = out.geometry.values
+    n = len(out)
+
+    # címkék kódolva (rendezve: döntetlennél a kisebb kód = kisebb szavazokorid), NaN -> -1
+    kod, szk_ertekek = pd.factorize(out["szavazokorid"], sort=True)
+    if n == 0 or (kod >= 0).all() or (kod < 0).all():
+        return out
+
+    # szavazókörönként a szín (az első ilyen sorból)
+    u, elso = np.unique(kod, return_index=True)
+    szin = out["color"].to_numpy()[elso[u >= 0]]
+
+    # szomszédsági gráf egyszer (CSR: szomszédok[eleje[i]:eleje[i + 1]])
+    i, j = shapely.STRtree(geoms).query(geoms, predicate="touches")
+    jo = i != j
+    i, j = i[jo], j[jo]
+    o = np.lexsort((j, i))
+    i, j = i[o], j[o]
+    eleje = np.searchsorted(i, np.arange(n + 1))
+
+    if suly == "hossz":
+        w = shapely.length(shapely.intersection(shapely.boundary(geoms[i]), shapely.boundary(geoms[j])))
+    else:
+        w = np.ones(len(i))
 
-    # Spatial index gyorsításhoz (olvasható marad, de nem lassú)
-    sindex = out.sindex
+    # szélességi terjesztés: mindig csak az újonnan besoroltak üres szomszédai kerülnek sorra
+    uj = np.flatnonzero(kod >= 0)
+    while len(uj):
+        jeloltek = np.unique(np.concatenate([j[eleje[a]:eleje[a + 1]] for a in uj]))
+        jeloltek = jeloltek[kod[jeloltek] < 0]
+        if not len(jeloltek):
+            break
 
-    # Hiányzó szavazokorid sorok indexei (NaN is ide esik)
-    missing_idxs = out.index[out["szavazokorid"].isna()].tolist()
+        # a jelöltek összes (már besorolt) szomszédja
+        el = np.concatenate([np.arange(eleje[a], eleje[a + 1]) for a in jeloltek])
+        el = el[kod[j[el]] >= 0]
+        df = pd.DataFrame({"i": i[el], "kod": kod[j[el]], "w": w[el], "db": 1.0})
 
-    for idx in missing_idxs:
-        geom = out.at[idx, "geometry"]
+        ossz = df.groupby(["i", "kod"], sort=False)[["w", "db"]].sum().reset_index()
+        # csak pontban érintkező szomszédok: darabszám szerint
+        ossz["ertek"] = np.where(ossz.groupby("i")["w"].transform("max") > 0, ossz["w"], ossz["db"])
+        nyertes = ossz.sort_values(["i", "ertek", "kod"], ascending=[True, False, True]).drop_duplicates("i")
 
-        # Jelöltek: bbox alapján (sindex), majd pontos szűrés touches-szal
-        candidate_idxs = list(sindex.intersection(geom.bounds))
-        candidates = out.loc[candidate_idxs]
+        kod[nyertes["i"].to_numpy()] = nyertes["kod"].to_numpy()
+        uj = nyertes["i"].to_numpy()
 
-        neighbors = candidates[candidates.geometry.touches(geom)]
+    hianyzott = out["szavazokorid"].isna().to_numpy() & (kod >= 0)
+    out.loc[hianyzott, "szavazokorid"] = szk_ertekek[kod[hianyzott]]
+    out.loc[hianyzott, "color"] = szin[kod[hianyzott]]
+
+    return out
 
-        # Csak azok a szomszédok kellenek, ahol van szavazokorid
-        neighbors_labeled = neighbors[neighbors["szavazokorid"].notna()]
 
-        if len(neighbors_labeled) == 0:
-            # nincs kitől örökölni -> marad NaN/None
-            continue
 
-        # Szavazokorid többség meghatározása
-        counts = neighbors_labeled["szavazokorid"].value_counts()
 
-        winner_szavazokorid = counts.index[0]
 
-        # Color átvétele: az első olyan szomszédból, amelyik a nyertes szavazokorid
-        winner_color = neighbors_labeled.loc[
-            neighbors_labeled["szavazokorid"] == winner_szavazokorid, "color"
-        ].iloc[0]
 
-        out.at[idx, "szavazokorid"] = winner_szavazokorid
-        out.at[idx, "color"] = winner_color
 
-    return out
 
 
+def _zaras(geom, max_parts, start_tol, grow_factor, max_tol):
+    tol = start_tol
 
+    # addig "ragasztunk", amíg el nem érjük a kívánt parts számot (1)
+    while True:
+        if geom.geom_type == "Polygon":
+            break
 
+        if geom.geom_type == "MultiPolygon":
+            parts = len(geom.geoms)
+            if parts <= max_parts:
+                break
+        else:
+            # ha valami más (ritka), kilépünk
+            break
 
+        if tol > max_tol:
+            # nem sikerült 1 poligonná kényszeríteni a plafonon belül
+            break
 
+        # closing: növeszt -> összeragad -> visszahúz
+        geom = geom.buffer(tol).buffer(-tol)
+        tol *= grow_factor
 
+    return geom
 
 
-def polygonok_egyesitese(results, *, max_parts = 1, start_tol = 0.1, grow_factor = 2, max_tol = 50):
+def _hidak(geom, max_parts, start_tol, max_tol):
     '''
-    Szavazókörönként egyetlen *Polygon*-t kényszerít ki úgy, hogy a különálló részeket
-    toleranciás "ragasztással" összeköti (buffer+/-).
+    A különálló részek összekötése a lehető legrövidebb hidakkal: a részek közti távolságokra minimális
+    feszítőfa, a fa élei mentén (a két rész legközelebbi pontjai között) start_tol széles folyosó.
+    A max_parts - 1 leghosszabb él és a 2 * max_tol-nál hosszabb élek kimaradnak (mint a zárásnál:
+    max_tol-lal legfeljebb 2 * max_tol széles rés zárul be).
+
+    Csak a 2 * max_tol-on belüli részpárok kerülnek a gráfba (STRtree dwithin), ezen minimális feszítő erdő:
+    ennek élei épp a teljes feszítőfa 2 * max_tol-nál rövidebb élei.
+    '''
+
+    if geom.geom_type != "MultiPolygon" or len(geom.geoms) <= max_parts:
+        return geom
+
+    reszek = shapely.get_parts(geom)
+    n = len(reszek)
+    i, j = shapely.STRtree(reszek).query(reszek, predicate="dwithin", distance=2 * max_tol)
+    jo = i < j
+    i, j = i[jo], j[jo]
+    d = shapely.distance(reszek[i], reszek[j])
+    jo = d < 2 * max_tol
+    i, j, d = i[jo], j[jo], d[jo]
+    if not len(i):
+        return geom
+
+    # pontban érintkező részek (d = 0) is kellenek élnek
+    fa = minimum_spanning_tree(coo_matrix((np.maximum(d, 1e-12), (i, j)), shape=(n, n)).tocsr()).tocoo()
 
+    # a teljes fa n - 1 élből áll, a hiányzók (komponensek közti, hosszú élek) a leghosszabbak:
+    # a max_parts - 1 leghosszabb elhagyása után legfeljebb n - max_parts él marad
+    o = np.argsort(fa.data, kind="stable")[:max(0, min(len(fa.data), n - max_parts))]
+    a, b = fa.row[o], fa.col[o]
+    if not len(a):
+        return geom
+
+    folyosok = shapely.buffer(shapely.shortest_line(reszek[a], reszek[b]), start_tol / 2)
+    return shapely.union_all(np.concatenate([reszek, folyosok]))
+
+
+def _szk_egyesites(geoms, mod, max_parts, start_tol, grow_factor, max_tol):
+    # egy szavazókör darabjai egy (lehetőleg egy részből álló) geometriába
+    geom = unary_union(list(geoms))
+    if mod == "hid":
+        return _hidak(geom, max_parts, start_tol, max_tol)
+    return _zaras(geom, max_parts, start_tol, grow_factor, max_tol)
+
+
+def polygonok_egyesitese(results, *, max_parts = 1, start_tol = 0.1, grow_factor = 2, max_tol = 50, mod = "zaras",
+                         max_workers = 1):
+    '''
+    Szavazókörönként egyetlen *Polygon*-t kényszerít ki úgy, hogy a különálló részeket összeköti.
+
+    mod="zaras": toleranciás "ragasztás" (buffer+/-) a teljes szavazókör geometrián
     - start_tol: kezdő ragasztási távolság (CRS egységben, EOV -> méter)
     - grow_factor: ha még mindig több part, ennyivel szorozzuk a tol-t
     - max_tol: biztonsági plafon, nehogy elszálljon
 
-    FIGYELEM: ez torzít (hidakat képez), de cserébe 1 Polygon lesz.
-    '''
-
-    out_rows = []
+    mod="hid": csak a szükséges, legrövidebb hidak (a részek távolságainak minimális feszítőfája mentén
+    start_tol széles folyosók), teljes geometria bufferelés nélkül; a 2 * max_tol-nál nagyobb réseket nem hidalja át
 
-    for szkid, grp in results.groupby("szavazokorid", dropna=False):
-        color = grp["color"].iloc[0] if "color" in grp.columns else None
+    max_workers: ennyi folyamatban dolgozza fel a szavazóköröket (1: sorban; a generalas_batch már
+    településenként párhuzamos, ott maradjon 1)
 
-        geom = unary_union(list(grp.geometry))
-        tol = start_tol
+    FIGYELEM: ez torzít (hidakat képez), de cserébe 1 Polygon lesz.
+    '''
 
-        # addig "ragasztunk", amíg el nem érjük a kívánt parts számot (1)
-        while True:
-            if geom.geom_type == "Polygon":
-                break
+    if mod not in ("zaras", "hid"):
+        raise ValueError(f"Ismeretlen mód: {mod}")
 
-            if geom.geom_type == "MultiPolygon":
-                parts = len(geom.geoms)
-                if parts <= max_parts:
-                    break
-            else:
-                # ha valami más (ritka), kilépünk
-                break
+    csoportok = list(results.groupby("szavazokorid", dropna=False))
+    feladatok = [(grp.geometry.values, mod, max_parts, start_tol, grow_factor, max_tol) for _, grp in csoportok]
 
-            if tol > max_tol:
-                # nem sikerült 1 poligonná kényszeríteni a plafonon belül
-                break
+    if max_workers == 1 or len(feladatok) <= 1:
+        geoms = [_szk_egyesites(*f) for f in feladatok]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as ex:
+            geoms = list(ex.map(_szk_egyesites, *zip(*feladatok)))
 
-            # closing: növeszt -> összeragad -> visszahúz
-            geom = geom.buffer(tol).buffer(-tol)
-            tol *= grow_factor
+    out_rows = []
+    for (szkid, grp), geom in zip(csoportok, geoms):
+        color = grp["color"].iloc[0] if "color" in grp.columns else None
 
         # Ha még mindig MultiPolygon, itt dönthetsz: hagyod MultiPolygonként (1 geometria),
         # vagy kényszeríted burkolóval (convex hull). Most: visszaadjuk, ami lett.
@@ -330,4 +574,3 @@ def polygonok_egyesitese(results, *, max_parts = 1, start_tol = 0.1, grow_factor
         })
 
     return gpd.GeoDataFrame(out_rows, geometry="geometry", crs=results.crs)
-
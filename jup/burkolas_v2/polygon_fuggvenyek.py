@@ -2,11 +2,17 @@ import osmnx as ox
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import pandas as pd
+import heapq
+
 import numpy as np
+import shapely
+from scipy.spatial import cKDTree
 
 from shapely.ops import nearest_points, unary_union, linemerge, snap, polygonize
 from shapely.geometry import LineString, Polygon, MultiPolygon, Point, GeometryCollection
 
+from osm_cache import TTL, cache_kulcs, cache_olvas, cache_iras, kivonat_azonosito, kivonat_olvasas
+
 
 # robusztus "validálás" (ugyanaz a logika, mint nálad)
 def _safe_make_valid(g):
@@ -23,18 +29,14 @@ def _safe_make_valid(g):
 
 
 
-def letoltes(PLACE):
+def _projektalas(G, res, place_gdf):
     '''
-    Letöltés és projektálás (úthálózat, lakott terület poligonok, hivatalos városhatár)
+    Projektálás és ellenőrzések (úthálózat, lakott terület poligonok, hivatalos városhatár)
     '''
 
-    # úthálózat letöltése
-    G = ox.graph_from_place(PLACE, network_type="drive")
     Gp = ox.project_graph(G)
     nodes, edges = ox.graph_to_gdfs(Gp, nodes=True, edges=True)
 
-    # lakott terület határ letöltése
-    res = ox.features_from_place(PLACE, tags={"landuse": "residential"})
     res = res[res.geometry.type.isin(["Polygon", "MultiPolygon"])].copy()
 
     if res.empty:
@@ -42,9 +44,6 @@ def letoltes(PLACE):
 
     res_p = res.to_crs(nodes.crs)
 
-    # hivatalos városhatár
-    place_gdf = ox.geocode_to_gdf(PLACE)
-
     if place_gdf.empty:
         raise RuntimeError("Nem lehet lekérni a hivatalos határt (geocode_to_gdf üres)")
 
@@ -63,6 +62,47 @@ def letoltes(PLACE):
 
 
 
+def letoltes(PLACE, cache_dir=None, ttl=TTL, kivonat=None, orszagos=None):
+    '''
+    Letöltés és projektálás (úthálózat, lakott terület poligonok, hivatalos városhatár)
+
+    cache_dir: ha meg van adva, a projektált eredményt ide menti / innen olvassa (ttl mp-ig érvényes)
+    kivonat: helyi .gpkg / .osm.pbf kivonat útvonala, ekkor nem tölt le semmit (offline, determinisztikus)
+    orszagos: egyszer betöltött OrszagosAdat, ebből vágja ki a települést (memóriában)
+    '''
+
+    if orszagos is not None:
+        return orszagos.telepules(PLACE)
+
+    if cache_dir is not None:
+        param = {"network_type": "drive", "tags": {"landuse": "residential"},
+                 "kivonat": kivonat_azonosito(kivonat) if kivonat else None}
+        kulcs = cache_kulcs(PLACE, **param)
+        adat = cache_olvas(cache_dir, kulcs, ttl)
+        if adat is not None:
+            return adat
+
+    if kivonat is None:
+        # úthálózat letöltése
+        G = ox.graph_from_place(PLACE, network_type="drive")
+
+        # lakott terület határ letöltése
+        res = ox.features_from_place(PLACE, tags={"landuse": "residential"})
+
+        # hivatalos városhatár
+        place_gdf = ox.geocode_to_gdf(PLACE)
+    else:
+        G, res, place_gdf = kivonat_olvasas(kivonat, PLACE)
+
+    adat = _projektalas(G, res, place_gdf)
+
+    if cache_dir is not None:
+        cache_iras(cache_dir, kulcs, adat, place=PLACE, **param)
+
+    return adat
+
+
+
 def vag_residential_city(res_p, city_boundary):
     '''
     Lakott terület + hivatalos városhatár vágás (logika változatlan)
@@ -122,113 +162,251 @@ def res_area_es_boundary(res_cut, edges):
     return res_area, boundary
 
 
+def _metszet_pontok(geoms):
+    '''
+    Metszetek pontjai vektorosan (pont -> maga, vonal -> két végpontja, multi / collection -> részenként),
+    a bejárási sorrendben. Visszaad: (pontok, forrás index)
+    '''
+
+    idx = np.arange(len(geoms))
+    # multi / collection kibontása (collection-ben lehet multi is, ezért ismételve)
+    while len(geoms) and np.isin(shapely.get_type_id(geoms), (4, 5, 6, 7)).any():
+        geoms, j = shapely.get_parts(geoms, return_index=True)
+        idx = idx[j]
+
+    # üres geometriának 0 része van, így az már kiesett
+    geoms, j = shapely.get_parts(geoms, return_index=True)
+    idx = idx[j]
+
+    tipus = shapely.get_type_id(geoms)
+    pont = tipus == 0
+    vonal = tipus == 1
+
+    # vonal: kezdő- és végpont egymás után
+    sorrend = np.concatenate([np.flatnonzero(pont) * 2, np.flatnonzero(vonal) * 2, np.flatnonzero(vonal) * 2 + 1])
+    pontok = np.concatenate([geoms[pont], shapely.get_point(geoms[vonal], 0), shapely.get_point(geoms[vonal], -1)])
+    forras = np.concatenate([idx[pont], idx[vonal], idx[vonal]])
+
+    o = np.argsort(sorrend, kind="stable")
+    return pontok[o], forras[o]
+
+
 def orange_gen(Gp, nodes, edges, MAX_EXT=200.0, EPS=0.25, MIN_SEG=0.1):
     '''
     NARANCS (dead-end -> következő utca)
+
+    Minden zsákutca végéből az utolsó útszakasz irányában MAX_EXT hosszú sugár, ami a legközelebbi (EPS-nél
+    távolabbi) másik utcáig tart. Kötegelve: a sugarak irányát numpy tömbökkel, a jelölt éleket egyetlen
+    STRtree lekérdezéssel, a metszéspontokat és a sugár menti távolságot shapely tömbműveletekkel számolja.
     '''
 
-    deg = dict(Gp.to_undirected().degree())
-    dead = nodes.loc[[n for n, d in deg.items() if d == 1]].copy()
+    # irányítatlan fokszám nézeten át (a to_undirected() az összes él adatát lemásolná)
+    deg = dict(Gp.to_undirected(as_view=True).degree())
+    dead = nodes.loc[[n for n, d in deg.items() if d == 1]]
 
-    def _pts(geom):
-        if geom.is_empty:
-            return []
-        t = geom.geom_type
-        if t == "Point":
-            return [geom]
-        if t == "MultiPoint":
-            return list(geom.geoms)
-        if t == "LineString":
-            return [Point(geom.coords[0]), Point(geom.coords[-1])]
-        if t in ("MultiLineString", "GeometryCollection"):
-            out = []
-            for gg in geom.geoms:
-                out += _pts(gg)
-            return out
-        return []
+    if not len(dead):
+        return gpd.GeoSeries([], crs=nodes.crs)
 
-    def _ray_from_deadend(node_id):
-        pt = nodes.loc[node_id].geometry
-
-        elist = list(Gp.edges(node_id, keys=True, data=True))
-        if not elist:
-            elist = list(Gp.in_edges(node_id, keys=True, data=True))
-        if not elist:
-            return None, None
-
-        u, v, k, data = elist[0]
-        geom = data.get("geometry")
-        if geom is None:
-            other = v if u == node_id else u
-            geom = LineString([pt, nodes.loc[other].geometry])
-
-        c = list(geom.coords)
-        if len(c) < 2:
-            return None, None
-
-        a0, a1 = Point(c[0]), Point(c[-1])
-        if pt.distance(a0) <= pt.distance(a1):
-            a, b = c[0], c[1]
-        else:
-            a, b = c[-1], c[-2]
-
-        dx, dy = (a[0] - b[0], a[1] - b[1])  # kifelé
-        n = (dx * dx + dy * dy) ** 0.5
-        if n == 0:
-            return None, None
-
-        far = Point(pt.x + dx / n * MAX_EXT, pt.y + dy / n * MAX_EXT)
-        return pt, LineString([pt, far])
-
-    sidx_edges = edges.sindex
-    orange = []
-
-    for node_id in dead.index:
-        pt, ray = _ray_from_deadend(node_id)
-        if ray is None:
+    # 1. zsákutcánként az első csatlakozó él (mint eddig: kimenő, ha nincs akkor bejövő)
+    node_ids = dead.index.to_numpy()
+    el_geom = np.empty(len(node_ids), dtype=object)
+    masik = np.full(len(node_ids), -1, dtype=np.int64)
+    van_el = np.zeros(len(node_ids), dtype=bool)
+
+    for i, node_id in enumerate(node_ids):
+        elist = next(iter(Gp.edges(node_id, keys=True, data=True)), None)
+        if elist is None:
+            elist = next(iter(Gp.in_edges(node_id, keys=True, data=True)), None)
+        if elist is None:
             continue
 
-        cand = edges.iloc[list(sidx_edges.intersection(ray.bounds))]
+        u, v, k, data = elist
+        van_el[i] = True
+        el_geom[i] = data.get("geometry")
+        if el_geom[i] is None:
+            masik[i] = nodes.index.get_loc(v if u == node_id else u)
 
-        best_p, best_s = None, np.inf
-        for (eu, ev, ek), row in cand.iterrows():
-            if node_id in (eu, ev):
-                continue
-            inter = ray.intersection(row.geometry)
-            for p in _pts(inter):
-                s = ray.project(p)
-                if s <= EPS or s >= best_s:
-                    continue
-                best_s, best_p = s, p
+    pt = shapely.points(dead.geometry.x.to_numpy(), dead.geometry.y.to_numpy())
 
-        if best_p is not None:
-            seg = LineString([pt, best_p])
-            if seg.length > MIN_SEG:
-                orange.append(seg)
+    # geometria nélküli él: egyenes a másik végpontig
+    nincs_geom = van_el & np.array([g is None for g in el_geom])
+    if nincs_geom.any():
+        masik_pt = nodes.geometry.values[masik[nincs_geom]]
+        el_geom[nincs_geom] = shapely.linestrings(
+            np.stack([shapely.get_coordinates(pt[nincs_geom]), shapely.get_coordinates(masik_pt)], axis=1))
 
-    return gpd.GeoSeries(orange, crs=nodes.crs)
+    ok = van_el & (shapely.get_num_coordinates(np.where(van_el, el_geom, None)) >= 2)
+
+    # 2. sugár iránya: a zsákutcához közelebbi él végén, kifelé
+    g = el_geom[ok]
+    p = pt[ok]
+    c0, c1 = shapely.get_point(g, 0), shapely.get_point(g, 1)
+    cn, cn1 = shapely.get_point(g, -1), shapely.get_point(g, -2)
+    eleje = shapely.distance(p, c0) <= shapely.distance(p, cn)
+
+    a = shapely.get_coordinates(np.where(eleje, c0, cn))
+    b = shapely.get_coordinates(np.where(eleje, c1, cn1))
+    d = a - b  # kifelé
+    n = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+
+    ok_idx = np.flatnonzero(ok)[n > 0]
+    p, d, n = p[n > 0], d[n > 0], n[n > 0]
+
+    pxy = shapely.get_coordinates(p)
+    far = pxy + d / n[:, None] * MAX_EXT
+    rays = shapely.linestrings(np.stack([pxy, far], axis=1))
+
+    # 3. jelölt (sugár, él) párok egyetlen STRtree lekérdezéssel (bbox metszés, mint eddig)
+    ray_i, edge_j = edges.sindex.query(rays)
+
+    u_arr = edges.index.get_level_values(0).to_numpy()
+    v_arr = edges.index.get_level_values(1).to_numpy()
+    sajat = node_ids[ok_idx[ray_i]]
+    nem_sajat = (u_arr[edge_j] != sajat) & (v_arr[edge_j] != sajat)
+    ray_i, edge_j = ray_i[nem_sajat], edge_j[nem_sajat]
+
+    # 4. metszéspontok és távolság a sugár mentén
+    inter = shapely.intersection(rays[ray_i], edges.geometry.values[edge_j])
+    pontok, par = _metszet_pontok(inter)
+    sugar = ray_i[par]
+    s = shapely.line_locate_point(rays[sugar], pontok)
+
+    jo = s > EPS
+    pontok, sugar, s = pontok[jo], sugar[jo], s[jo]
+    rang = np.flatnonzero(jo)
+
+    # sugaranként a legközelebbi (egyenlőségnél az elsőként talált, mint eddig)
+    o = np.lexsort((rang, s, sugar))
+    elso = np.unique(sugar[o], return_index=True)[1]
+    best = o[elso]
+
+    # 5. szakaszok
+    seg = shapely.linestrings(np.stack([pxy[sugar[best]], shapely.get_coordinates(pontok[best])], axis=1))
+    seg = seg[shapely.length(seg) > MIN_SEG]
+
+    return gpd.GeoSeries(seg, crs=nodes.crs)
+
+
+def _szakaszok(geom):
+    '''
+    Vonal / multivonal geometria szakaszokra bontva (két pontú LineString-ek, eredeti sorrendben)
+    '''
+
+    parts = shapely.get_parts(geom)
+    coords, idx = shapely.get_coordinates(parts, return_index=True)
+    if len(coords) < 2:
+        return np.empty(0, dtype=object)
+
+    # szomszédos koordináta párok ugyanazon a részen belül
+    egy_reszen = idx[1:] == idx[:-1]
+    return shapely.linestrings(np.stack([coords[:-1][egy_reszen], coords[1:][egy_reszen]], axis=1))
+
+
+def _legkozelebbi_vonalak(pts, vonal, max_dist):
+    '''
+    Pontonként a legközelebbi pontba húzott vonal a vonal geometriáig (mint a nearest_points), ha max_dist-en belül van.
+    A vonalat szakaszokra bontja, STRtree-t épít rájuk, és egyetlen kötegelt query_nearest-tel keres.
+
+    Visszaad: (pont indexek, vonalak, távolságok)
+    '''
+
+    szakaszok = _szakaszok(vonal)
+    if not len(szakaszok) or not len(pts):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=object), np.empty(0)
+
+    tree = shapely.STRtree(szakaszok)
+
+    # kicsit nagyobb keresési sugár, a határeset (d == max_dist) a lenti szűrésen dől el
+    (pi, si), d = tree.query_nearest(pts, max_distance=max_dist * (1 + 1e-9) + 1e-9, return_distance=True)
+
+    # egyenlő távolságnál (mint a nearest_points) a vonal mentén elsőként jövő szakasz
+    o = np.lexsort((si, pi))
+    pi, si, d = pi[o], si[o], d[o]
+    elso = np.unique(pi, return_index=True)[1]
+    pi, si, d = pi[elso], si[elso], d[elso]
+
+    jo = np.isfinite(d) & (d <= max_dist)
+    pi, si, d = pi[jo], si[jo], d[jo]
+
+    return pi, shapely.shortest_line(pts[pi], szakaszok[si]), d
 
 
 def blue_gen(nodes, boundary, DIST_LIM=100.0, MIN_SEG=0.1):
     '''
     KÉK (node -> lakóhatár, ha közel van)
+
+    A határt szakaszokra bontja és STRtree-t épít rájuk; minden node-hoz egy kötegelt query_nearest
+    (max_distance=DIST_LIM) adja a legközelebbi szakaszt, a rá húzott vonalat shortest_line.
     '''
 
-    blue = []
-    for _, row in nodes.iterrows():
-        pt = row.geometry
-        d = pt.distance(boundary)
-        if np.isfinite(d) and d <= DIST_LIM:
-            _, near = nearest_points(pt, boundary)
-            if near is not None and (not near.is_empty):
-                seg = LineString([pt, near])
-                if seg.length > MIN_SEG:
-                    blue.append(seg)
+    _, blue, _ = _legkozelebbi_vonalak(nodes.geometry.values, boundary, DIST_LIM)
+    blue = blue[shapely.length(blue) > MIN_SEG]
 
     return gpd.GeoSeries(blue, crs=nodes.crs)
 
 
-def kapcsolas(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_TOL=12.0, DEDUP_EPS=1.0):
+def dedup_points(points, eps):
+    '''
+    Pontok ritkítása sorrendben: egy pont marad, ha egyik korábban megtartott pont sincs tőle eps-en belül
+    (ugyanaz az eredmény, mint a páronkénti O(n²) összehasonlításnál).
+
+    A közeli párokat KD-fa adja (O(n log n)), a mohó döntés csak ezeken a párokon megy végig.
+    '''
+
+    if not points:
+        return []
+
+    pts = np.asarray(points, dtype=object)
+    xy = shapely.get_coordinates(pts)
+
+    # jelölt párok kicsit nagyobb sugárral, a pontos döntés a shapely távolsággal (mint p.distance(q))
+    par = cKDTree(xy).query_pairs(eps * (1 + 1e-9) + 1e-12, output_type="ndarray")
+    par = par[shapely.distance(pts[par[:, 0]], pts[par[:, 1]]) <= eps]
+
+    # minden ponthoz a nála korábbi közeli pontok
+    korabbi, kesobbi = par.min(axis=1), par.max(axis=1)
+    o = np.argsort(kesobbi, kind="stable")
+    korabbi, kesobbi = korabbi[o], kesobbi[o]
+    hatar = np.searchsorted(kesobbi, np.arange(len(pts) + 1))
+
+    marad = np.ones(len(pts), dtype=bool)
+    for j in np.unique(kesobbi):
+        if marad[korabbi[hatar[j]:hatar[j + 1]]].any():
+            marad[j] = False
+
+    return list(pts[marad])
+
+
+def _vegpontokra_snap(lines, xy, tol):
+    '''
+    Vonalak csúcsainak / szakaszainak ráhúzása a tol-on belüli pontokra (shapely snap), vonalanként csak a közeli pontokra
+    '''
+
+    lines = np.asarray(lines, dtype=object)
+    if not len(lines) or not len(xy):
+        return list(lines)
+
+    li, pi = shapely.STRtree(shapely.points(xy)).query(lines, predicate="dwithin", distance=tol)
+    if not len(li):
+        return list(lines)
+
+    o = np.argsort(li, kind="stable")
+    li, pi = li[o], pi[o]
+    vonal, eleje = np.unique(li, return_index=True)
+    pontok = shapely.multipoints(xy[pi], indices=np.repeat(np.arange(len(vonal)), np.diff(np.append(eleje, len(li)))))
+
+    lines = lines.copy()
+    lines[vonal] = shapely.snap(lines[vonal], pontok, tol)
+    return list(lines)
+
+
+def kapcsolas(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_TOL=12.0, DEDUP_EPS=1.0,
+              VEGPONT_SNAP=None):
+    '''
+    VEGPONT_SNAP: ha meg van adva (m), a connector végpontokat ekkora toleranciával ráhúzza a vonalakra a végső
+    union előtt (lásd kapcsolas_foltonkent); alapból ki van kapcsolva, az eredmény a korábbi
+    '''
+
     def extract_lines(geom):
         if geom is None or geom.is_empty:
             return []
@@ -264,18 +442,6 @@ def kapcsolas(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_
                 pts.append(Point(c[-1]))
         return pts
 
-    def dedup_points(points, eps):
-        kept = []
-        for p in points:
-            ok = True
-            for q in kept:
-                if p.distance(q) <= eps:
-                    ok = False
-                    break
-            if ok:
-                kept.append(p)
-        return kept
-
     # -------------------------------------------------
     # 0) CLIP POLY (MINDEN folt!)
 
@@ -326,14 +492,10 @@ def kapcsolas(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_
 
             strip_endpoints = dedup_points(endpoints_of_lines(in_strip), DEDUP_EPS)
 
-            for p in strip_endpoints:
-                d = p.distance(boundary_line)
-                if np.isfinite(d) and (1e-9 < d <= JOIN_TOL):
-                    _, q = nearest_points(p, boundary_line)
-                    if q is not None and (not q.is_empty):
-                        seg = LineString([p, q])
-                        if seg.length > 1e-6:
-                            connectors.append(seg)
+            # connectorok kötegelve: végpontonként a legközelebbi boundary pont, ha JOIN_TOL-on belül van
+            _, segs, d = _legkozelebbi_vonalak(np.asarray(strip_endpoints, dtype=object), boundary_line, JOIN_TOL)
+            segs = segs[(d > 1e-9) & (shapely.length(segs) > 1e-6)]
+            connectors.extend(segs)
 
             # dupla fal eltüntetés: vágjuk ki a strip-et a snapped hálóból
             other_clean = other_snapped.difference(border_strip)
@@ -342,6 +504,15 @@ def kapcsolas(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_
     # -------------------------------------------------
     # 4) Végső EGY réteg: (clipped_other + connectors + boundary) -> union + linemerge
 
+    # a connector végpontok csak lebegőpontos pontossággal vannak a határon / a levágott vonal végén:
+    # ráhúzom őket, különben a union (ha nem vált snapping noder-re) nem köti össze, zsákutca marad.
+    # Hogy a GEOS mikor vált snapping noder-re, a bemenet egészétől függ, ezért foltonkénti futtatásnál
+    # (kapcsolas_foltonkent) e nélkül a topológia eltérhet az egyben futtatottól.
+    if connectors and VEGPONT_SNAP:
+        vegpontok = shapely.get_coordinates(np.asarray(connectors, dtype=object))
+        clipped_other = _vegpontokra_snap(clipped_other, vegpontok, VEGPONT_SNAP)
+        boundary_lines = _vegpontokra_snap(boundary_lines, vegpontok, VEGPONT_SNAP)
+
     all_final = clipped_other + connectors + boundary_lines
     if not all_final:
         raise RuntimeError("Nincs semmi a végső hálóhoz (all_final üres).")
@@ -360,6 +531,88 @@ def kapcsolas(edges, orange, blue, res_area, SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_
     return network_gs_proj
 
 
+def _szomszedsag(geoms):
+    '''
+    Poligon szomszédsági gráf egyszer felépítve: {i: {j: közös határhossz}}, csak valódi (hossz > 0) szomszédok
+    '''
+
+    szomszed = {i: {} for i in range(len(geoms))}
+
+    i, j = shapely.STRtree(geoms).query(geoms, predicate="intersects")
+    egyszer = i < j
+    i, j = i[egyszer], j[egyszer]
+
+    hatar = shapely.boundary(geoms)
+    L = shapely.length(shapely.intersection(hatar[i], hatar[j]))
+
+    for a, b, l in zip(i.tolist(), j.tolist(), L.tolist()):
+        if l > 0:
+            szomszed[a][b] = l
+            szomszed[b][a] = l
+
+    return szomszed
+
+
+def kicsik_beolvasztasa(geoms, MIN_AREA=5000, MAX_STEPS=20000):
+    '''
+    MIN_AREA alatti poligonok beolvasztása a leghosszabb közös határú szomszédba, mindig a legkisebbet először.
+
+    A szomszédsági gráfot egyszer építi fel (élsúly: közös határhossz). Beolvasztáskor csak az érintett
+    szomszédok súlyai frissülnek (összeolvadt poligon és k közös határa = a két rész közös határainak összege),
+    a legkisebbet kupac (heap) adja. A geometriák uniója csak a végén, összeolvadt csoportonként készül el.
+
+    Visszaad: a megmaradó poligonok listáját, az eredeti sorrendben (az összeolvadt poligon annak a
+    helyén marad, amelyikbe beolvasztottuk).
+    '''
+
+    n = len(geoms)
+    terulet = shapely.area(geoms).tolist()
+    szomszed = _szomszedsag(geoms)
+    tagok = {i: [i] for i in range(n)}
+    el = np.ones(n, dtype=bool)
+
+    # (terület, sorszám): egyenlő területnél az előrébb lévő
+    heap = [(terulet[i], i) for i in range(n) if terulet[i] < MIN_AREA]
+    heapq.heapify(heap)
+
+    steps = 0
+    while steps < MAX_STEPS:
+        steps += 1
+
+        # elavult bejegyzések (már beolvasztott / azóta nagyobb poligon) eldobása
+        while heap and (not el[heap[0][1]] or heap[0][0] != terulet[heap[0][1]]):
+            heapq.heappop(heap)
+        if not heap:
+            break
+
+        a, i = heapq.heappop(heap)
+
+        # leghosszabb közös határú szomszéd (egyenlőségnél az előrébb lévő)
+        best_j = max(szomszed[i], key=lambda k: (szomszed[i][k], -k), default=None)
+
+        # Ha nincs valódi szomszéd közös éllel, akkor nem tudjuk szabályosan beolvasztani
+        # (ez tipikusan azt jelenti, hogy a polygonize partícióban van mikro rés / diszkontinuitás)
+        if best_j is None:
+            print(f"[STOP] Kicsi poligon ({np.count_nonzero(el[:i])}, area={a:.6f}) nem talál valódi szomszédot közös éllel.")
+            break
+
+        # olvasztás: i -> best_j (csak a gráfban, a geometria a végén)
+        for k, L in szomszed.pop(i).items():
+            del szomszed[k][i]
+            if k != best_j:
+                szomszed[best_j][k] = szomszed[best_j].get(k, 0.0) + L
+                szomszed[k][best_j] = szomszed[best_j][k]
+
+        terulet[best_j] += terulet[i]
+        tagok[best_j].extend(tagok.pop(i))
+        el[i] = False
+
+        if terulet[best_j] < MIN_AREA:
+            heapq.heappush(heap, (terulet[best_j], best_j))
+
+    return [geoms[j] if len(tagok[j]) == 1 else unary_union(geoms[tagok[j]]).buffer(0) for j in np.flatnonzero(el)]
+
+
 def egyesites(network_gs_proj, MIN_AREA=5000, MAX_STEPS=20000):
     '''
     MIN_AREA m2: ez alatt beolvasztjuk
@@ -385,57 +638,12 @@ def egyesites(network_gs_proj, MIN_AREA=5000, MAX_STEPS=20000):
     orig_union = unary_union(polygons_gdf.geometry)
 
     # ------------------------------------------------------------
-    # 2. KICS I POLIGONOK BEOLVASZTÁSA (EGYENKÉNT)
+    # 2. KICSI POLIGONOK BEOLVASZTÁSA
     #    - csak VALÓDI szomszéd: közös határhossz > 0
     #    - cél: akivel a leghosszabb a közös határ
 
-    pg = polygons_gdf.copy().reset_index(drop=True)
-
-    def shared_boundary_length(a, b):
-        inter = a.boundary.intersection(b.boundary)
-        return getattr(inter, "length", 0.0)
-
-    steps = 0
-    while steps < MAX_STEPS:
-        steps += 1
-
-        areas = pg.geometry.area
-        small_idx = areas[areas < MIN_AREA].index.tolist()
-        if not small_idx:
-            break
-
-        # mindig a legkisebbet olvasztjuk be először (stabilabb)
-        i = min(small_idx, key=lambda k: areas.iloc[k])
-        gi = pg.geometry.iloc[i]
-
-        # szomszédkeresés bbox + valódi közös határ
-        sidx = pg.sindex
-        cand = list(sidx.intersection(gi.bounds))
-        cand = [j for j in cand if j != i]
-
-        best_j = None
-        best_len = 0.0
-
-        for j in cand:
-            gj = pg.geometry.iloc[j]
-            L = shared_boundary_length(gi, gj)
-            if L > best_len:
-                best_len = L
-                best_j = j
-
-        # Ha nincs valódi szomszéd közös éllel, akkor nem tudjuk szabályosan beolvasztani
-        # (ez tipikusan azt jelenti, hogy a polygonize partícióban van mikro rés / diszkontinuitás)
-        if best_j is None or best_len <= 0:
-            print(f"[STOP] Kicsi poligon ({i}, area={areas.iloc[i]:.6f}) nem talál valódi szomszédot közös éllel.")
-            break
-
-        # olvasztás: i -> best_j
-        new_geom = unary_union([gi, pg.geometry.iloc[best_j]]).buffer(0)
-
-        # frissítés: célpoligon helyére új geom, kicsit eldobjuk
-        pg.at[best_j, "geometry"] = new_geom
-
-        pg = pg.drop(index=i).reset_index(drop=True)  # !!!!
+    pg = gpd.GeoDataFrame(geometry=kicsik_beolvasztasa(polygons_gdf.geometry.values, MIN_AREA, MAX_STEPS),
+                          crs=network_gs_proj.crs)
 
     # ------------------------------------------------------------
     # 3) ELLENŐRZÉS: nincs átfedés, nincs területvesztés
@@ -446,8 +654,3 @@ def egyesites(network_gs_proj, MIN_AREA=5000, MAX_STEPS=20000):
     print("Ellenőrzés: symmetric_difference area (terület eltérés):", symdiff_area)
 
     return pg
-
-
-
-
-
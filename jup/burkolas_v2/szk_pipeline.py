@@ -0,0 +1,311 @@
+import argparse
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import geopandas as gpd
+
+from polygon_fuggvenyek import (letoltes, vag_residential_city, res_area_es_boundary, orange_gen, blue_gen,
+                                kapcsolas, egyesites)
+from poligon_szk_fuggvenyek import add_color_to_gdf, pontok_polygonban, ures_polyk_besorolasa, polygonok_egyesitese
+from gm_rendezes import JsonlWriter
+from osm_cache import TTL, kivonat_azonosito
+from orszagos import OrszagosAdat
+from lepes_cache import LepesFuttato, LEPES_CACHE_DIR
+from csempezes import kapcsolas_foltonkent, egyesites_csempezve
+from tarolas import TAROLO_DIR, particio_iras, particio_olvasas, particio_letezik, gpkg_export
+
+
+'''
+Szavazókör poligon generálás: egy településre (generalas_pipeline) és az összesre párhuzamosan (generalas_batch)
+
+Használat:
+statusz = generalas_batch('2022-04-03', letoltes_param={'cache_dir': OSM_CACHE_DIR})
+statusz = generalas_batch('2022-04-03', letoltes_param={'orszagos': '../../adatok/fix/hungary.gpkg'})
+merged = particio_olvasas(SZIGETEK_NEV, telepulesnev_hu='Dunaharaszti', date='2022-04-03')
+
+futtato = LepesFuttato(LEPES_CACHE_DIR)
+gdf_szigetek = poly_gen_pipeline('Dunaharaszti', MIN_AREA=3000, futtato=futtato)
+futtato.riport()
+
+Parancssorból (lépésenkénti cache + riport):
+python szk_pipeline.py Dunaharaszti --param MIN_AREA=3000 --param SNAP_TOL=2
+'''
+
+
+# a pontok és az eredmények a GeoParquet tárolóban (tarolas.py), település és dátum szerint particionálva;
+# a régi GPKG csak akkor kerül beolvasásra, ha a tárolóban még nincs meg
+PONTOK_PATH = '../../adatok/working/osszekapcsolt_pontok_v1.gpkg'
+PONTOK_NEV = 'osszekapcsolt_pontok'
+SZIGETEK_NEV = 'szigetek_besorolt'
+OUT_DIR = '../../adatok/working'
+
+
+
+def _letoltes_kulcs(letoltes_param):
+    # a letoltes lépés kulcsa: ami az eredményt befolyásolja, stabilan hash-elhető formában
+    k = {x: v for x, v in letoltes_param.items() if x not in ("cache_dir", "ttl")}
+    if k.get("kivonat"):
+        k["kivonat"] = kivonat_azonosito(k["kivonat"])
+    if k.get("orszagos") is not None:
+        k["orszagos"] = k["orszagos"].azonosito
+    return k
+
+
+def poly_gen_pipeline(VAROS, MAX_EXT=200.0, EPS=0.25, DIST_LIM=100.0, MIN_SEG=0.1,
+                      SNAP_TOL=3.0, STRIP_TOL=10.0, JOIN_TOL=12.0, DEDUP_EPS=1.0, MIN_AREA=5000, MAX_STEPS=20000,
+                      TILE_SIZE=None, max_workers=None, futtato=None, **letoltes_param):
+    '''
+    TILE_SIZE: ha meg van adva (m), a kapcsolas lakott foltcsoportonként, az egyesites csempézve, párhuzamosan fut
+    (lásd csempezes.py), nagy városokhoz (pl. Budapest); max_workers: worker folyamatok
+    futtato: LepesFuttato (lépésenkénti cache, lásd lepes_cache.py); ha nincs megadva, minden lépés lefut
+    letoltes_param: a letoltes további paraméterei (cache_dir, kivonat, orszagos, ...)
+    '''
+
+    f = futtato or LepesFuttato()
+
+    # 1. poligonok létrehozása
+
+    # letöltöm a szükséges adatokat osm-ről (vagy cache-ből / kivonatból, lásd letoltes)
+    # adat: Gp, nodes, edges, res_p, city_boundary
+    adat = f.lepes("letoltes", letoltes, VAROS, kulcs_param=_letoltes_kulcs(letoltes_param),
+                   lejarat=letoltes_param.get("ttl", TTL), **letoltes_param)
+    res_cut = f.lepes("vag_residential_city", vag_residential_city, adat[3], adat[4])
+    # res_ab: res_area, boundary
+    res_ab = f.lepes("res_area_es_boundary", res_area_es_boundary, res_cut, adat[2])
+
+    orange = f.lepes("orange_gen", orange_gen, adat[0], adat[1], adat[2], MAX_EXT=MAX_EXT, EPS=EPS, MIN_SEG=MIN_SEG)
+    blue = f.lepes("blue_gen", blue_gen, adat[1], res_ab[1], DIST_LIM=DIST_LIM, MIN_SEG=MIN_SEG)
+
+    kapcsolas_param = dict(SNAP_TOL=SNAP_TOL, STRIP_TOL=STRIP_TOL, JOIN_TOL=JOIN_TOL, DEDUP_EPS=DEDUP_EPS)
+    egyesites_param = dict(MIN_AREA=MIN_AREA, MAX_STEPS=MAX_STEPS)
+
+    if TILE_SIZE is None:
+        network_gs_proj = f.lepes("kapcsolas", kapcsolas, adat[2], orange, blue, res_ab[0], **kapcsolas_param)
+
+        # itt vannak gdf-ben az összes generált polygon
+        polygons_merged_gdf = f.lepes("egyesites", egyesites, network_gs_proj, **egyesites_param)
+    else:
+        # a max_workers nem befolyásolja az eredményt, a kulcsba nem kerül bele
+        egyesites_param["TILE_SIZE"] = TILE_SIZE
+        network_gs_proj = f.lepes("kapcsolas", kapcsolas_foltonkent, adat[2], orange, blue, res_ab[0],
+                                  kulcs_param=kapcsolas_param, max_workers=max_workers, **kapcsolas_param)
+        polygons_merged_gdf = f.lepes("egyesites", egyesites_csempezve, network_gs_proj,
+                                      kulcs_param=egyesites_param, max_workers=max_workers, **egyesites_param)
+
+    gdf_szigetek = polygons_merged_gdf.ertek
+    return gdf_szigetek
+
+
+
+def kimenet_path(VAROS, out_dir=OUT_DIR):
+    # opcionális QGIS export helye
+    return os.path.join(out_dir, f'{VAROS}_szigetek_besorolt.gpkg')
+
+
+def pontok_betoltes(DATE=None, VAROS=None, path=PONTOK_PATH, gyoker=TAROLO_DIR):
+    '''
+    Összekapcsolt pontok a tárolóból, csak a kért partíció(k) (dátum / település) beolvasásával;
+    ha a tárolóban még nincsenek meg, a régi GPKG-ból (teljes beolvasás, utána szűrés)
+    '''
+
+    szurok = {k: v for k, v in (("date", DATE), ("telepulesnev_hu", VAROS)) if v is not None}
+
+    if os.path.isdir(os.path.join(gyoker, PONTOK_NEV)):
+        return particio_olvasas(PONTOK_NEV, gyoker=gyoker, **szurok)
+
+    gdf = gpd.read_file(path)
+    for k, v in szurok.items():
+        gdf = gdf[gdf[k] == v]
+    return gdf
+
+
+def generalas_pipeline(VAROS, DATE, gdf=None, out_path=None, gyoker=TAROLO_DIR, letoltes_param=None):
+    '''
+    gdf: a település összekapcsolt pontjai (ha nincs megadva, a tárolóból olvasom be a település partícióját)
+    Az eredmény a tárolóba kerül (SZIGETEK_NEV, település / dátum partíció);
+    out_path: ha meg van adva, GPKG export is (QGIS-hez)
+    '''
+
+    if gdf is None:
+        # beolvasom az összekapcsolt pontokat, városra és választásra szűrve
+        gdf = pontok_betoltes(DATE, VAROS, gyoker=gyoker)
+
+    # hozzárendelem a színeket a szavazókörökhöz (qgis vizualizációhoz)
+    gdf = add_color_to_gdf(gdf)
+
+    # legenerálom (később beolvasom) a beazonosítandó település parcellákat
+    gdf_szigetek = poly_gen_pipeline(VAROS, **(letoltes_param or {}))
+
+    # szavazókörhöz rendelem a poligonokat
+    results = pontok_polygonban(gdf, gdf_szigetek, max_depth=45)
+
+    # azokat a területeket amiben nincsen cím hozzárendelem a legnagyobb átfedésű szomszéd szavazókörhöz
+    results_filled = ures_polyk_besorolasa(results)
+
+    # a kis parcellákat egyesítem egyetelen multypolygonba
+    merged = polygonok_egyesitese(results_filled, start_tol=0.2, max_tol=20)
+
+    # mentés a tárolóba (ideiglenes mappába, majd átnevezés: félbeszakadt írás nem számít késznek)
+    merged["telepulesnev_hu"] = VAROS
+    merged["date"] = DATE
+    particio_iras(merged, SZIGETEK_NEV, gyoker=gyoker)
+
+    # export qgis-be
+    if out_path is not None:
+        gpkg_export(merged, out_path)
+
+    return gdf, gdf_szigetek
+
+
+
+def pontok_felosztasa(DATE, path=PONTOK_PATH, gdf=None, gyoker=TAROLO_DIR):
+    '''
+    Az összekapcsolt pontokat egyszer olvasom be (csak a DATE partíciókat), és településenként felosztom:
+    {telepulesnev_hu: gdf}
+    '''
+
+    if gdf is None:
+        gdf = pontok_betoltes(DATE, path=path, gyoker=gyoker)
+
+    gdf = gdf[gdf["date"] == DATE]
+    return {varos: grp for varos, grp in gdf.groupby("telepulesnev_hu", sort=False)}
+
+
+class Idotullepes(BaseException):
+    '''
+    A település időkorlátja lejárt (SIGALRM). BaseException, hogy a pipeline kódjában lévő
+    except Exception ágak (fallbackek, újrapróbálások) ne nyeljék el, csak a _generalas_feladat kapja el.
+    '''
+
+
+def _idotullepes(signum, frame):
+    raise Idotullepes("időtúllépés")
+
+
+# a worker folyamat letoltes paraméterei (_worker_init tölti be, egyszer folyamatonként)
+_worker_letoltes_param = None
+
+
+def _worker_init(letoltes_param):
+    # worker indításkor: ha az orszagos egy kivonat útvonala, itt töltöm be (folyamatonként egyszer),
+    # így nem kell minden feladathoz az egész országos adatot átküldeni
+    global _worker_letoltes_param
+    param = dict(letoltes_param or {})
+    if isinstance(param.get("orszagos"), str):
+        param["orszagos"] = OrszagosAdat(param["orszagos"], verbose=False)
+    _worker_letoltes_param = param
+
+
+def _generalas_feladat(VAROS, DATE, gdf, out_path, gyoker, timeout):
+    # worker folyamatban fut: időkorlát SIGALRM-mel (ahol van), a hibát visszaadja, nem dobja tovább
+    letoltes_param = _worker_letoltes_param
+    t0 = time.perf_counter()
+    van_alarm = timeout is not None and hasattr(signal, "SIGALRM")
+    if van_alarm:
+        signal.signal(signal.SIGALRM, _idotullepes)
+        signal.alarm(int(max(1, timeout)))
+
+    try:
+        generalas_pipeline(VAROS, DATE, gdf=gdf, out_path=out_path, gyoker=gyoker, letoltes_param=letoltes_param)
+        statusz, hiba = "kesz", None
+    except Idotullepes as e:
+        statusz, hiba = "idotullepes", repr(e)
+    except Exception as e:
+        statusz, hiba = "hiba", repr(e)
+    finally:
+        if van_alarm:
+            signal.alarm(0)
+
+    return {"varos": VAROS, "date": DATE, "statusz": statusz, "hiba": hiba, "pontok": len(gdf),
+            "ido": round(time.perf_counter() - t0, 2)}
+
+
+def generalas_batch(DATE, varosok=None, path=PONTOK_PATH, gdf=None, out_dir=OUT_DIR, gyoker=None, gpkg=False,
+                    max_workers=None, timeout=3600, ujra=False, letoltes_param=None, verbose=True):
+    '''
+    generalas_pipeline minden településre, párhuzamosan (ProcessPoolExecutor)
+
+    - a pontokat egyszer olvassa be és osztja fel településenként
+    - a legnagyobb településekkel kezd (pontok száma szerint), hogy ne a legnagyobb fusson utoljára
+    - minden település eredménye rögtön kiíródik, ahogy elkészül
+    - timeout mp után a település "idotullepes" státuszt kap, egy település hibája nem állítja le a többit
+    - újrafuttatáskor a már kész (meglévő partíciójú) településeket kihagyja (ujra=True: mindet újragenerálja)
+    - státusz napló: out_dir/generalas_statusz_{DATE}.jsonl
+    - eredmények: gyoker tároló (alapból out_dir/tarolo), SZIGETEK_NEV; gpkg=True: QGIS export is out_dir-be
+    - letoltes_param: worker folyamatonként egyszer kerül át (initializer), nem feladatonként;
+      az orszagos lehet kivonat útvonal is, ekkor minden worker maga tölti be az OrszagosAdat-ot
+
+    Visszaad egy {település: státusz rekord} szótárat.
+    '''
+
+    os.makedirs(out_dir, exist_ok=True)
+    gyoker = gyoker or os.path.join(out_dir, 'tarolo')
+    reszek = pontok_felosztasa(DATE, path=path, gdf=gdf, gyoker=gyoker)
+    if varosok is not None:
+        reszek = {v: reszek[v] for v in varosok if v in reszek}
+
+    # legnagyobb először
+    sorrend = sorted(reszek, key=lambda v: len(reszek[v]), reverse=True)
+
+    kesz = {v for v in sorrend if not ujra and particio_letezik(SZIGETEK_NEV, (v, DATE), gyoker=gyoker)}
+    feladatok = [v for v in sorrend if v not in kesz]
+
+    if verbose:
+        print(len(sorrend), 'település, ebből', len(kesz), 'már kész,', len(feladatok), 'generálása')
+
+    eredmeny = {}
+    with JsonlWriter(os.path.join(out_dir, f'generalas_statusz_{DATE}.jsonl')) as naplo:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_worker_init, initargs=(letoltes_param,)) as ex:
+            futures = {ex.submit(_generalas_feladat, v, DATE, reszek[v], kimenet_path(v, out_dir) if gpkg else None,
+                                 gyoker, timeout): v for v in feladatok}
+
+            for f in as_completed(futures):
+                try:
+                    rec = f.result()
+                except Exception as e:
+                    # pl. a worker folyamat elhalt
+                    rec = {"varos": futures[f], "date": DATE, "statusz": "hiba", "hiba": repr(e),
+                           "pontok": len(reszek[futures[f]]), "ido": None}
+
+                naplo.write(rec)
+                eredmeny[rec["varos"]] = rec
+                if verbose:
+                    print(f'{rec["varos"]}: {rec["statusz"]} ({rec["ido"]} s) {rec["hiba"] or ""}'.rstrip(),
+                          f'[{len(eredmeny)}/{len(feladatok)}]')
+
+    for v in sorrend:
+        if v in kesz:
+            eredmeny[v] = {"varos": v, "date": DATE, "statusz": "kihagyva", "hiba": None,
+                          "pontok": len(reszek[v]), "ido": None}
+
+    return eredmeny
+
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="poly_gen_pipeline lépésenkénti cache-sel")
+    parser.add_argument("VAROS")
+    parser.add_argument("--cache-dir", default=LEPES_CACHE_DIR, help="lépés cache mappa")
+    parser.add_argument("--kivonat", default=None, help="helyi .gpkg / .osm.pbf kivonat (offline)")
+    parser.add_argument("--param", action="append", default=[], metavar="NEV=ERTEK",
+                        help="poly_gen_pipeline paraméter, pl. MIN_AREA=3000 (többször is megadható)")
+    parser.add_argument("--out", default=None, help="kimeneti gpkg")
+    args = parser.parse_args()
+
+    param = {}
+    for p in args.param:
+        nev, ertek = p.split("=", 1)
+        param[nev] = int(ertek) if nev in ("MAX_STEPS", "max_workers") else float(ertek)
+    if args.kivonat:
+        param["kivonat"] = args.kivonat
+
+    futtato = LepesFuttato(args.cache_dir, verbose=True)
+    gdf_szigetek = poly_gen_pipeline(args.VAROS, futtato=futtato, **param)
+    futtato.riport()
+
+    if args.out:
+        gpkg_export(gdf_szigetek, args.out)
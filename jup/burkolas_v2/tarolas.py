@@ -0,0 +1,158 @@
+import os
+import shutil
+import datetime
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import geopandas as gpd
+
+
+'''
+A pipeline lépései közötti köztes eredmények (összekapcsolt pontok, besorolt szigetek, ...) tárolása
+GeoParquet-ben, GPKG helyett.
+
+Egy adathalmaz (nev) egy mappa, település és dátum szerint hive particionálva:
+    TAROLO_DIR/nev/telepulesnev_hu=Tököl/date=2022-04-03/part-0.parquet
+A fájlok bbox covering oszloppal (GeoParquet 1.1) íródnak, így olvasáskor a bbox szűrés a row group
+statisztikákon történik (predikátum pushdown), a partíció szűrés pedig csak a szükséges mappákat nyitja meg.
+
+A GPKG csak opcionális végső export (QGIS-hez): gpkg_export.
+
+Használat:
+particio_iras(all_matched, 'osszekapcsolt_pontok')
+gdf = particio_olvasas('osszekapcsolt_pontok', telepulesnev_hu='Tököl', date='2022-04-03')
+gpkg_export(merged, '../../adatok/working/Tököl_szigetek_besorolt.gpkg')
+'''
+
+
+TAROLO_DIR = '../../adatok/working/tarolo'
+PARTICIO = ("telepulesnev_hu", "date")
+
+
+
+def _particio_ertek(v):
+    # dátum típusú érték ISO napként (YYYY-MM-DD), hogy a mappanév és a szűrők a string dátummal egyezzenek
+    if isinstance(v, (datetime.date, pd.Timestamp)):
+        if isinstance(v, datetime.datetime) and v != datetime.datetime.combine(v.date(), datetime.time(), v.tzinfo):
+            raise ValueError(f"Partíció értéknek csak nap pontosságú dátum adható meg: {v}")
+        return v.strftime("%Y-%m-%d")
+    return str(v)
+
+
+def _particio_oszlop(s):
+    # dátum típusú (datetime64 / date) oszlop ISO nap stringgé, a többi marad
+    if pd.api.types.is_datetime64_any_dtype(s) or pd.api.types.infer_dtype(s, skipna=True) in ("date", "datetime"):
+        return s.map(lambda v: v if pd.isna(v) else _particio_ertek(v))
+    return s
+
+
+def _particio_mappa(gyoker, nev, particio, ertekek):
+    # hive mappanév: oszlop=érték, az érték URL kódolva (ékezet, szóköz, perjel)
+    reszek = [f'{p}={quote(_particio_ertek(v), safe="")}' for p, v in zip(particio, ertekek)]
+    return os.path.join(gyoker, nev, *reszek)
+
+
+def particio_iras(gdf, nev, particio=PARTICIO, gyoker=TAROLO_DIR):
+    '''
+    gdf kiírása partíciónként (a meglévő partíciók közül csak az érintetteket írja felül)
+
+    A dátum típusú partíció oszlopok (pl. GPKG-ból beolvasott date) ISO napként (YYYY-MM-DD) kerülnek a mappanévbe.
+    Hiányzó partíció kulcs esetén hibát dob (a hive null partíció nem olvasható vissza kategóriaként).
+
+    Egy partíció ideiglenes, ponttal kezdődő mappába íródik, majd átnevezés: félbeszakadt írás nem látszik késznek,
+    és egy bennmaradt ideiglenes mappát az olvasás (pyarrow) sem vesz partíciónak.
+    Visszaad: a kiírt partíciók mappái
+    '''
+
+    particio = list(particio)
+    hianyzo = [p for p in particio if p not in gdf.columns]
+    if hianyzo:
+        raise ValueError(f"Hiányzó partíció oszlop(ok): {hianyzo}")
+
+    hianyos = {p: int(n) for p, n in gdf[particio].isna().sum().items() if n}
+    if hianyos:
+        raise ValueError(f"Hiányzó partíció kulcs (sorok száma oszloponként): {hianyos}")
+
+    kulcsok = [_particio_oszlop(gdf[p]) for p in particio]
+
+    mappak = []
+    for ertekek, grp in gdf.groupby(kulcsok, sort=False):
+        ertekek = ertekek if isinstance(ertekek, tuple) else (ertekek,)
+        mappa = _particio_mappa(gyoker, nev, particio, ertekek)
+        tmp = os.path.join(os.path.dirname(mappa), f".tmp{os.getpid()}_{os.path.basename(mappa)}")
+        os.makedirs(tmp, exist_ok=True)
+
+        # a partíció oszlopok a mappanévben vannak
+        grp.drop(columns=particio).reset_index(drop=True).to_parquet(
+            os.path.join(tmp, "part-0.parquet"), write_covering_bbox=True, schema_version="1.1.0")
+
+        if os.path.exists(mappa):
+            shutil.rmtree(mappa)
+        os.replace(tmp, mappa)
+        mappak.append(mappa)
+
+    return mappak
+
+
+def particio_olvasas(nev, gyoker=TAROLO_DIR, bbox=None, columns=None, **szurok):
+    '''
+    Egy adathalmaz beolvasása, partíció szűréssel és bbox pushdownnal
+
+    szurok: partíció oszlop = érték (vagy értékek listája), pl. telepulesnev_hu='Tököl', date='2022-04-03'
+    bbox: (minx, miny, maxx, maxy) a tárolt CRS-ben; a bbox-ot metsző geometriák jönnek vissza
+    '''
+
+    filters = [(k, "in", [_particio_ertek(x) for x in v]) if isinstance(v, (list, tuple, set))
+               else (k, "=", _particio_ertek(v)) for k, v in szurok.items()]
+
+    gdf = gpd.read_parquet(os.path.join(gyoker, nev), columns=columns, filters=filters or None, bbox=bbox)
+
+    # a hive partíció oszlopok kategóriaként jönnek vissza
+    for c in gdf.columns:
+        if isinstance(gdf[c].dtype, pd.CategoricalDtype):
+            gdf[c] = gdf[c].astype(str)
+
+    return gdf
+
+
+def particiok(nev, particio=PARTICIO, gyoker=TAROLO_DIR):
+    '''
+    Meglévő partíciók: DataFrame a partíció oszlopokkal (pl. a már kész települések kihagyásához)
+    '''
+
+    gyoker = os.path.join(gyoker, nev)
+    sorok = []
+    if os.path.isdir(gyoker):
+        for mappa, almappak, fajlok in os.walk(gyoker):
+            # ponttal / aláhúzással kezdődő (pl. ideiglenes) mappákat a pyarrow sem olvas
+            almappak[:] = [m for m in almappak if not m.startswith((".", "_"))]
+            if not any(f.endswith(".parquet") for f in fajlok):
+                continue
+            reszek = [r.split("=", 1) for r in os.path.relpath(mappa, gyoker).split(os.sep)]
+            sorok.append({k: unquote(v) for k, v in reszek})
+
+    return pd.DataFrame(sorok, columns=list(particio))
+
+
+def particio_letezik(nev, ertekek, particio=PARTICIO, gyoker=TAROLO_DIR):
+    mappa = _particio_mappa(gyoker, nev, particio, ertekek)
+    return os.path.exists(os.path.join(mappa, "part-0.parquet"))
+
+
+
+def gpkg_export(gdf, path, layer='network_polygons'):
+    '''
+    Végső export QGIS-hez (ideiglenes fájlba, majd átnevezés)
+    '''
+
+    tmp = os.path.join(os.path.dirname(path), '.tmp_' + os.path.basename(path))
+    gdf.to_file(tmp, layer=layer, driver='GPKG')
+    os.replace(tmp, path)
+
+
+def gpkg_importalas(path, nev, particio=PARTICIO, gyoker=TAROLO_DIR):
+    '''
+    Meglévő GPKG (pl. osszekapcsolt_pontok_v1.gpkg) egyszeri átírása a tárolóba
+    '''
+
+    return particio_iras(gpd.read_file(path), nev, particio=particio, gyoker=gyoker)
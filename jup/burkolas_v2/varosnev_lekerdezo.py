@@ -1,22 +1,36 @@
 import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from gm_rendezes import JsonlWriter
+
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+# ezekre a státuszokra újrapróbálok (túl sok kérés / átmeneti szerver hiba)
+UJRA_STATUSZ = (429, 500, 502, 503, 504)
 
 
 
-def varosnev_hu(varos):
+def varosnev_hu(varos, session=None, url=NOMINATIM_URL):
     '''
     A címek az adatbázisba duplikálva voltak minden nyelvű városnévvel.
     Az adatbázisba a duplikáltak törlése után sok helyen a településnév nem magyarul maradt benne.
     A függvény osm-ről lekérdezi a település (elsődleges) magyar nevét.
     '''
 
-    r = requests.get("https://nominatim.openstreetmap.org/search", params={
+    r = (session or requests).get(url, params={
         "format": "json",
         "q": varos,
         "limit": 1,
         "addressdetails": 1,
         "accept-language": "hu"
-    }, headers={"User-Agent": "hu-cityname/1.0"})
+    }, headers={"User-Agent": "hu-cityname/1.0"}, timeout=30)
+    r.raise_for_status()
 
     j = r.json()
     if not j:
@@ -27,22 +41,159 @@ def varosnev_hu(varos):
 
 
 
+class TokenBucket:
+    '''
+    Szálbiztos token bucket: átlagosan rate kérés / másodperc, legfeljebb capacity kérés egyszerre
+    (a nyilvános Nominatim 1 kérés / s-ot enged)
+    '''
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                most = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (most - self.t) * self.rate)
+                self.t = most
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                varas = (1 - self.tokens) / self.rate
+            time.sleep(varas)
+
+
+
+class VarosnevResolver:
+    '''
+    Településnév -> magyar név feloldó Nominatim-ról
+
+    - egy közös (pool-os) HTTP session
+    - token bucket rate limit, az újrapróbálások is ezen mennek át (429 / 5xx / kapcsolati hiba esetén
+      backoff, a Retry-After fejlécet betartva)
+    - folyamatosan bővülő jsonl cache: minden feloldott név rögtön a lemezre kerül,
+      egy megszakadt futás ott folytatódik ahol abbamaradt
+
+    Használat:
+    with VarosnevResolver('../../adatok/working/varosnevek_cache.jsonl') as resolver:
+        m = resolver.bulk(nevek)
+    '''
+
+    def __init__(self, cache_path, url=NOMINATIM_URL, rate=1.0, capacity=1, max_workers=4, retries=3,
+                 batch_size=20, flush_interval=5.0, backoff=1.0):
+        self.url = url
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, capacity)
+
+        # az adapter nem próbál újra (az a rate limit mellett menne), az újrapróbálás a resolve-ban van
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # cache betöltése (ami már megvan, azt nem kérdezem le újra)
+        self.writer = JsonlWriter(cache_path, batch_size=batch_size, flush_interval=flush_interval)
+        self.cache = {nev: hu for nev, hu in self.writer.read_all()}
+        self.lock = threading.Lock()
+
+        self.stat = {"cache_talalat": 0, "lekerdezve": 0, "ujraprobalva": 0, "hiba": 0}
+
+    def _varakozas(self, e, kiserlet):
+        # a szerver által kért várakozás (Retry-After másodpercben), különben exponenciális backoff
+        resp = getattr(e, "response", None)
+        try:
+            return float(resp.headers["Retry-After"])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return self.backoff * 2 ** kiserlet
+
+    def resolve(self, varos):
+        with self.lock:
+            if varos in self.cache:
+                self.stat["cache_talalat"] += 1
+                return self.cache[varos]
+
+        for kiserlet in range(self.retries + 1):
+            # minden kísérlet (az újrapróbálás is) tokent kér
+            self.bucket.acquire()
+            try:
+                hu = varosnev_hu(varos, session=self.session, url=self.url)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                statusz = getattr(getattr(e, "response", None), "status_code", None)
+                if kiserlet == self.retries or (isinstance(e, requests.HTTPError) and statusz not in UJRA_STATUSZ):
+                    raise
+                with self.lock:
+                    self.stat["ujraprobalva"] += 1
+                time.sleep(self._varakozas(e, kiserlet))
+
+        with self.lock:
+            self.cache[varos] = hu
+            self.writer.write([varos, hu])
+            self.stat["lekerdezve"] += 1
+
+        return hu
+
+    def bulk(self, nevek, verbose=True):
+        '''
+        Sok név feloldása párhuzamosan (a rate limit közös). Visszaad egy {név: magyar név} szótárat.
+        A hibás lekérdezések kimaradnak a szótárból (következő futáskor újra próbálja őket).
+        '''
+
+        nevek = list(dict.fromkeys(nevek))
+        hianyzo = [x for x in nevek if x not in self.cache]
+        self.stat["cache_talalat"] += len(nevek) - len(hianyzo)
+
+        if verbose:
+            print(len(nevek), 'város, ebből', len(hianyzo), 'lekérdezése (a többi cache-ből)')
+
+        def _egy(x):
+            try:
+                return x, self.resolve(x)
+            except requests.RequestException as e:
+                print('Hiba:', x, repr(e))
+                with self.lock:
+                    self.stat["hiba"] += 1
+                return x, None
+
+        kesz = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            for x, mn in ex.map(_egy, hianyzo):
+                kesz += 1
+                if verbose:
+                    print(x, mn, round((kesz / max(len(hianyzo), 1)) * 100, 2), '%')
+
+        self.writer.commit()
+
+        return {x: self.cache[x] for x in nevek if x in self.cache}
+
+    def close(self):
+        self.writer.close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 
-with open("../../adatok/working/varosnevek_lekerdezni.pkl", "rb") as f:
-    u = pickle.load(f)
 
-osszes_db = len(u)
-print(osszes_db, 'város lekérdezése')
+if __name__ == '__main__':
 
-m = {}
-lekert = 0
-for x in u:
-    mn = varosnev_hu(x)
-    lekert += 1
-    print(x, mn, round((lekert/osszes_db)*100, 2), '%')
-    m[x] = mn
+    with open("../../adatok/working/varosnevek_lekerdezni.pkl", "rb") as f:
+        u = pickle.load(f)
 
+    print(len(u), 'város lekérdezése')
 
-with open("../../adatok/fix/varosnevek_hu_map.pkl", "wb") as f:
-    pickle.dump(m, f)
+    with VarosnevResolver("../../adatok/working/varosnevek_hu_cache.jsonl") as resolver:
+        m = resolver.bulk(u)
 
+    with open("../../adatok/fix/varosnevek_hu_map.pkl", "wb") as f:
+        pickle.dump(m, f)
@@ -1,5 +1,6 @@
 import json
 import os
+import time
 
 import pandas as pd
 import geopandas as gpd
@@ -19,23 +20,137 @@ Maga a lekérdézeés megtaláható egy másik repooban: https://github.com/e003
 josnl olvasásához és írásához szükséges osztály
 '''
 class JsonlWriter:
-    def __init__(self, path):
+    '''
+    jsonl fájl írása és olvasása
+
+    - alapból minden rekord után megnyitja a fájlt és fsync-el (lassú, de minden sor rögtön lemezen van)
+    - batch_size / flush_interval megadásával nyitva tartja a fájlt és csoportosan commitol:
+      batch_size rekordonként vagy flush_interval másodpercenként flush + fsync
+    - az első íráskor a félbemaradt utolsó sort (program leállás írás közben) levágja; olvasáskor a fájlt
+      nem módosítja (egy másik, még futó író épp félig kiírt sorát sem), a sortörés nélküli utolsó sort kihagyja
+    '''
+
+    def __init__(self, path, batch_size=None, flush_interval=None):
         self.path = path
-        open(self.path, "a", encoding="utf-8").close()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._f = None
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._recovered = False
+
+    @property
+    def buffered(self):
+        return self.batch_size is not None or self.flush_interval is not None
+
+    def _irasra_nyit(self):
+        # csak az író nyúl a fájlhoz: létrehozás + félbemaradt sor javítása az első írás előtt
+        if not self._recovered:
+            open(self.path, "a", encoding="utf-8").close()
+            self._recover()
+            self._recovered = True
+
+    def _recover(self):
+        # ha a fájl nem sortöréssel végződik akkor az utolsó sor írása megszakadt
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b"\n":
+                return
+
+            # utolsó sortörés megkeresése visszafelé olvasva
+            pos = end
+            start = 0
+            while pos > 0:
+                step = min(1 << 16, pos)
+                pos -= step
+                f.seek(pos)
+                i = f.read(step).rfind(b"\n")
+                if i != -1:
+                    start = pos + i + 1
+                    break
+
+            f.seek(start)
+            tail = f.read()
+            try:
+                json.loads(tail.decode("utf-8"))
+                # a sor egész, csak a sortörés hiányzik
+                f.write(b"\n")
+            except ValueError:
+                print('Félbemaradt utolsó sor levágva:', self.path)
+                f.truncate(start)
 
-    def write(self, record: dict):
-        line = json.dumps(record, ensure_ascii=False)
-        # data lemezre
-        with open(self.path, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
             f.flush()
             os.fsync(f.fileno())
 
+    def write(self, record: dict):
+        self._irasra_nyit()
+        line = json.dumps(record, ensure_ascii=False)
+
+        if not self.buffered:
+            # data lemezre
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            return
+
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+
+        self._f.write(line + "\n")
+        self._pending += 1
+
+        if self.batch_size is not None and self._pending >= self.batch_size:
+            self.commit()
+        elif self.flush_interval is not None and time.monotonic() - self._last_commit >= self.flush_interval:
+            self.commit()
+
+    def commit(self):
+        '''
+        A pufferelt sorok lemezre írása (group commit)
+        '''
+        if self._f is not None and self._pending:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        if self._f is not None:
+            self.commit()
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def read_all(self):
         if not os.path.exists(self.path):
             return []
+        self.commit()
         with open(self.path, "r", encoding="utf-8") as f:
-            return [json.loads(line) for line in f if line.strip()]
+            return list(self._rekordok(f))
+
+    @staticmethod
+    def _rekordok(f):
+        # a sortörés nélküli utolsó sor félbemaradt (vagy egy író épp most írja): csak ha egész json, akkor kell
+        for line in f:
+            if not line.strip():
+                continue
+            if not line.endswith("\n"):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    pass
+                return
+            yield json.loads(line)
 
 
 
@@ -64,7 +179,7 @@ def read_jsonl_to_df(path='./orszagos_teljes_ms.jsonl'):
 
     })
 
-    df_jav = df.apply(fix_lat_lon, axis=1)
+    df_jav = fix_lat_lon_vektor(df)
 
     df_jav = df_jav[['geoid', 'cim', 'telepules', 'lat', 'lon']]
 
@@ -127,6 +242,64 @@ def fix_lat_lon(row):
 
 
 
+'''
+A fix_lat_lon oszlopos (vektorizált) változata, ugyanazzal a logikával, de egyszerre az egész df-en.
+
+Minden oszlopot egyszer alakít float mátrixszá, soronként az első tartományba eső (lat: 45-49, lon: 16-23)
+oszlopot numpy műveletekkel keresi meg. A lat-nak elhasznált oszlop nem lehet lon.
+Eredménye megegyezik a df.apply(fix_lat_lon, axis=1) eredményével.
+'''
+def fix_lat_lon_vektor(df):
+    out = df.copy()
+    n = len(df)
+    if n == 0:
+        return out
+
+    # minden érték numerikussá kényszerítve (ami nem szám, az NaN lesz), egyetlen float mátrixba
+    coords = np.column_stack([pd.to_numeric(df.iloc[:, j], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                              for j in range(df.shape[1])])
+
+    sorok = np.arange(n)
+    nan = np.full(n, np.nan)
+
+    lat_cur = coords[:, df.columns.get_loc('lat')] if 'lat' in df.columns else nan
+    lon_cur = coords[:, df.columns.get_loc('lon')] if 'lon' in df.columns else nan
+
+    with np.errstate(invalid='ignore'):
+        lat_ok = (lat_cur >= 45) & (lat_cur <= 49)
+        lon_ok = (lon_cur >= 16) & (lon_cur <= 23)
+
+        # jelöltek keresése a sorokban
+        lat_mask = (coords >= 45) & (coords <= 49)
+        lon_mask = (coords >= 16) & (coords <= 23)
+
+    # új lat: a jelenlegi ha jó, különben az első jelölt
+    lat_idx = lat_mask.argmax(axis=1)
+    van_lat = lat_mask[sorok, lat_idx]
+    new_lat = np.where(lat_ok, lat_cur, np.where(van_lat, coords[sorok, lat_idx], np.nan))
+
+    # lon-jelöltekből kidobjuk azt az oszlopot, amit lat-nak már elhasználtunk
+    hasznalt = ~lat_ok & van_lat
+    lon_mask[sorok[hasznalt], lat_idx[hasznalt]] = False
+
+    # új lon: a jelenlegi ha jó, különben az első (megmaradt) jelölt
+    lon_idx = lon_mask.argmax(axis=1)
+    van_lon = lon_mask[sorok, lon_idx]
+    new_lon = np.where(lon_ok, lon_cur, np.where(van_lon, coords[sorok, lon_idx], np.nan))
+
+    # ahol már most is jó volt mindkettő, ott nem piszkáljuk
+    marad = lat_ok & lon_ok
+    for col, uj in (('lat', new_lat), ('lon', new_lon)):
+        if col in df.columns:
+            out[col] = df[col].where(marad, pd.Series(uj, index=df.index)).infer_objects()
+        else:
+            out[col] = uj
+
+    return out
+
+
+
+
 
 
 
@@ -156,28 +329,103 @@ def cim_feldolgozas(df):
 
 
 '''
-df-ből kiszedi azokat a sorokat, amik a megadott település poligonján belül vannak
+Település határok (poligonok) lekérése osm-ről, egyszer: memóriában és opcionálisan lemezen (GeoParquet) cache-elve
 '''
-def filter_df_varos(df, varos_nev, lat_col='lat', lon_col='lon'):
+_HATAR_CACHE = {}
+
+def varos_hatarok(varos_nevek, cache_path=None, verbose=False):
+    '''
+    Visszaad egy GeoDataFrame-et (varos, geometry; EPSG:4326) a megadott településekkel, névsorrendben.
+    Csak azokat kérdezi le osm-ről, amik még nincsenek se a memóriában, se a cache_path fájlban.
+    A nem található településeket kihagyja (és kiírja).
+    '''
+
+    varos_nevek = list(dict.fromkeys(varos_nevek))
+
+    if cache_path is not None and os.path.exists(cache_path):
+        lemez = gpd.read_parquet(cache_path)
+        for nev, geom in zip(lemez["varos"], lemez.geometry):
+            _HATAR_CACHE.setdefault(nev, geom)
+
+    hianyzo = [x for x in varos_nevek if x not in _HATAR_CACHE]
+    if verbose:
+        print(len(varos_nevek), 'település, ebből', len(hianyzo), 'határ lekérése (a többi cache-ből)')
+
+    uj = 0
+    for nev in hianyzo:
+        try:
+            place_gdf = ox.geocode_to_gdf(nev)
+        except Exception as e:
+            # osmnx többféle hibát dob (nincs találat, nem poligon, hálózat)
+            print('Nem található határ:', nev, repr(e))
+            continue
+        _HATAR_CACHE[nev] = place_gdf.to_crs(epsg=4326).geometry.union_all()
+        uj += 1
 
-    # település poligon lekérése
-    place_gdf = ox.geocode_to_gdf(varos_nev)
+    if cache_path is not None and uj:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        gpd.GeoDataFrame({"varos": list(_HATAR_CACHE)}, geometry=list(_HATAR_CACHE.values()),
+                         crs="EPSG:4326").to_parquet(cache_path)
 
-    city_geom = place_gdf.to_crs(epsg=4326).geometry.union_all()
+    nevek = [x for x in varos_nevek if x in _HATAR_CACHE]
+    return gpd.GeoDataFrame({"varos": nevek}, geometry=[_HATAR_CACHE[x] for x in nevek], crs="EPSG:4326")
+
+
+
+
+'''
+df minden sorát hozzárendeli ahhoz a településhez, aminek a poligonján belül van (egyetlen térbeli join)
+'''
+def varos_szerinti_felosztas(df, varos_nevek=None, hatarok=None, lat_col='lat', lon_col='lon', cache_path=None):
+    '''
+    Visszaad egy {település: df részlet} szótárat (a filter_df_varos eredményével egyezően, minden
+    megadott településhez, üreset is).
+
+    A határokat vagy kész GeoDataFrame-ként (hatarok: varos, geometry), vagy névlistaként (varos_nevek) kapja,
+    utóbbi esetben varos_hatarok tölti be őket. Az sjoin STRtree indexet épít és előkészített (prepared)
+    geometriákkal dönti el a within-t, így az országos pontokat egyszer járja be, nem településenként.
+    '''
+
+    if hatarok is None:
+        hatarok = varos_hatarok(varos_nevek, cache_path=cache_path)
+    hatarok = hatarok[["varos", "geometry"]].to_crs(epsg=4326)
 
     # eldobjuk a koordináta nélküli sorokat
-    df2 = df.dropna(subset=[lat_col, lon_col]).copy()
+    df2 = df.dropna(subset=[lat_col, lon_col])
 
-    # GeoDataFrame pontokkal
     geometry = gpd.points_from_xy(df2[lon_col], df2[lat_col], crs="EPSG:4326")
-    gdf_points = gpd.GeoDataFrame(df2, geometry=geometry, crs="EPSG:4326")
+    gdf_points = gpd.GeoDataFrame({"_pos": np.arange(len(df2))}, geometry=geometry, crs="EPSG:4326")
+
+    joined = gpd.sjoin(gdf_points, hatarok, how="inner", predicate="within")
+
+    # település szerint, azon belül eredeti sorrendben
+    joined = joined.sort_values(["varos", "_pos"], kind="stable")
+    pos = joined["_pos"].to_numpy()
+    varos = joined["varos"].to_numpy()
+
+    reszek = {nev: df2.iloc[:0] for nev in hatarok["varos"]}
+    if len(pos):
+        hatar = np.flatnonzero(varos[1:] != varos[:-1]) + 1
+        for p in np.split(np.arange(len(pos)), hatar):
+            reszek[varos[p[0]]] = df2.iloc[pos[p]]
+
+    return reszek
 
-    # pont a városon belül?
-    mask = gdf_points.within(city_geom)
 
-    return gdf_points[mask].drop(columns=['geometry'])
 
 
+'''
+df-ből kiszedi azokat a sorokat, amik a megadott település poligonján belül vannak
+(sok településre egyszerre: varos_szerinti_felosztas)
+'''
+def filter_df_varos(df, varos_nev, lat_col='lat', lon_col='lon', cache_path=None):
+
+    reszek = varos_szerinti_felosztas(df, [varos_nev], lat_col=lat_col, lon_col=lon_col, cache_path=cache_path)
+    if varos_nev not in reszek:
+        raise ValueError(f"Nem lehet lekérni a település határát: {varos_nev}")
+
+    return reszek[varos_nev]
+
 
 
 
@@ -0,0 +1,127 @@
+import time
+import random
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point
+
+from gm_lekerdezes_kezelo import fix_lat_lon, fix_lat_lon_vektor, varos_szerinti_felosztas
+
+
+'''
+Sebesség mérések és egyezés ellenőrzések a modules függvényeihez (futtatás: python meresek.py)
+'''
+
+
+
+def _minta_nyers_df(n, seed=0):
+    '''
+    Szintetikus nyers google maps df (read_jsonl_to_df átnevezése után), elcsúszott kordináta sorokkal
+    '''
+
+    rnd = random.Random(seed)
+
+    sorok = []
+    for i in range(n):
+        lat, lon = round(rnd.uniform(45.8, 48.5), 7), round(rnd.uniform(16.2, 22.8), 7)
+        tipus = rnd.random()
+        if tipus < 0.6:
+            sor = [i, f"Fő utca {i % 90 + 1}", "Budapest", "1111 Hungary", None, lat, lon]
+        elif tipus < 0.75:
+            sor = [i, "Kft.", "Budapest", "Fő utca 1", "1111 Hungary", lat, lon]
+        elif tipus < 0.85:
+            sor = [i, "Kft.", "Bolt", "Budapest", "Fő utca 1", "1111 Hungary", "4.5", lat, lon]
+        elif tipus < 0.9:
+            sor = [i, "Kft.", "Budapest", str(lat), "1111 Hungary", "x", "y", str(lon)]
+        elif tipus < 0.95:
+            # lon a lat előtt, vagy csak az egyik van meg
+            sor = [i, "Kft.", "Budapest", lon, "1111 Hungary", 47.0, "rossz", lat]
+        else:
+            sor = [i, None, None, None, None, None, rnd.choice([None, lat, 12.5])]
+        sorok.append(sor)
+
+    df = pd.DataFrame(sorok)
+    return df.rename(columns={0: "geoid", 1: 'cim', 2: 'telepules', 5: 'lat', 6: 'lon'})
+
+
+def fix_lat_lon_benchmark(n=50_000):
+    '''
+    df.apply(fix_lat_lon, axis=1) vs. fix_lat_lon_vektor: egyezés és futásidő
+    '''
+
+    df = _minta_nyers_df(n)
+    oszlopok = ['geoid', 'cim', 'telepules', 'lat', 'lon']
+
+    t0 = time.perf_counter()
+    regi = df.apply(fix_lat_lon, axis=1)[oszlopok]
+    dt_regi = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    uj = fix_lat_lon_vektor(df)[oszlopok]
+    dt_uj = time.perf_counter() - t0
+
+    # egyezés ellenőrzés
+    pd.testing.assert_frame_equal(regi, uj)
+
+    print(f'fix_lat_lon apply: {dt_regi:.2f} s, vektor: {dt_uj:.3f} s, gyorsulás: {dt_regi / dt_uj:.0f}x ({n} sor)')
+
+    return dt_regi, dt_uj
+
+
+
+def _minta_hatarok(nx=60, ny=50, seed=0):
+    '''
+    Szintetikus település határok: rácsba rendezett, szabálytalan (sok csúcsú) poligonok Magyarország területén
+    '''
+
+    rnd = np.random.default_rng(seed)
+    dx, dy = (22.8 - 16.2) / nx, (48.5 - 45.8) / ny
+
+    nevek, geomok = [], []
+    for i in range(nx):
+        for j in range(ny):
+            cx, cy = 16.2 + (i + 0.5) * dx, 45.8 + (j + 0.5) * dy
+            r = rnd.uniform(0.3, 0.5) * min(dx, dy)
+            geomok.append(Point(cx, cy).buffer(r, quad_segs=32))
+            nevek.append(f"Telepules{i}_{j}")
+
+    return gpd.GeoDataFrame({"varos": nevek}, geometry=geomok, crs="EPSG:4326")
+
+
+def varos_felosztas_benchmark(n=1_000_000, regi_varosok=100):
+    '''
+    Településenkénti within (régi filter_df_varos mag, hálózat nélkül) vs. egyetlen sjoin minden településre.
+    A régit csak regi_varosok településre futtatom, és az időt a teljes számra vetítem.
+    '''
+
+    hatarok = _minta_hatarok()
+    rnd = np.random.default_rng(1)
+    df = pd.DataFrame({"geoid": np.arange(n), "lat": rnd.uniform(45.8, 48.5, n), "lon": rnd.uniform(16.2, 22.8, n)})
+    df.loc[df.sample(frac=0.01, random_state=0).index, "lat"] = np.nan
+
+    t0 = time.perf_counter()
+    reszek = varos_szerinti_felosztas(df, hatarok=hatarok)
+    dt_uj = time.perf_counter() - t0
+
+    minta = hatarok.sample(regi_varosok, random_state=0)
+    t0 = time.perf_counter()
+    for nev, geom in zip(minta["varos"], minta.geometry):
+        df2 = df.dropna(subset=['lat', 'lon']).copy()
+        gdf_points = gpd.GeoDataFrame(df2, geometry=gpd.points_from_xy(df2['lon'], df2['lat'], crs="EPSG:4326"),
+                                      crs="EPSG:4326")
+        regi = pd.DataFrame(gdf_points[gdf_points.within(geom)].drop(columns=['geometry']))
+        pd.testing.assert_frame_equal(regi, reszek[nev])
+    dt_regi = (time.perf_counter() - t0) * len(hatarok) / regi_varosok
+
+    print(f'{len(hatarok)} település, {n} pont: településenként ~{dt_regi:.1f} s (becsült), '
+          f'egy sjoin: {dt_uj:.2f} s, gyorsulás: ~{dt_regi / dt_uj:.0f}x')
+
+    return dt_regi, dt_uj
+
+
+
+
+if __name__ == '__main__':
+    fix_lat_lon_benchmark()
+    varos_felosztas_benchmark()
@@ -29,6 +29,20 @@ def norm_hazszam(s):
 
 
 
+def utca_kulcs(s, cache=None):
+    '''
+    Összekapcsoló utca kulcs: norm_utca + unidecode
+    cache (NormCache) megadásával csak a korábbi futásokban még nem látott utcaneveket számolja
+    '''
+    s = s.astype(str)
+    if cache is None:
+        return norm_utca(s).map(unidecode)
+    # a verziót a cache számolja a függvényekből (a norm_cache a jup/burkolas_v2 alatt van, itt nem importálom)
+    return cache.alkalmaz(s, lambda u: norm_utca(u).map(unidecode), 'utca_kulcs', (norm_utca, unidecode, utca_kulcs))
+
+
+
+
 def import_cimjegyzek(cimjegyzek_path='../adatok/fix/df_22_selected.parquet'):
 
     # választási adatok importálása
@@ -44,16 +58,16 @@ def import_cimjegyzek(cimjegyzek_path='../adatok/fix/df_22_selected.parquet'):
 '''
 Összakapcsolja gm lekérdezéseket a hivatalos címjegyzékkel, egy egyszerű normalizálással
 '''
-def osszekapcs(df_gm_feldolgozott, df_cimjegyzek=None):
+def osszekapcs(df_gm_feldolgozott, df_cimjegyzek=None, cache=None):
 
     if not df_cimjegyzek:
         df_cimjegyzek = import_cimjegyzek()
 
     # kulcsok létrehozása
-    df_gm_feldolgozott.loc[:, "utca_key"] = norm_utca(df_gm_feldolgozott["utca"]).map(unidecode)
+    df_gm_feldolgozott.loc[:, "utca_key"] = utca_kulcs(df_gm_feldolgozott["utca"], cache)
     df_gm_feldolgozott.loc[:, "hazszam_key"] = norm_hazszam(df_gm_feldolgozott["hazszam"])
 
-    df_cimjegyzek.loc[:, "utca_key"] = norm_utca(df_cimjegyzek["kozteruletnev"]).map(unidecode)
+    df_cimjegyzek.loc[:, "utca_key"] = utca_kulcs(df_cimjegyzek["kozteruletnev"], cache)
     df_cimjegyzek.loc[:, "hazszam_key"] = norm_hazszam(df_cimjegyzek["utcaim_clean"])
 
     # összekapcsolás